@@ -0,0 +1,12 @@
+-- Opt-in adaptive sampling
+-- The worker learns how often each camera's results change (from
+-- image_analysis_results history) and skips frames captured before the next
+-- sample is due. Sampling tightens near alert thresholds and never lets a
+-- camera go longer than SAMPLING_MAX_STALENESS_MINUTES without an analysis.
+-- Skipped tasks get skip_reason 'sampling: every N min'.
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS adaptive_sampling BOOLEAN DEFAULT false;
+
+-- History lookup per config
+CREATE INDEX IF NOT EXISTS idx_analysis_results_config_created ON image_analysis_results(config_id, created_at DESC);
@@ -0,0 +1,6 @@
+-- Record prompt-cache hits per analysis call
+-- cached_tokens is the part of input_tokens served from the provider's prompt
+-- cache (OpenAI prefix caching, Gemini context caching), billed at a discount.
+
+ALTER TABLE ai_analysis_logs
+ADD COLUMN IF NOT EXISTS cached_tokens INTEGER;
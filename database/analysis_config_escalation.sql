@@ -0,0 +1,10 @@
+-- Opt-in detail escalation for OpenAI configs
+-- Low-detail answers under the config threshold are re-run at detail high,
+-- cropped to escalation_roi when set. The ROI is given as fractions of the
+-- frame, e.g. {"x": 0.4, "y": 0.3, "width": 0.3, "height": 0.3}.
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS detail_escalation BOOLEAN DEFAULT false;
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS escalation_roi JSONB;
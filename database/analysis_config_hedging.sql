@@ -0,0 +1,12 @@
+-- Opt-in request hedging for latency-critical configs (e.g. gate detection)
+-- When the primary model has not answered within its observed p90 latency, a
+-- duplicate request goes to hedge_provider/hedge_model (or the same model).
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS hedge_requests BOOLEAN DEFAULT false;
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS hedge_provider TEXT;
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS hedge_model TEXT;
@@ -0,0 +1,7 @@
+-- Opt-in streaming with early stop
+-- Responses are parsed as they stream and generation is cut once the
+-- analysis type's decision fields (e.g. gate_visible, gate_open, confidence)
+-- have arrived, skipping the trailing reasoning text.
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS stream_early_stop BOOLEAN DEFAULT false;
@@ -0,0 +1,21 @@
+-- Burst grouping
+-- Spypoint cameras capture several frames per trigger within seconds. The
+-- worker analyzes one frame per burst and finishes the sibling tasks as
+-- 'skipped' (skip_reason 'burst') with a link to the result that covers them.
+-- Frames from the same trigger that show a different scene are flagged
+-- burst_standalone and analyzed on their own. burst_waits counts how often a
+-- frame was put back because another worker held its burst.
+
+ALTER TABLE analysis_tasks
+ADD COLUMN IF NOT EXISTS burst_result_id UUID REFERENCES image_analysis_results(id);
+
+ALTER TABLE analysis_tasks
+ADD COLUMN IF NOT EXISTS burst_standalone BOOLEAN DEFAULT false;
+
+ALTER TABLE analysis_tasks
+ADD COLUMN IF NOT EXISTS burst_waits INTEGER DEFAULT 0;
+
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_burst_result ON analysis_tasks(burst_result_id) WHERE burst_result_id IS NOT NULL;
+
+-- Burst lookup: a camera's frames within seconds of each other
+CREATE INDEX IF NOT EXISTS idx_spypoint_images_camera_captured ON spypoint_images(camera_name, captured_at);
@@ -0,0 +1,28 @@
+-- Atomic cost tracking for analysis_costs
+-- Workers aggregate usage in memory and flush it through this function.
+-- The upsert adds to the stored totals, so concurrent workers never lose increments.
+
+-- Per-call costs for small models are well below 0.0001 USD; match ai_analysis_logs precision
+ALTER TABLE analysis_costs
+ALTER COLUMN estimated_cost TYPE DECIMAL(12, 6);
+
+-- p_rows: JSON array of {date, model_provider, model_name, analysis_count, tokens_used, estimated_cost}
+-- Each (date, model_provider, model_name) must appear at most once per call
+CREATE OR REPLACE FUNCTION increment_analysis_costs(p_rows JSONB)
+RETURNS void AS $$
+BEGIN
+    INSERT INTO analysis_costs (date, model_provider, model_name, analysis_count, tokens_used, estimated_cost)
+    SELECT
+        (r->>'date')::DATE,
+        r->>'model_provider',
+        r->>'model_name',
+        COALESCE((r->>'analysis_count')::INTEGER, 0),
+        COALESCE((r->>'tokens_used')::INTEGER, 0),
+        COALESCE((r->>'estimated_cost')::DECIMAL, 0)
+    FROM jsonb_array_elements(p_rows) AS r
+    ON CONFLICT (date, model_provider, model_name) DO UPDATE SET
+        analysis_count = analysis_costs.analysis_count + EXCLUDED.analysis_count,
+        tokens_used = analysis_costs.tokens_used + EXCLUDED.tokens_used,
+        estimated_cost = analysis_costs.estimated_cost + EXCLUDED.estimated_cost;
+END;
+$$ LANGUAGE plpgsql;
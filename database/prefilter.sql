@@ -0,0 +1,23 @@
+-- Opt-in local pre-filter for quiet frames
+-- Before any paid model call the worker compares the frame with the last
+-- analyzed frame from the same camera (and, when PREFILTER_ONNX_MODEL is set,
+-- scores it with an on-box animal classifier). Frames that barely changed are
+-- handled per config:
+--   'off'       always analyze (default)
+--   'skip'      mark the task 'skipped' without calling a model
+--   'downgrade' analyze with prefilter_downgrade_provider/model only
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS prefilter_policy TEXT DEFAULT 'off';
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS prefilter_downgrade_provider TEXT;
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS prefilter_downgrade_model TEXT;
+
+-- Why a task finished as 'skipped' (e.g. 'prefilter: 0.4% changed')
+ALTER TABLE analysis_tasks
+ADD COLUMN IF NOT EXISTS skip_reason TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_skipped ON analysis_tasks(config_id, completed_at) WHERE status = 'skipped';
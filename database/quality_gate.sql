@@ -0,0 +1,17 @@
+-- Opt-in frame quality gate
+-- Frames are scored for brightness, sharpness (Laplacian variance), contrast
+-- and saturation before any model call. quality_rules maps each detected
+-- issue to an action, e.g. {"dark": "skip", "blurry": "defer", "ir": "route"}:
+--   skip    finish the task as 'skipped' without analysis
+--   defer   skip it and let the camera's next good frame answer for it
+--   route   analyze with quality_route_provider/quality_route_model instead
+-- Issues: dark, overexposed, blurry, low_contrast, ir. NULL disables the gate.
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS quality_rules JSONB;
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS quality_route_provider TEXT;
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS quality_route_model TEXT;
@@ -43,7 +43,7 @@ CREATE TABLE IF NOT EXISTS analysis_tasks (
     id UUID PRIMARY KEY DEFAULT gen_random_uuid(),
     image_id TEXT REFERENCES spypoint_images(image_id),
     config_id UUID REFERENCES analysis_configs(id),
-    status TEXT DEFAULT 'pending', -- 'pending', 'processing', 'completed', 'failed'
+    status TEXT DEFAULT 'pending', -- 'pending', 'processing', 'completed', 'failed', 'dead_letter', 'skipped'
     priority INTEGER DEFAULT 5, -- 1-10, higher = more urgent
     retry_count INTEGER DEFAULT 0,
     max_retries INTEGER DEFAULT 3,
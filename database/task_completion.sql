@@ -0,0 +1,99 @@
+-- Single-transaction task completion
+-- Each function applies all state changes for a finished task in one round trip.
+
+-- Save the analysis result, optionally raise an alert linked to it, and mark
+-- the task completed. Returns the new image_analysis_results id, or NULL
+-- without saving anything when p_worker_id no longer holds the task (e.g. its
+-- lease expired and the task was reclaimed).
+-- p_result: image_analysis_results row as JSON (keys outside the columns below are ignored)
+-- p_alert:  analysis_alerts row as JSON, or NULL when no alert was triggered
+-- Columns are listed explicitly so the rest (created_at, ...) keep their defaults.
+DROP FUNCTION IF EXISTS complete_analysis_task(UUID, JSONB, JSONB);
+
+CREATE OR REPLACE FUNCTION complete_analysis_task(
+    p_task_id UUID,
+    p_worker_id TEXT,
+    p_result JSONB,
+    p_alert JSONB DEFAULT NULL
+)
+RETURNS UUID AS $$
+DECLARE
+    v_result_id UUID := gen_random_uuid();
+BEGIN
+    UPDATE analysis_tasks
+    SET status = 'completed',
+        completed_at = NOW(),
+        error_message = NULL,
+        worker_id = NULL,
+        lease_expires_at = NULL
+    WHERE id = p_task_id AND status = 'processing' AND worker_id = p_worker_id;
+
+    IF NOT FOUND THEN
+        RETURN NULL;
+    END IF;
+
+    INSERT INTO image_analysis_results (
+        id, image_id, config_id, model_provider, model_name, analysis_type, result,
+        confidence, alert_triggered, processing_time_ms, tokens_used, full_results
+    )
+    SELECT v_result_id, r.image_id, r.config_id, r.model_provider, r.model_name, r.analysis_type, r.result,
+        r.confidence, COALESCE(r.alert_triggered, false), r.processing_time_ms, r.tokens_used, r.full_results
+    FROM jsonb_populate_record(NULL::image_analysis_results, p_result) r;
+
+    IF p_alert IS NOT NULL THEN
+        INSERT INTO analysis_alerts (
+            analysis_result_id, alert_type, severity, title, message, camera_name, image_url, alert_data
+        )
+        SELECT v_result_id, a.alert_type, a.severity, a.title, a.message, a.camera_name, a.image_url, a.alert_data
+        FROM jsonb_populate_record(NULL::analysis_alerts, p_alert) a;
+    END IF;
+
+    RETURN v_result_id;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Failure classification for retries (see src/providers/errors.py)
+ALTER TABLE analysis_tasks
+ADD COLUMN IF NOT EXISTS last_error_type TEXT;
+
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_dead_letter ON analysis_tasks(status) WHERE status = 'dead_letter';
+
+-- Record a task failure and increment its retry count atomically.
+-- When p_retry_delay_seconds is given and retries remain, the task goes back to
+-- 'pending' with scheduled_at pushed out by the delay. Otherwise (permanent
+-- failure or max_retries exhausted) it moves to 'dead_letter'. Only a task
+-- still 'processing' is touched, so a completed task is never reopened.
+-- Returns the task's new status, or NULL when nothing was updated.
+DROP FUNCTION IF EXISTS fail_analysis_task(UUID, TEXT);
+
+CREATE OR REPLACE FUNCTION fail_analysis_task(
+    p_task_id UUID,
+    p_error_message TEXT,
+    p_error_type TEXT DEFAULT NULL,
+    p_retry_delay_seconds FLOAT DEFAULT NULL
+)
+RETURNS TEXT AS $$
+DECLARE
+    v_status TEXT;
+BEGIN
+    -- Expressions in SET see the row's values before this update
+    UPDATE analysis_tasks
+    SET retry_count = retry_count + 1,
+        error_message = p_error_message,
+        last_error_type = p_error_type,
+        status = CASE
+            WHEN p_retry_delay_seconds IS NOT NULL AND retry_count + 1 <= max_retries THEN 'pending'
+            ELSE 'dead_letter'
+        END,
+        scheduled_at = CASE
+            WHEN p_retry_delay_seconds IS NOT NULL AND retry_count + 1 <= max_retries
+                THEN NOW() + make_interval(secs => p_retry_delay_seconds)
+            ELSE scheduled_at
+        END,
+        started_at = NULL
+    WHERE id = p_task_id AND status = 'processing'
+    RETURNING status INTO v_status;
+
+    RETURN v_status;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,86 @@
+-- Task leases for analysis workers
+-- A worker claims a task with a time-limited lease and keeps renewing it while
+-- it runs. If the worker dies (e.g. a redeploy), the lease expires and the
+-- reaper hands the task back to the queue instead of leaving it 'processing' forever.
+
+ALTER TABLE analysis_tasks
+ADD COLUMN IF NOT EXISTS worker_id TEXT;
+
+ALTER TABLE analysis_tasks
+ADD COLUMN IF NOT EXISTS lease_expires_at TIMESTAMPTZ;
+
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_lease ON analysis_tasks(lease_expires_at) WHERE status = 'processing';
+CREATE INDEX IF NOT EXISTS idx_analysis_tasks_worker ON analysis_tasks(worker_id) WHERE status = 'processing';
+
+-- Claim a pending task for a worker. Returns false if another worker got it first.
+CREATE OR REPLACE FUNCTION claim_analysis_task(
+    p_task_id UUID,
+    p_worker_id TEXT,
+    p_lease_seconds FLOAT
+)
+RETURNS BOOLEAN AS $$
+BEGIN
+    UPDATE analysis_tasks
+    SET status = 'processing',
+        started_at = NOW(),
+        worker_id = p_worker_id,
+        lease_expires_at = NOW() + make_interval(secs => p_lease_seconds)
+    WHERE id = p_task_id
+    AND status = 'pending';
+
+    RETURN FOUND;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Heartbeat: extend the leases of every task a worker is still processing.
+-- Returns the number of leases renewed.
+CREATE OR REPLACE FUNCTION renew_task_leases(
+    p_worker_id TEXT,
+    p_lease_seconds FLOAT
+)
+RETURNS INTEGER AS $$
+DECLARE
+    v_renewed INTEGER;
+BEGIN
+    UPDATE analysis_tasks
+    SET lease_expires_at = NOW() + make_interval(secs => p_lease_seconds)
+    WHERE worker_id = p_worker_id
+    AND status = 'processing';
+
+    GET DIAGNOSTICS v_renewed = ROW_COUNT;
+    RETURN v_renewed;
+END;
+$$ LANGUAGE plpgsql;
+
+-- Return tasks with expired leases to the queue, bounded by max_retries.
+-- Tasks left 'processing' without a lease (claimed before leases existed) are
+-- reclaimed once they have been running for p_orphan_after_seconds.
+CREATE OR REPLACE FUNCTION reap_expired_task_leases(
+    p_orphan_after_seconds FLOAT DEFAULT 3600
+)
+RETURNS TABLE(requeued INTEGER, dead_lettered INTEGER) AS $$
+BEGIN
+    RETURN QUERY
+    WITH reaped AS (
+        UPDATE analysis_tasks
+        SET retry_count = retry_count + 1,
+            status = CASE WHEN retry_count + 1 <= max_retries THEN 'pending' ELSE 'dead_letter' END,
+            error_message = 'Lease expired (worker ' || COALESCE(worker_id, 'unknown') || ')',
+            last_error_type = 'lease_expired',
+            scheduled_at = NOW(),
+            started_at = NULL,
+            worker_id = NULL,
+            lease_expires_at = NULL
+        WHERE status = 'processing'
+        AND (
+            lease_expires_at < NOW()
+            OR (lease_expires_at IS NULL AND started_at < NOW() - make_interval(secs => p_orphan_after_seconds))
+        )
+        RETURNING status
+    )
+    SELECT
+        COUNT(*) FILTER (WHERE status = 'pending')::INTEGER,
+        COUNT(*) FILTER (WHERE status = 'dead_letter')::INTEGER
+    FROM reaped;
+END;
+$$ LANGUAGE plpgsql;
@@ -0,0 +1,11 @@
+-- Opt-in level forecasting for water_level and feed_bin configs
+-- percentage_estimate readings since the last refill are fitted to a
+-- depletion rate. When empty is predicted within FORECAST_ALERT_HOURS a
+-- 'trend' alert is raised (once per refill cycle), and analysis of the
+-- trough is sampled more densely as the predicted empty time approaches
+-- (configs with adaptive_sampling only; others analyze every frame).
+
+ALTER TABLE analysis_configs
+ADD COLUMN IF NOT EXISTS trend_forecast BOOLEAN DEFAULT false;
+
+CREATE INDEX IF NOT EXISTS idx_analysis_alerts_trend ON analysis_alerts(camera_name, created_at DESC) WHERE alert_type = 'trend';
@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""Microbenchmark: legacy quality-stepping resize vs the draft-decode resizer.
+
+Usage:
+    python scripts/benchmark_image_resize.py photo1.jpg photo2.jpg ...
+    python scripts/benchmark_image_resize.py --from-storage 10
+
+Pass real 5-12MP trail-cam frames, or pull recent ones from Supabase storage.
+"""
+import os
+import sys
+import argparse
+import asyncio
+import io
+import statistics
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from dotenv import load_dotenv
+from PIL import Image
+from src.providers.image_resize import ImageResizer, ImageProfile, DEFAULT_PROFILE
+
+
+load_dotenv()
+
+
+def legacy_resize(image_bytes: bytes, max_size_kb: int = 25) -> bytes:
+    """The original BaseProvider.resize_image_if_needed loop"""
+    current_size_kb = len(image_bytes) / 1024
+    if current_size_kb <= max_size_kb:
+        return image_bytes
+
+    img = Image.open(io.BytesIO(image_bytes))
+
+    quality = 85
+    while current_size_kb > max_size_kb and quality > 20:
+        buffer = io.BytesIO()
+        img.save(buffer, format='JPEG', quality=quality, optimize=True)
+        image_bytes = buffer.getvalue()
+        current_size_kb = len(image_bytes) / 1024
+        quality -= 5
+
+    return image_bytes
+
+
+async def load_from_storage(limit: int):
+    from src.db.supabase_client import SupabaseClient
+    supabase = SupabaseClient()
+    response = supabase.client.table('spypoint_images').select('storage_path').order(
+        'downloaded_at', desc=True
+    ).limit(limit).execute()
+    frames = []
+    for row in response.data:
+        image_bytes = await supabase.download_image(row['storage_path'])
+        if image_bytes:
+            frames.append(image_bytes)
+    return frames
+
+
+def time_call(fn, repeat: int):
+    timings = []
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = fn()
+        timings.append((time.perf_counter() - start) * 1000)
+    return statistics.median(timings), result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('images', nargs='*', help='JPEG files to benchmark')
+    parser.add_argument('--from-storage', type=int, default=0, help='Download N recent frames from Supabase')
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--max-side', type=int, default=DEFAULT_PROFILE.max_side)
+    parser.add_argument('--max-kb', type=int, default=25)
+    args = parser.parse_args()
+
+    frames = []
+    for path in args.images:
+        with open(path, 'rb') as f:
+            frames.append(f.read())
+    if args.from_storage:
+        frames.extend(asyncio.run(load_from_storage(args.from_storage)))
+    if not frames:
+        parser.error('no images given')
+
+    profile = ImageProfile(name='benchmark', max_side=args.max_side, max_bytes=args.max_kb * 1024)
+
+    print(f"{'source':>12} {'legacy ms':>10} {'legacy KB':>10} {'new ms':>8} {'new KB':>7} {'new px':>11} {'speedup':>8}")
+    legacy_total = new_total = 0.0
+    for image_bytes in frames:
+        with Image.open(io.BytesIO(image_bytes)) as img:
+            source = f"{img.width * img.height / 1e6:.1f}MP"
+
+        legacy_ms, legacy_out = time_call(lambda: legacy_resize(image_bytes, args.max_kb), args.repeat)
+        # Fresh resizer per run so the cache doesn't hide the real cost
+        new_ms, new_out = time_call(lambda: ImageResizer(cache_size=1).resize(image_bytes, profile), args.repeat)
+        with Image.open(io.BytesIO(new_out)) as img:
+            new_px = f"{img.width}x{img.height}"
+
+        legacy_total += legacy_ms
+        new_total += new_ms
+        print(
+            f"{source:>12} {legacy_ms:>10.1f} {len(legacy_out) / 1024:>10.1f} "
+            f"{new_ms:>8.1f} {len(new_out) / 1024:>7.1f} {new_px:>11} {legacy_ms / new_ms:>7.1f}x"
+        )
+
+    cached = ImageResizer()
+    cached.resize(frames[0], profile)
+    cached_ms, _ = time_call(lambda: cached.resize(frames[0], profile), args.repeat)
+
+    print(f"\nTotal: legacy {legacy_total:.0f} ms, new {new_total:.0f} ms ({legacy_total / new_total:.1f}x)")
+    print(f"Cached lookup: {cached_ms:.2f} ms")
+
+
+if __name__ == '__main__':
+    main()
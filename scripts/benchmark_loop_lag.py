@@ -0,0 +1,72 @@
+#!/usr/bin/env python3
+"""Event-loop lag while preparing images inline vs in the CPU pool.
+
+Usage:
+    python scripts/benchmark_loop_lag.py frame.jpg [--concurrency 8] [--rounds 4]
+
+Runs the same resize + base64 workload twice with a LoopLagProbe running:
+once directly on the event loop (the old behaviour) and once through cpu_pool.
+"""
+import os
+import sys
+import argparse
+import asyncio
+import base64
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from src.providers.cpu_pool import CpuPool, LoopLagProbe
+from src.providers.image_resize import ImageResizer
+from src.providers.image_profiles import plan_image, DETAIL_HIGH
+from PIL import Image
+import io
+
+
+def prepare(resizer: ImageResizer, image_bytes: bytes, profile) -> str:
+    return base64.b64encode(resizer.resize(image_bytes, profile)).decode('utf-8')
+
+
+async def run(image_bytes: bytes, profile, concurrency: int, rounds: int, pool: CpuPool = None):
+    probe = LoopLagProbe(interval=0.01, warn_ms=float('inf'))
+    probe.start()
+    for _ in range(rounds):
+        # Fresh cache each round so every call does the full decode/encode
+        resizer = ImageResizer(cache_size=1)
+        if pool:
+            await asyncio.gather(*[
+                pool.run_in_thread(prepare, resizer, image_bytes, profile) for _ in range(concurrency)
+            ])
+        else:
+            async def inline():
+                await asyncio.sleep(0)
+                return prepare(resizer, image_bytes, profile)
+            await asyncio.gather(*[inline() for _ in range(concurrency)])
+    await asyncio.sleep(0.05)
+    await probe.stop()
+    return probe.stats()
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('image')
+    parser.add_argument('--concurrency', type=int, default=8)
+    parser.add_argument('--rounds', type=int, default=4)
+    args = parser.parse_args()
+
+    with open(args.image, 'rb') as f:
+        image_bytes = f.read()
+    with Image.open(io.BytesIO(image_bytes)) as img:
+        width, height = img.size
+    profile = plan_image('openai', 'gpt-4o', width, height, DETAIL_HIGH).profile
+
+    pool = CpuPool()
+    before = asyncio.run(run(image_bytes, profile, args.concurrency, args.rounds))
+    after = asyncio.run(run(image_bytes, profile, args.concurrency, args.rounds, pool))
+    pool.shutdown()
+
+    print(f"{'':>10} {'mean ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for label, stats in (('inline', before), ('cpu_pool', after)):
+        print(f"{label:>10} {stats['mean_ms']:>9} {stats['p99_ms']:>9} {stats['max_ms']:>9}")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""Stub OpenAI-compatible vision server for exercising the local provider.
+
+Usage:
+    python scripts/local_llm_stub.py [--port 8080] [--delay 0.5]
+    python scripts/local_llm_stub.py --check
+
+Serves /v1/models and /v1/chat/completions (plain and streamed) with a
+canned answer for the analysis type, shaped by the request's json_schema
+when one is sent. Point the worker at it with LOCAL_LLM_BASE_URL=
+http://localhost:8080/v1 and LOCAL_API_KEY=stub, and use provider "local".
+--check starts the stub and runs LocalProvider against it, plain and streamed.
+"""
+import os
+import sys
+import argparse
+import asyncio
+import io
+import json
+import time
+sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from aiohttp import web
+from PIL import Image
+
+
+ANSWERS = {
+    'gate_detection': {"gate_visible": True, "gate_open": False, "confidence": 0.91,
+                       "reasoning": "Gate closed against the post.", "visual_evidence": "Latch engaged"},
+    'door_detection': {"door_visible": True, "door_open": False, "opening_percentage": 0, "door_type": "barn door",
+                       "confidence": 0.88, "reasoning": "Door flush with frame.", "visual_evidence": "No gap"},
+    'water_level': {"water_visible": True, "water_level": "ADEQUATE", "percentage_estimate": 60, "confidence": 0.8,
+                    "reasoning": "Water below the rim.", "visual_evidence": "Fill line visible"},
+    'feed_bin_status': {"feeder_visible": True, "feed_level": "LOW", "percentage_estimate": 20, "confidence": 0.77,
+                        "reasoning": "Feed only at the bottom.", "visual_evidence": "Empty upper bin", "concerns": None},
+    'animal_detection': {"animals_detected": True, "animals": [{"species": "cow", "count": 2, "type": "livestock",
+                                                                "confidence": 0.9, "location": "center",
+                                                                "behavior": "grazing"}],
+                         "confidence": 0.9, "reasoning": "Two cattle grazing.", "visual_evidence": "Body shape"},
+}
+KEYWORDS = (('gate', 'gate_detection'), ('door', 'door_detection'), ('water', 'water_level'),
+            ('feed', 'feed_bin_status'), ('animal', 'animal_detection'))
+
+
+def pick_answer(body: dict) -> dict:
+    """Canned answer for the request, in compact keys when a json_schema was sent"""
+    from src.providers.output_schemas import COMPACT_KEYS, ANIMAL_KEYS
+
+    response_format = body.get('response_format') or {}
+    if response_format.get('type') == 'json_schema':
+        analysis_type = response_format['json_schema']['name']
+        answer = ANSWERS.get(analysis_type, ANSWERS['gate_detection'])
+        compact = {}
+        for key, value in answer.items():
+            if key == 'animals':
+                value = [{ANIMAL_KEYS[k]: v for k, v in item.items()} for item in value]
+            compact[COMPACT_KEYS.get(key, key)] = value
+        return compact
+
+    text = json.dumps(body.get('messages', [])).lower()
+    for keyword, analysis_type in KEYWORDS:
+        if keyword in text:
+            return ANSWERS[analysis_type]
+    return {"confidence": 0.5, "reasoning": "Nothing notable."}
+
+
+def usage_for(body: dict, content: str) -> dict:
+    prompt_tokens = len(json.dumps(body.get('messages', []))) // 4
+    completion_tokens = max(1, len(content) // 4)
+    return {"prompt_tokens": prompt_tokens, "completion_tokens": completion_tokens,
+            "total_tokens": prompt_tokens + completion_tokens}
+
+
+async def models(request: web.Request) -> web.Response:
+    model = os.getenv('LOCAL_LLM_MODEL', 'local-vision')
+    return web.json_response({"object": "list", "data": [{"id": model, "object": "model", "owned_by": "stub"}]})
+
+
+async def chat_completions(request: web.Request) -> web.StreamResponse:
+    body = await request.json()
+    await asyncio.sleep(request.app['delay'])
+    content = json.dumps(pick_answer(body))
+    created = int(time.time())
+    base = {"id": f"chatcmpl-stub-{created}", "created": created, "model": body.get('model')}
+
+    if not body.get('stream'):
+        return web.json_response({
+            **base,
+            "object": "chat.completion",
+            "choices": [{"index": 0, "finish_reason": "stop",
+                         "message": {"role": "assistant", "content": content}}],
+            "usage": usage_for(body, content)
+        })
+
+    response = web.StreamResponse(headers={'Content-Type': 'text/event-stream'})
+    await response.prepare(request)
+    try:
+        for start in range(0, len(content), 8):
+            chunk = {**base, "object": "chat.completion.chunk",
+                     "choices": [{"index": 0, "delta": {"content": content[start:start + 8]}, "finish_reason": None}]}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+            await asyncio.sleep(0.01)
+        if (body.get('stream_options') or {}).get('include_usage'):
+            chunk = {**base, "object": "chat.completion.chunk", "choices": [], "usage": usage_for(body, content)}
+            await response.write(f"data: {json.dumps(chunk)}\n\n".encode())
+        await response.write(b"data: [DONE]\n\n")
+    except ConnectionResetError:
+        # The client stopped reading once it had the decision fields
+        pass
+    return response
+
+
+def make_app(delay: float) -> web.Application:
+    app = web.Application()
+    app['delay'] = delay
+    app.router.add_get('/v1/models', models)
+    app.router.add_post('/v1/chat/completions', chat_completions)
+    return app
+
+
+async def check(port: int) -> bool:
+    """Run LocalProvider against the stub, plain and streamed"""
+    os.environ['LOCAL_LLM_BASE_URL'] = f"http://127.0.0.1:{port}/v1"
+    from src.providers.provider_factory import ProviderFactory
+    from src.providers.base import ImageData
+    from src.providers.schemas import decision_keys
+
+    runner = web.AppRunner(make_app(delay=0.0))
+    await runner.setup()
+    await web.TCPSite(runner, '127.0.0.1', port).start()
+
+    buffer = io.BytesIO()
+    Image.new('RGB', (640, 480), (90, 120, 60)).save(buffer, 'JPEG')
+    image_data = ImageData(buffer.getvalue(), 'stub-001', 'Stub Camera', '2024-01-01T12:00:00Z')
+    provider = ProviderFactory.create_provider('local', 'stub')
+
+    ok = True
+    try:
+        for analysis_type in ('gate_detection', 'animal_detection'):
+            for stop_keys in (None, decision_keys(analysis_type)):
+                result = await provider.analyze_image(
+                    image_data, f"Check the {analysis_type}", provider.get_supported_models()[0],
+                    stop_keys=stop_keys, analysis_type=analysis_type
+                )
+                passed = result.error is None and result.error_type is None
+                ok = ok and passed
+                mode = 'streamed' if stop_keys else 'plain'
+                print(f"{analysis_type:>17} {mode:>8} {'ok' if passed else 'FAILED':>6} "
+                      f"{result.processing_time_ms:>5} ms  {result.parsed_data}")
+    finally:
+        await runner.cleanup()
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--delay', type=float, default=0.5, help="Seconds to wait before answering, like a slow CPU box")
+    parser.add_argument('--check', action='store_true')
+    args = parser.parse_args()
+
+    if args.check:
+        sys.exit(0 if asyncio.run(check(args.port)) else 1)
+    web.run_app(make_app(args.delay), port=args.port)
+
+
+if __name__ == '__main__':
+    main()
@@ -21,6 +21,8 @@ from src.db.supabase_client import SupabaseClient
 from src.services.analysis_service import AnalysisService
 from src.task_processor import TaskProcessor
 from src.providers.base import ImageData
+from src.providers.cpu_pool import cpu_pool, loop_lag
+from src.providers.output_schemas import output_stats
 from dotenv import load_dotenv
 from src.api.image_analysis_history import router as history_router
 
@@ -101,6 +103,20 @@ class AnalysisConfig(BaseModel):
     secondary_model: Optional[str] = None
     tiebreaker_provider: Optional[str] = None
     tiebreaker_model: Optional[str] = None
+    hedge_requests: bool = False
+    hedge_provider: Optional[str] = None
+    hedge_model: Optional[str] = None
+    detail_escalation: bool = False
+    escalation_roi: Optional[Dict[str, float]] = None
+    stream_early_stop: bool = False
+    prefilter_policy: str = 'off'  # 'off', 'skip' or 'downgrade'
+    prefilter_downgrade_provider: Optional[str] = None
+    prefilter_downgrade_model: Optional[str] = None
+    quality_rules: Optional[Dict[str, str]] = None  # issue -> 'skip', 'defer', 'route' or 'proceed'
+    quality_route_provider: Optional[str] = None
+    quality_route_model: Optional[str] = None
+    adaptive_sampling: bool = False
+    trend_forecast: bool = False
 
 
 class AnalysisRequest(BaseModel):
@@ -574,6 +590,104 @@ async def get_pending_tasks():
         raise HTTPException(status_code=500, detail=str(e))
 
 
+@app.get("/api/tasks/retries")
+async def get_task_retries(limit: int = 50):
+    """Show tasks waiting on a retry backoff and tasks in the dead-letter state"""
+    try:
+        return await supabase.get_retry_summary(dead_letter_limit=limit)
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/tasks/reap-leases")
+async def reap_task_leases():
+    """Return tasks stuck in 'processing' with expired worker leases to the queue"""
+    try:
+        counts = await task_processor.reap_expired_leases()
+        return {"message": "Expired leases reaped", **counts}
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.post("/api/tasks/{task_id}/requeue")
+async def requeue_task(task_id: str):
+    """Move a dead-lettered task back to the pending queue"""
+    try:
+        if not await supabase.requeue_task(task_id):
+            raise HTTPException(status_code=404, detail="Dead-letter task not found")
+        return {"message": "Task requeued", "task_id": task_id}
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+@app.get("/api/providers/limits")
+async def get_provider_limits():
+    """Current adaptive concurrency and rate budgets per provider model"""
+    return {"limits": analysis_service.limiters.stats()}
+
+
+@app.get("/api/providers/health")
+async def get_provider_health():
+    """Circuit breaker state, failover counts and hedging statistics"""
+    return {
+        **analysis_service.breakers.stats(),
+        'hedging': analysis_service.hedging.stats()
+    }
+
+
+@app.get("/api/providers/structured-outputs")
+async def get_structured_output_stats():
+    """Parse failure rate and output tokens per provider model and output mode"""
+    return output_stats.stats()
+
+
+@app.get("/api/system/performance")
+async def get_system_performance():
+    """Event loop lag and CPU pool usage for this process"""
+    return {
+        'loop_lag': loop_lag.stats(),
+        'cpu_pool': cpu_pool.stats()
+    }
+
+
+@app.get("/api/analysis/escalations")
+async def get_detail_escalations():
+    """High-detail escalation frequency and cost delta per camera"""
+    return analysis_service.escalation.stats()
+
+
+@app.get("/api/analysis/prefilter")
+async def get_prefilter_stats():
+    """Pre-filter skip and downgrade rates and possible misses per camera"""
+    return analysis_service.prefilter.stats()
+
+
+@app.get("/api/analysis/quality")
+async def get_quality_gate_stats():
+    """Frame quality issues and skipped, deferred and routed frames per camera"""
+    return analysis_service.quality_gate.stats()
+
+
+@app.get("/api/analysis/bursts")
+async def get_burst_stats():
+    """Burst modes per analysis type and how many frames each analysis covered"""
+    return analysis_service.bursts.stats()
+
+
+@app.get("/api/analysis/sampling")
+async def get_sampling_stats():
+    """Learned change rates and sampling intervals per camera and config"""
+    return analysis_service.sampler.stats()
+
+
+@app.get("/api/analysis/forecasts")
+async def get_level_forecasts():
+    """Depletion rate and predicted time to empty per water trough and feed bin"""
+    return analysis_service.forecaster.stats()
+
+
 @app.get("/api/alerts")
 async def get_alerts(unacknowledged_only: bool = True):
     try:
@@ -714,6 +828,21 @@ async def test_analysis(request: dict):
                     'provider': 'gemini',
                     'model': 'gemini-2.5-pro',
                     'api_key': os.getenv('GEMINI_API_KEY')
+                },
+                'anthropic-claude-3-5-haiku': {
+                    'provider': 'anthropic',
+                    'model': 'claude-3-5-haiku-20241022',
+                    'api_key': os.getenv('ANTHROPIC_API_KEY')
+                },
+                'anthropic-claude-3-5-sonnet': {
+                    'provider': 'anthropic',
+                    'model': 'claude-3-5-sonnet-20241022',
+                    'api_key': os.getenv('ANTHROPIC_API_KEY')
+                },
+                'local': {
+                    'provider': 'local',
+                    'model': os.getenv('LOCAL_LLM_MODEL', 'local-vision'),
+                    'api_key': os.getenv('LOCAL_API_KEY')
                 }
             }
             
@@ -826,6 +955,21 @@ async def test_analysis(request: dict):
                 'provider': 'gemini',
                 'model': 'gemini-2.5-pro',
                 'api_key': os.getenv('GEMINI_API_KEY')
+            },
+            'anthropic-claude-3-5-haiku': {
+                'provider': 'anthropic',
+                'model': 'claude-3-5-haiku-20241022',
+                'api_key': os.getenv('ANTHROPIC_API_KEY')
+            },
+            'anthropic-claude-3-5-sonnet': {
+                'provider': 'anthropic',
+                'model': 'claude-3-5-sonnet-20241022',
+                'api_key': os.getenv('ANTHROPIC_API_KEY')
+            },
+            'local': {
+                'provider': 'local',
+                'model': os.getenv('LOCAL_LLM_MODEL', 'local-vision'),
+                'api_key': os.getenv('LOCAL_API_KEY')
             }
         }
         
@@ -1288,7 +1432,11 @@ def calculate_token_cost(model_name: str, input_tokens: int, output_tokens: int)
         'gpt-4-vision-preview': { 'input': 10.00, 'output': 30.00 },
         'gemini-1.5-flash': { 'input': 0.10, 'output': 0.40 },
         'gemini-2.0-flash-exp': { 'input': 0.00, 'output': 0.00 },
-        'gemini-2.5-pro': { 'input': 1.25, 'output': 10.00 }
+        'gemini-2.5-pro': { 'input': 1.25, 'output': 10.00 },
+        'claude-3-5-haiku-20241022': { 'input': 0.80, 'output': 4.00 },
+        'claude-3-5-sonnet-20241022': { 'input': 3.00, 'output': 15.00 },
+        'claude-3-haiku-20240307': { 'input': 0.25, 'output': 1.25 },
+        'claude-3-opus-20240229': { 'input': 15.00, 'output': 75.00 }
     }
     
     model_cost = costs.get(model_name, { 'input': 0, 'output': 0 })
@@ -1523,7 +1671,8 @@ async def upload_and_analyze(
         api_keys = {
             'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY'),
             'ANTHROPIC_API_KEY': os.getenv('ANTHROPIC_API_KEY'),
-            'GEMINI_API_KEY': os.getenv('GEMINI_API_KEY')
+            'GEMINI_API_KEY': os.getenv('GEMINI_API_KEY'),
+            'LOCAL_API_KEY': os.getenv('LOCAL_API_KEY')
         }
         
         results = await analysis_service.analyze_with_dual_models(
@@ -1585,9 +1734,19 @@ async def broadcast_updates():
 # Start background tasks on startup
 @app.on_event("startup")
 async def startup_event():
+    await supabase.start_background_writers()
+    loop_lag.start()
     asyncio.create_task(broadcast_updates())
 
 
+@app.on_event("shutdown")
+async def shutdown_event():
+    # Flush buffered AI analysis logs and cost counters before the process exits
+    await supabase.stop_background_writers()
+    await loop_lag.stop()
+    cpu_pool.shutdown()
+
+
 if __name__ == "__main__":
     import uvicorn
     port = int(os.getenv("PORT", 8080))
@@ -0,0 +1,105 @@
+import asyncio
+import logging
+import os
+from datetime import datetime
+from typing import Dict, Any, Optional, Tuple
+
+
+logger = logging.getLogger(__name__)
+
+
+class CostTracker:
+    """Aggregates analysis_costs counters in memory and flushes them atomically.
+
+    Counters are keyed by (date, provider, model) and written through the
+    ``increment_analysis_costs`` RPC, which adds to the stored totals inside
+    a single upsert. Concurrent workers therefore never lose increments, and
+    each worker writes once per flush interval instead of twice per analysis.
+    """
+
+    def __init__(self, supabase_client, flush_interval: Optional[float] = None):
+        self.supabase = supabase_client
+        self.flush_interval = flush_interval or float(os.getenv('COST_FLUSH_INTERVAL_SECONDS', '30'))
+
+        self._pending: Dict[Tuple[str, str, str], Dict[str, Any]] = {}
+        self._task: Optional[asyncio.Task] = None
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    def record(
+        self,
+        provider: str,
+        model: str,
+        tokens_used: int,
+        estimated_cost: float,
+        analysis_count: int = 1,
+        date: Optional[str] = None
+    ) -> None:
+        """Add usage to the in-memory counters (no I/O)"""
+        date = date or datetime.utcnow().date().isoformat()
+        key = (date, provider, model)
+        counters = self._pending.get(key)
+        if counters is None:
+            counters = self._pending[key] = {
+                'analysis_count': 0,
+                'tokens_used': 0,
+                'estimated_cost': 0.0
+            }
+        counters['analysis_count'] += analysis_count
+        counters['tokens_used'] += tokens_used or 0
+        counters['estimated_cost'] += estimated_cost or 0.0
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._task = asyncio.create_task(self._run())
+        logger.info(f"Cost tracker started (flush_interval={self.flush_interval}s)")
+
+    async def stop(self) -> None:
+        """Stop the flush loop and write whatever is still pending"""
+        if self._task:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+
+    async def flush(self) -> None:
+        if not self._pending:
+            return
+
+        # Swap the buffer out so recording continues while we write
+        pending, self._pending = self._pending, {}
+        rows = [
+            {
+                'date': date,
+                'model_provider': provider,
+                'model_name': model,
+                **counters
+            }
+            for (date, provider, model), counters in pending.items()
+        ]
+
+        try:
+            await asyncio.to_thread(self.supabase.increment_analysis_costs, rows)
+        except Exception as e:
+            logger.error(f"Error flushing cost tracking ({len(rows)} rows), will retry: {e}")
+            # Merge the unwritten counts back so the next flush includes them
+            for row in rows:
+                self.record(
+                    row['model_provider'],
+                    row['model_name'],
+                    row['tokens_used'],
+                    row['estimated_cost'],
+                    analysis_count=row['analysis_count'],
+                    date=row['date']
+                )
+
+    async def _run(self) -> None:
+        while True:
+            await asyncio.sleep(self.flush_interval)
+            await self.flush()
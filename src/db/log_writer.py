@@ -0,0 +1,116 @@
+import asyncio
+import logging
+import os
+from typing import Dict, Any, List, Optional, FrozenSet
+
+
+logger = logging.getLogger(__name__)
+
+
+class AnalysisLogWriter:
+    """Buffers ai_analysis_logs rows and writes them with multi-row inserts.
+
+    Rows are flushed when the buffer reaches ``batch_size`` or every
+    ``flush_interval`` seconds, whichever comes first. The queue is bounded, so
+    producers wait (backpressure) instead of growing memory when the database
+    falls behind. ``stop()`` drains everything still buffered.
+    """
+
+    def __init__(
+        self,
+        supabase_client,
+        batch_size: Optional[int] = None,
+        flush_interval: Optional[float] = None,
+        max_queue_size: Optional[int] = None
+    ):
+        self.supabase = supabase_client
+        self.batch_size = batch_size or int(os.getenv('LOG_BATCH_SIZE', '50'))
+        self.flush_interval = flush_interval or float(os.getenv('LOG_FLUSH_INTERVAL_SECONDS', '2'))
+        self.max_queue_size = max_queue_size or int(os.getenv('LOG_QUEUE_MAX', '1000'))
+
+        self._queue: Optional[asyncio.Queue] = None
+        self._task: Optional[asyncio.Task] = None
+
+        # Counters for monitoring
+        self.rows_written = 0
+        self.rows_dropped = 0
+        self.batches_written = 0
+
+    @property
+    def running(self) -> bool:
+        return self._task is not None and not self._task.done()
+
+    async def start(self) -> None:
+        if self.running:
+            return
+        self._queue = asyncio.Queue(maxsize=self.max_queue_size)
+        self._task = asyncio.create_task(self._run())
+        logger.info(
+            f"AI analysis log writer started (batch_size={self.batch_size}, "
+            f"flush_interval={self.flush_interval}s)"
+        )
+
+    async def write(self, row: Dict[str, Any]) -> None:
+        """Queue a row, waiting if the buffer is full"""
+        await self._queue.put(row)
+
+    async def stop(self) -> None:
+        """Flush buffered rows and stop the background task"""
+        if not self.running:
+            return
+        # Sentinel tells the loop to drain and exit
+        await self._queue.put(None)
+        await self._task
+        self._task = None
+        logger.info(
+            f"AI analysis log writer stopped ({self.rows_written} rows in "
+            f"{self.batches_written} batches, {self.rows_dropped} dropped)"
+        )
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        batch: List[Dict[str, Any]] = []
+        stopping = False
+
+        while not stopping:
+            deadline = loop.time() + self.flush_interval
+
+            # Collect rows until the batch is full or the interval elapses
+            while len(batch) < self.batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    row = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if row is None:
+                    stopping = True
+                    break
+                batch.append(row)
+
+            # Drain anything already queued without waiting
+            while stopping and not self._queue.empty():
+                row = self._queue.get_nowait()
+                if row is not None:
+                    batch.append(row)
+
+            if batch:
+                await self._flush(batch)
+                batch = []
+
+    async def _flush(self, rows: List[Dict[str, Any]]) -> None:
+        # PostgREST bulk inserts need a uniform column set, and rows omit None
+        # values so column defaults apply. Group by shape to keep both.
+        groups: Dict[FrozenSet[str], List[Dict[str, Any]]] = {}
+        for row in rows:
+            groups.setdefault(frozenset(row), []).append(row)
+
+        for group in groups.values():
+            try:
+                await asyncio.to_thread(self.supabase.insert_ai_analysis_logs, group)
+                self.rows_written += len(group)
+                self.batches_written += 1
+            except Exception as e:
+                self.rows_dropped += len(group)
+                logger.error(f"Error writing {len(group)} AI analysis log rows: {e}")
@@ -4,6 +4,10 @@ import logging
 from datetime import datetime, timedelta
 import aiohttp
 import asyncio
+import uuid
+
+from .log_writer import AnalysisLogWriter
+from .cost_tracker import CostTracker
 
 
 logger = logging.getLogger(__name__)
@@ -13,6 +17,24 @@ class SupabaseClient:
     def __init__(self, url: str, key: str):
         self.client: Client = create_client(url, key)
         self.storage_bucket = "spypoint-images"
+        self.log_writer: Optional[AnalysisLogWriter] = None
+        self.cost_tracker: Optional[CostTracker] = None
+    
+    async def start_background_writers(self) -> None:
+        """Route log inserts and cost updates through batching background writers"""
+        if not self.log_writer:
+            self.log_writer = AnalysisLogWriter(self)
+        if not self.cost_tracker:
+            self.cost_tracker = CostTracker(self)
+        await self.log_writer.start()
+        await self.cost_tracker.start()
+    
+    async def stop_background_writers(self) -> None:
+        """Flush buffered log rows and cost counters, then stop the writers"""
+        if self.log_writer:
+            await self.log_writer.stop()
+        if self.cost_tracker:
+            await self.cost_tracker.stop()
         
     async def get_analysis_task(self, task_id: str) -> Optional[Dict[str, Any]]:
         try:
@@ -49,6 +71,8 @@ class SupabaseClient:
             # Download image bytes
             async with aiohttp.ClientSession() as session:
                 async with session.get(signed_url['signedURL']) as response:
+                    # A missing object answers 404 with a JSON body, not image bytes
+                    response.raise_for_status()
                     return await response.read()
                     
         except Exception as e:
@@ -67,13 +91,14 @@ class SupabaseClient:
                 'updated_at': datetime.utcnow().isoformat()
             }
             
+            if status == 'failed':
+                # Retry count must be incremented atomically on the server
+                return await self.fail_task(task_id, error_message) is not None
+            
             if status == 'processing':
                 update_data['started_at'] = datetime.utcnow().isoformat()
             elif status == 'completed':
                 update_data['completed_at'] = datetime.utcnow().isoformat()
-            elif status == 'failed' and error_message:
-                update_data['error_message'] = error_message
-                update_data['retry_count'] = self.client.table('analysis_tasks').select('retry_count').eq('id', task_id).single().execute().data['retry_count'] + 1
             
             self.client.table('analysis_tasks').update(update_data).eq('id', task_id).execute()
             return True
@@ -82,6 +107,245 @@ class SupabaseClient:
             logger.error(f"Error updating task status {task_id}: {e}")
             return False
     
+    async def claim_task(self, task_id: str, worker_id: str, lease_seconds: float) -> bool:
+        """Move a pending task to processing under a lease held by this worker"""
+        try:
+            response = self.client.rpc('claim_analysis_task', {
+                'p_task_id': task_id,
+                'p_worker_id': worker_id,
+                'p_lease_seconds': lease_seconds
+            }).execute()
+            return bool(response.data)
+        except Exception as e:
+            logger.error(f"Error claiming task {task_id}: {e}")
+            return False
+    
+    async def renew_task_leases(self, worker_id: str, lease_seconds: float) -> int:
+        """Extend the leases on every task this worker is processing"""
+        try:
+            response = self.client.rpc('renew_task_leases', {
+                'p_worker_id': worker_id,
+                'p_lease_seconds': lease_seconds
+            }).execute()
+            return response.data or 0
+        except Exception as e:
+            logger.error(f"Error renewing task leases for {worker_id}: {e}")
+            return 0
+    
+    async def reap_expired_leases(self) -> Dict[str, int]:
+        """Return tasks whose worker lease expired to the queue (or dead letter)"""
+        try:
+            response = self.client.rpc('reap_expired_task_leases', {}).execute()
+            row = response.data[0] if response.data else {}
+            return {
+                'requeued': row.get('requeued') or 0,
+                'dead_lettered': row.get('dead_lettered') or 0
+            }
+        except Exception as e:
+            logger.error(f"Error reaping expired task leases: {e}")
+            return {'requeued': 0, 'dead_lettered': 0}
+    
+    async def complete_task(
+        self,
+        task_id: str,
+        worker_id: str,
+        result_data: Dict[str, Any],
+        alert_data: Optional[Dict[str, Any]] = None
+    ) -> Optional[str]:
+        """Save the result, create the alert and mark the task completed in one transaction.
+        
+        Returns None without saving when worker_id no longer holds the task.
+        """
+        try:
+            response = self.client.rpc('complete_analysis_task', {
+                'p_task_id': task_id,
+                'p_worker_id': worker_id,
+                'p_result': result_data,
+                'p_alert': alert_data
+            }).execute()
+            return response.data
+        except Exception as e:
+            logger.error(f"Error completing task {task_id}: {e}")
+            return None
+    
+    async def fail_task(
+        self,
+        task_id: str,
+        error_message: Optional[str] = None,
+        error_type: Optional[str] = None,
+        retry_delay_seconds: Optional[float] = None
+    ) -> Optional[str]:
+        """Record a failure and atomically increment the retry count.
+        
+        With a retry delay the task is rescheduled while retries remain, otherwise
+        it is dead-lettered. Returns the task's new status.
+        """
+        try:
+            response = self.client.rpc('fail_analysis_task', {
+                'p_task_id': task_id,
+                'p_error_message': error_message,
+                'p_error_type': error_type,
+                'p_retry_delay_seconds': retry_delay_seconds
+            }).execute()
+            return response.data
+        except Exception as e:
+            logger.error(f"Error failing task {task_id}: {e}")
+            return None
+    
+    async def skip_task(self, task_id: str, reason: str) -> bool:
+        """Finish a claimed task without analysis, e.g. when the pre-filter found nothing new"""
+        try:
+            self.client.table('analysis_tasks').update({
+                'status': 'skipped',
+                'skip_reason': reason,
+                'completed_at': datetime.utcnow().isoformat(),
+                'lease_expires_at': None
+            }).eq('id', task_id).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error skipping task {task_id}: {e}")
+            return False
+
+    async def release_task(
+        self,
+        task_id: str,
+        delay_seconds: float = 0,
+        standalone: bool = False,
+        burst_waits: Optional[int] = None
+    ) -> bool:
+        """Hand a claimed task back to the queue without counting a retry"""
+        try:
+            update_data = {
+                'status': 'pending',
+                'worker_id': None,
+                'lease_expires_at': None,
+                'scheduled_at': (datetime.utcnow() + timedelta(seconds=delay_seconds)).isoformat()
+            }
+            if standalone:
+                update_data['burst_standalone'] = True
+            if burst_waits is not None:
+                update_data['burst_waits'] = burst_waits
+            self.client.table('analysis_tasks').update(update_data).eq('id', task_id).eq('status', 'processing').execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error releasing task {task_id}: {e}")
+            return False
+
+    async def link_burst_tasks(self, task_ids: List[str], result_id: str) -> bool:
+        """Finish the other frames of a burst with a link to the result that covers them"""
+        try:
+            self.client.table('analysis_tasks').update({
+                'status': 'skipped',
+                'skip_reason': 'burst',
+                'burst_result_id': result_id,
+                'completed_at': datetime.utcnow().isoformat(),
+                'lease_expires_at': None
+            }).in_('id', task_ids).execute()
+            return True
+        except Exception as e:
+            logger.error(f"Error linking burst tasks to result {result_id}: {e}")
+            return False
+
+    async def get_camera_images_between(self, camera_name: str, start: str, end: str) -> List[Dict[str, Any]]:
+        """A camera's images captured between two ISO timestamps, oldest first"""
+        try:
+            response = self.client.table('spypoint_images').select(
+                'image_id, camera_name, captured_at, storage_path, image_url'
+            ).eq('camera_name', camera_name).gte('captured_at', start).lte(
+                'captured_at', end
+            ).order('captured_at').execute()
+            return response.data
+        except Exception as e:
+            logger.error(f"Error getting images for {camera_name}: {e}")
+            return []
+
+    async def get_config_tasks_for_images(self, config_id: str, image_ids: List[str]) -> List[Dict[str, Any]]:
+        try:
+            response = self.client.table('analysis_tasks').select(
+                'id, image_id, status, worker_id, retry_count, burst_result_id, burst_standalone'
+            ).eq('config_id', config_id).in_('image_id', image_ids).execute()
+            return response.data
+        except Exception as e:
+            logger.error(f"Error getting tasks for config {config_id}: {e}")
+            return []
+
+    async def get_latest_result_id(self, image_id: str, config_id: str) -> Optional[str]:
+        try:
+            response = self.client.table('image_analysis_results').select('id').eq(
+                'image_id', image_id
+            ).eq('config_id', config_id).order('created_at', desc=True).limit(1).execute()
+            return response.data[0]['id'] if response.data else None
+        except Exception as e:
+            logger.error(f"Error getting result for image {image_id}: {e}")
+            return None
+
+    async def get_result_history(self, config_id: str, camera_name: str, limit: int = 200) -> List[Dict[str, Any]]:
+        """A config's recent results for one camera with capture times, oldest first"""
+        try:
+            # Inner join on the image so the camera filter applies before the limit
+            results = self.client.table('image_analysis_results').select(
+                'image_id, result, alert_triggered, created_at, spypoint_images!inner(captured_at)'
+            ).eq('config_id', config_id).eq('spypoint_images.camera_name', camera_name).order(
+                'created_at', desc=True
+            ).limit(limit).execute().data
+            history = []
+            for row in results or []:
+                image = row.pop('spypoint_images', None) or {}
+                history.append({**row, 'captured_at': image.get('captured_at')})
+            return sorted(history, key=lambda row: row['captured_at'] or row['created_at'])
+        except Exception as e:
+            logger.error(f"Error getting result history for config {config_id}: {e}")
+            return []
+
+    async def get_retry_summary(self, dead_letter_limit: int = 50) -> Dict[str, Any]:
+        """Summarize scheduled retries and dead-lettered tasks"""
+        try:
+            retrying = self.client.table('analysis_tasks').select(
+                'id, retry_count, max_retries, last_error_type, scheduled_at'
+            ).eq('status', 'pending').gt('retry_count', 0).order('scheduled_at').execute()
+            
+            dead_letter = self.client.table('analysis_tasks').select(
+                'id, image_id, config_id, retry_count, max_retries, last_error_type, error_message, scheduled_at',
+                count='exact'
+            ).eq('status', 'dead_letter').order('scheduled_at', desc=True).limit(dead_letter_limit).execute()
+            
+            by_error_type: Dict[str, int] = {}
+            for task in (retrying.data or []):
+                error_type = task.get('last_error_type') or 'unknown'
+                by_error_type[error_type] = by_error_type.get(error_type, 0) + 1
+            
+            return {
+                'retry_scheduled': len(retrying.data or []),
+                'retry_scheduled_by_error_type': by_error_type,
+                'next_retry_at': retrying.data[0]['scheduled_at'] if retrying.data else None,
+                'dead_letter_count': dead_letter.count or 0,
+                'dead_letter_tasks': dead_letter.data or []
+            }
+        except Exception as e:
+            logger.error(f"Error getting retry summary: {e}")
+            return {
+                'retry_scheduled': 0,
+                'retry_scheduled_by_error_type': {},
+                'next_retry_at': None,
+                'dead_letter_count': 0,
+                'dead_letter_tasks': []
+            }
+    
+    async def requeue_task(self, task_id: str) -> bool:
+        """Move a dead-lettered task back to pending with a fresh retry budget"""
+        try:
+            response = self.client.table('analysis_tasks').update({
+                'status': 'pending',
+                'retry_count': 0,
+                'error_message': None,
+                'last_error_type': None,
+                'scheduled_at': datetime.utcnow().isoformat()
+            }).eq('id', task_id).eq('status', 'dead_letter').execute()
+            return bool(response.data)
+        except Exception as e:
+            logger.error(f"Error requeuing task {task_id}: {e}")
+            return False
+    
     async def save_analysis_result(self, result_data: Dict[str, Any]) -> Optional[str]:
         try:
             response = self.client.table('image_analysis_results').insert(result_data).execute()
@@ -100,9 +364,12 @@ class SupabaseClient:
     
     async def get_pending_tasks(self, limit: int = 10) -> List[Dict[str, Any]]:
         try:
+            # Tasks rescheduled for retry stay invisible until their backoff expires
             response = self.client.table('analysis_tasks').select('*').eq(
                 'status', 'pending'
-            ).order('priority', desc=True).order('scheduled_at').limit(limit).execute()
+            ).lte('scheduled_at', datetime.utcnow().isoformat()).order(
+                'priority', desc=True
+            ).order('scheduled_at').limit(limit).execute()
             return response.data
         except Exception as e:
             logger.error(f"Error getting pending tasks: {e}")
@@ -214,35 +481,27 @@ class SupabaseClient:
         estimated_cost: float
     ) -> None:
         try:
-            today = datetime.utcnow().date().isoformat()
-            
-            # Try to get existing record
-            response = self.client.table('analysis_costs').select('*').eq(
-                'date', today
-            ).eq('model_provider', provider).eq('model_name', model).single().execute()
+            if self.cost_tracker and self.cost_tracker.running:
+                self.cost_tracker.record(provider, model, tokens_used, estimated_cost)
+                return
             
-            if response.data:
-                # Update existing record
-                update_data = {
-                    'analysis_count': response.data['analysis_count'] + 1,
-                    'tokens_used': response.data['tokens_used'] + tokens_used,
-                    'estimated_cost': response.data['estimated_cost'] + estimated_cost
-                }
-                self.client.table('analysis_costs').update(update_data).eq('id', response.data['id']).execute()
-            else:
-                # Create new record
-                self.client.table('analysis_costs').insert({
-                    'date': today,
-                    'model_provider': provider,
-                    'model_name': model,
-                    'analysis_count': 1,
-                    'tokens_used': tokens_used,
-                    'estimated_cost': estimated_cost
-                }).execute()
+            # No tracker running - apply this single increment atomically
+            await asyncio.to_thread(self.increment_analysis_costs, [{
+                'date': datetime.utcnow().date().isoformat(),
+                'model_provider': provider,
+                'model_name': model,
+                'analysis_count': 1,
+                'tokens_used': tokens_used,
+                'estimated_cost': estimated_cost
+            }])
                 
         except Exception as e:
             logger.error(f"Error updating cost tracking: {e}")
     
+    def increment_analysis_costs(self, rows: List[Dict[str, Any]]) -> None:
+        """Atomically add aggregated usage rows to analysis_costs (blocking)"""
+        self.client.rpc('increment_analysis_costs', {'p_rows': rows}).execute()
+    
     async def save_ai_analysis_log(
         self,
         image_id: str,
@@ -273,7 +532,8 @@ class SupabaseClient:
         max_tokens: int = 500,
         input_tokens: Optional[int] = None,
         output_tokens: Optional[int] = None,
-        estimated_cost: Optional[float] = None
+        estimated_cost: Optional[float] = None,
+        cached_tokens: Optional[int] = None
     ) -> Optional[str]:
         """Save comprehensive AI analysis log entry"""
         try:
@@ -298,6 +558,7 @@ class SupabaseClient:
                 'tokens_used': tokens_used,
                 'input_tokens': input_tokens,
                 'output_tokens': output_tokens,
+                'cached_tokens': cached_tokens,
                 'estimated_cost': estimated_cost,
                 'config_id': config_id,
                 'task_id': task_id,
@@ -312,6 +573,12 @@ class SupabaseClient:
             # Remove None values to avoid inserting nulls unnecessarily
             log_data = {k: v for k, v in log_data.items() if v is not None}
             
+            if self.log_writer and self.log_writer.running:
+                # Assign the id client-side so callers still get it back
+                log_data['id'] = str(uuid.uuid4())
+                await self.log_writer.write(log_data)
+                return log_data['id']
+            
             response = self.client.table('ai_analysis_logs').insert(log_data).execute()
             return response.data[0]['id']
             
@@ -319,6 +586,10 @@ class SupabaseClient:
             logger.error(f"Error saving AI analysis log: {e}")
             return None
     
+    def insert_ai_analysis_logs(self, rows: List[Dict[str, Any]]) -> None:
+        """Insert several AI analysis log rows in one request (blocking)"""
+        self.client.table('ai_analysis_logs').insert(rows).execute()
+    
     async def get_recent_ai_analysis_logs(
         self,
         limit: int = 50,
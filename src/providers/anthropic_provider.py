@@ -0,0 +1,250 @@
+import anthropic
+from anthropic import AsyncAnthropic
+import httpx
+import json
+import os
+import time
+from typing import Dict, Any, List, Optional, Tuple
+from .base import BaseProvider, AnalysisResult, ImageData, detect_mime_type
+from .image_profiles import DETAIL_LOW
+from .errors import classify_exception
+from .response_parser import parse_response_async, parse_streamed, StreamingJSONParser
+from .output_schemas import MODE_SCHEMA, compact_key, anthropic_output_mode, json_schema
+
+
+SYSTEM_PROMPT = "You are an AI assistant analyzing ranch camera images. Always respond with valid JSON."
+
+# Tool the model is forced to call; its input is the schema-shaped answer
+ANSWER_TOOL = "record_analysis"
+
+# Keep-alive connections shared by all requests from this provider
+MAX_CONNECTIONS = int(os.getenv('ANTHROPIC_MAX_CONNECTIONS', '20'))
+
+
+class AnthropicProvider(BaseProvider):
+    name = 'anthropic'
+
+    def __init__(self, api_key: str):
+        super().__init__(api_key)
+        self.client = AsyncAnthropic(
+            api_key=api_key,
+            http_client=anthropic.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=MAX_CONNECTIONS,
+                    max_keepalive_connections=MAX_CONNECTIONS
+                )
+            )
+        )
+
+    async def analyze_image(
+        self,
+        image_data: ImageData,
+        prompt: str,
+        model: str = "claude-3-5-haiku-20241022",
+        temperature: float = 0.3,
+        max_tokens: int = 500,
+        detail: str = DETAIL_LOW,
+        stop_keys: Optional[List[str]] = None,
+        analysis_type: Optional[str] = None
+    ) -> AnalysisResult:
+        start_time = time.time()
+        image_tokens = None
+        output_mode = anthropic_output_mode(analysis_type)
+
+        try:
+            image_bytes, encoded, plan = await self.prepare_image_base64(image_data, model, detail)
+            image_tokens = plan.predicted_tokens if plan else None
+
+            # The system prompt and template are marked as a cache breakpoint, so
+            # repeated calls read them from the prompt cache; the image and the
+            # camera/time header change on every call and come after it
+            messages = [
+                {
+                    "role": "user",
+                    "content": [
+                        {
+                            "type": "text",
+                            "text": prompt,
+                            "cache_control": {"type": "ephemeral"}
+                        },
+                        {
+                            "type": "image",
+                            "source": {
+                                "type": "base64",
+                                "media_type": detect_mime_type(image_bytes),
+                                "data": encoded
+                            }
+                        },
+                        {
+                            "type": "text",
+                            "text": f"Camera: {image_data.camera_name}\nTime: {image_data.captured_at}"
+                        }
+                    ]
+                }
+            ]
+
+            create_params = {
+                "model": model,
+                "system": SYSTEM_PROMPT,
+                "messages": messages,
+                "temperature": temperature,
+                "max_tokens": max_tokens
+            }
+
+            if output_mode == MODE_SCHEMA:
+                # Forced tool use is Anthropic's schema-constrained output
+                create_params["tools"] = [{
+                    "name": ANSWER_TOOL,
+                    "description": "Record the analysis of the camera image",
+                    "input_schema": json_schema(analysis_type)
+                }]
+                create_params["tool_choice"] = {"type": "tool", "name": ANSWER_TOOL}
+                prefill = ""
+            else:
+                # No JSON mode: prefill the opening brace so the answer starts as an object
+                prefill = "{"
+                messages.append({"role": "assistant", "content": prefill})
+
+            decision_ms = None
+            stopped_early = False
+            if stop_keys is not None:
+                if output_mode == MODE_SCHEMA:
+                    stop_keys = [compact_key(key) for key in stop_keys]
+                parser, usage, decision_ms = await self._stream(create_params, prefill, stop_keys, start_time)
+                raw_response = parser.text
+                stopped_early = not parser.finished
+                parsed = await parse_streamed(parser, analysis_type)
+            else:
+                response = await self.client.messages.create(**create_params)
+                raw_response = prefill + self._response_text(response)
+                usage = response.usage
+                parsed = await parse_response_async(raw_response, analysis_type)
+
+            # Anthropic reports cache reads and writes separately from uncached input
+            cached_tokens = None
+            output_tokens = None
+            if usage is not None:
+                cached_tokens = getattr(usage, 'cache_read_input_tokens', None) or 0
+                cache_writes = getattr(usage, 'cache_creation_input_tokens', None) or 0
+                input_tokens = (usage.input_tokens or 0) + cached_tokens + cache_writes
+                output_tokens = getattr(usage, 'output_tokens', None)
+            else:
+                input_tokens = len(prompt) // 4 + (image_tokens or 0)
+            if not output_tokens:
+                # Stream cut before the final usage event
+                output_tokens = max(1, len(raw_response) // 4)
+            tokens_used = input_tokens + output_tokens
+
+            print(f"Anthropic token usage - Input: {input_tokens} (cached: {cached_tokens}), Output: {output_tokens}, Total: {tokens_used}")
+            print(f"Anthropic raw response: {raw_response[:500]}...")
+
+            if parsed.error_type:
+                print(f"Anthropic JSON decode error. Raw response: {raw_response}")
+
+            processing_time_ms = int((time.time() - start_time) * 1000)
+
+            return AnalysisResult(
+                provider="anthropic",
+                model=model,
+                raw_response=raw_response,
+                parsed_data=parsed.data,
+                confidence=parsed.confidence,
+                tokens_used=tokens_used,
+                processing_time_ms=processing_time_ms,
+                input_tokens=input_tokens,
+                output_tokens=output_tokens,
+                error_type=parsed.error_type,
+                image_tokens=image_tokens,
+                decision_ms=decision_ms,
+                stopped_early=stopped_early,
+                output_mode=output_mode,
+                cached_tokens=cached_tokens
+            )
+
+        except Exception as e:
+            processing_time_ms = int((time.time() - start_time) * 1000)
+            error_msg = f"Anthropic API Error: {str(e)}"
+            error_type, retry_after = classify_exception(e)
+            print(f"Error in Anthropic provider ({error_type}): {error_msg}")
+
+            return AnalysisResult(
+                provider="anthropic",
+                model=model,
+                raw_response=error_msg,
+                parsed_data={"error": error_msg},
+                confidence=0.0,
+                tokens_used=0,
+                processing_time_ms=processing_time_ms,
+                error=error_msg,
+                error_type=error_type,
+                retry_after=retry_after,
+                image_tokens=image_tokens,
+                output_mode=output_mode
+            )
+
+    def _response_text(self, response: Any) -> str:
+        """The answer as JSON text, from the forced tool call or the text blocks"""
+        for block in response.content:
+            if block.type == "tool_use":
+                return json.dumps(block.input)
+        return "".join(block.text for block in response.content if block.type == "text")
+
+    async def _stream(
+        self,
+        create_params: Dict[str, Any],
+        prefill: str,
+        stop_keys: List[str],
+        start_time: float
+    ) -> Tuple[StreamingJSONParser, Any, Optional[int]]:
+        """Stream a message, stopping once every stop key has been parsed"""
+        parser = StreamingJSONParser(stop_keys)
+        parser.feed(prefill)
+        usage = None
+        decision_ms = None
+        async with self.client.messages.stream(**create_params) as stream:
+            async for event in stream:
+                if event.type == "message_start":
+                    usage = event.message.usage
+                    # Filled in by message_delta; stays 0 if the stream is cut first
+                    usage.output_tokens = 0
+                elif event.type == "message_delta" and usage is not None:
+                    usage.output_tokens = event.usage.output_tokens
+                elif event.type == "content_block_delta":
+                    delta = event.delta
+                    text = getattr(delta, 'partial_json', None) if delta.type == "input_json_delta" else getattr(delta, 'text', None)
+                    if not text:
+                        continue
+                    parser.feed(text)
+                    if parser.complete:
+                        decision_ms = int((time.time() - start_time) * 1000)
+                        # Leaving the context manager closes the stream and stops generation
+                        break
+        return parser, usage, decision_ms
+
+    def get_supported_models(self) -> List[str]:
+        return [
+            "claude-3-5-haiku-20241022",
+            "claude-3-5-sonnet-20241022",
+            "claude-3-haiku-20240307",
+            "claude-3-opus-20240229"
+        ]
+
+    def estimate_cost(self, tokens_used: int, model: str, cached_tokens: int = 0) -> float:
+        # Anthropic pricing (average of input/output per 1M tokens)
+        cost_per_1k_tokens = {
+            "claude-3-5-haiku-20241022": 0.0024,   # $0.80 input + $4.00 output average = $2.40 per 1M
+            "claude-3-5-sonnet-20241022": 0.009,   # $3.00 input + $15.00 output average = $9.00 per 1M
+            "claude-3-haiku-20240307": 0.00075,    # $0.25 input + $1.25 output average = $0.75 per 1M
+            "claude-3-opus-20240229": 0.045        # $15.00 input + $75.00 output average = $45.00 per 1M
+        }
+        # Cache reads are billed at a tenth of the input rate
+        cached_savings_per_1k_tokens = {
+            "claude-3-5-haiku-20241022": 0.00072,
+            "claude-3-5-sonnet-20241022": 0.0027,
+            "claude-3-haiku-20240307": 0.000225,
+            "claude-3-opus-20240229": 0.0135
+        }
+
+        rate = cost_per_1k_tokens.get(model, 0.009)
+        savings = cached_savings_per_1k_tokens.get(model, 0.0)
+        return max(0.0, (tokens_used / 1000) * rate - ((cached_tokens or 0) / 1000) * savings)
@@ -1,9 +1,12 @@
 from abc import ABC, abstractmethod
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Optional, List, Tuple
 from dataclasses import dataclass
-import base64
+import hashlib
 from PIL import Image
 import io
+from .image_resize import resizer
+from .image_profiles import ImagePlan, plan_image, DETAIL_LOW
+from .cpu_pool import cpu_pool
 
 
 @dataclass
@@ -18,17 +21,129 @@ class AnalysisResult:
     error: Optional[str] = None
     input_tokens: Optional[int] = None
     output_tokens: Optional[int] = None
+    estimated_cost: Optional[float] = None
+    error_type: Optional[str] = None  # See providers.errors
+    retry_after: Optional[float] = None  # Provider Retry-After hint in seconds
+    image_tokens: Optional[int] = None  # Predicted image tokens sent with the request
+    decision_ms: Optional[int] = None  # Streaming: time until the decision fields arrived
+    stopped_early: bool = False  # Streaming: generation cut once the decision fields arrived
+    output_mode: Optional[str] = None  # json_schema, json_object or text
+    cached_tokens: Optional[int] = None  # Input tokens served from the provider's prompt cache
+
+
+def detect_mime_type(image_bytes: bytes) -> str:
+    # Trail cameras send JPEG; Pi Zero uploads may be PNG
+    if image_bytes[:8] == b'\x89PNG\r\n\x1a\n':
+        return 'image/png'
+    if image_bytes[:4] == b'RIFF' and image_bytes[8:12] == b'WEBP':
+        return 'image/webp'
+    return 'image/jpeg'
 
 
-@dataclass
 class ImageData:
-    image_bytes: bytes
-    image_id: str
-    camera_name: str
-    captured_at: str
-    
+    """Image bytes plus metadata, with derivatives computed once and cached.
+
+    Dual-model, tiebreaker and compare runs pass the same ImageData to every
+    provider, so hashes, dimensions and decoded pixels are computed at most
+    once per image no matter how many models look at it. Resized bytes and
+    their base64 are cached by the shared resizer.
+    """
+
+    __slots__ = (
+        'image_bytes', 'image_id', 'camera_name', 'captured_at', 'image_url',
+        '_sha256', '_dhash', '_size', '_mime_type', '_decoded'
+    )
+
+    def __init__(
+        self,
+        image_bytes: bytes,
+        image_id: str,
+        camera_name: str,
+        captured_at: str,
+        image_url: Optional[str] = None
+    ):
+        self.image_bytes = image_bytes
+        self.image_id = image_id
+        self.camera_name = camera_name
+        self.captured_at = captured_at
+        self.image_url = image_url
+
+        self._sha256: Optional[str] = None
+        self._dhash: Optional[str] = None
+        self._size: Optional[Tuple[int, int]] = None
+        self._mime_type: Optional[str] = None
+        self._decoded: Dict[int, Image.Image] = {}
+
+    def __repr__(self) -> str:
+        return (
+            f"ImageData(image_id={self.image_id!r}, camera_name={self.camera_name!r}, "
+            f"captured_at={self.captured_at!r}, bytes={len(self.image_bytes)})"
+        )
+
+    @property
+    def mime_type(self) -> str:
+        if self._mime_type is None:
+            self._mime_type = detect_mime_type(self.image_bytes)
+        return self._mime_type
+
+    @property
+    def sha256(self) -> str:
+        if self._sha256 is None:
+            self._sha256 = hashlib.sha256(self.image_bytes).hexdigest()
+        return self._sha256
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        """(width, height) read from the header without decoding pixels"""
+        if self._size is None:
+            with Image.open(io.BytesIO(self.image_bytes)) as img:
+                self._size = img.size
+        return self._size
+
+    @property
+    def width(self) -> int:
+        return self.size[0]
+
+    @property
+    def height(self) -> int:
+        return self.size[1]
+
+    def decoded(self, max_side: int = 0) -> Image.Image:
+        """RGB pixels scaled so the longer side is at most max_side (0 = full size).
+
+        JPEGs are decoded in draft mode, so small scales never pay for a
+        full-resolution decode. Callers must not modify the returned image.
+        """
+        if max_side not in self._decoded:
+            img = Image.open(io.BytesIO(self.image_bytes))
+            if max_side:
+                img.draft('RGB', (max_side, max_side))
+            img = img.convert('RGB')
+            if max_side and max(img.size) > max_side:
+                img.thumbnail((max_side, max_side), Image.LANCZOS)
+            self._decoded[max_side] = img
+        return self._decoded[max_side]
+
+    @property
+    def perceptual_hash(self) -> str:
+        """64-bit difference hash (dHash) as 16 hex chars; near-identical frames share most bits"""
+        if self._dhash is None:
+            small = self.decoded(64).convert('L').resize((9, 8), Image.BILINEAR)
+            pixels = list(small.getdata())
+            bits = 0
+            for row in range(8):
+                for col in range(8):
+                    left = pixels[row * 9 + col]
+                    right = pixels[row * 9 + col + 1]
+                    bits = (bits << 1) | (1 if left > right else 0)
+            self._dhash = f"{bits:016x}"
+        return self._dhash
+
 
 class BaseProvider(ABC):
+    name = ''  # Provider key used in factory, limits and image profiles
+    request_timeout: Optional[float] = None  # Overrides the service-wide REQUEST_TIMEOUT
+    
     def __init__(self, api_key: str):
         self.api_key = api_key
         
@@ -39,8 +154,14 @@ class BaseProvider(ABC):
         prompt: str,
         model: str,
         temperature: float = 0.3,
-        max_tokens: int = 500
+        max_tokens: int = 500,
+        detail: str = DETAIL_LOW,
+        stop_keys: Optional[List[str]] = None,
+        analysis_type: Optional[str] = None
     ) -> AnalysisResult:
+        """Analyze an image. With stop_keys the response is streamed and generation
+        stops as soon as all of those top-level fields have arrived. A known
+        analysis_type constrains the output to its schema where the model supports it."""
         pass
     
     @abstractmethod
@@ -48,25 +169,41 @@ class BaseProvider(ABC):
         pass
     
     @abstractmethod
-    def estimate_cost(self, tokens_used: int, model: str) -> float:
+    def estimate_cost(self, tokens_used: int, model: str, cached_tokens: int = 0) -> float:
+        """Cost of a call; cached_tokens are input tokens billed at the provider's cached rate"""
         pass
     
-    def encode_image(self, image_bytes: bytes) -> str:
-        return base64.b64encode(image_bytes).decode('utf-8')
+    def plan_image(self, image_data: ImageData, model: str, detail: str = DETAIL_LOW) -> Optional[ImagePlan]:
+        return plan_image(self.name, model, image_data.width, image_data.height, detail)
     
-    def resize_image_if_needed(self, image_bytes: bytes, max_size_kb: int = 25) -> bytes:
-        current_size_kb = len(image_bytes) / 1024
-        if current_size_kb <= max_size_kb:
-            return image_bytes
-            
-        img = Image.open(io.BytesIO(image_bytes))
-        
-        quality = 85
-        while current_size_kb > max_size_kb and quality > 20:
-            buffer = io.BytesIO()
-            img.save(buffer, format='JPEG', quality=quality, optimize=True)
-            image_bytes = buffer.getvalue()
-            current_size_kb = len(image_bytes) / 1024
-            quality -= 5
-            
-        return image_bytes
\ No newline at end of file
+    def predict_image_tokens(self, image_data: ImageData, model: str, detail: str = DETAIL_LOW) -> Optional[int]:
+        try:
+            plan = self.plan_image(image_data, model, detail)
+        except Exception:
+            # Unreadable header; the provider call will report the real error
+            return None
+        return plan.predicted_tokens if plan else None
+    
+    async def prepare_image(self, image_data: ImageData, model: str, detail: str = DETAIL_LOW) -> Tuple[bytes, Optional[ImagePlan]]:
+        """Image bytes sized for the model's token geometry, plus the plan behind them"""
+        plan = self.plan_image(image_data, model, detail)
+        if plan is None:
+            return image_data.image_bytes, None
+        # Hashing, decode and re-encode all happen in the CPU pool, not on the event loop
+        image_bytes = await cpu_pool.run_in_thread(
+            lambda: resizer.resize(image_data.image_bytes, plan.profile, image_data.sha256)
+        )
+        return image_bytes, plan
+    
+    async def prepare_image_base64(
+        self,
+        image_data: ImageData,
+        model: str,
+        detail: str = DETAIL_LOW
+    ) -> Tuple[bytes, str, Optional[ImagePlan]]:
+        """prepare_image plus the base64 of the sized bytes, encoded once per image and profile"""
+        plan = self.plan_image(image_data, model, detail)
+        image_bytes, encoded = await cpu_pool.run_in_thread(
+            lambda: resizer.resize_base64(image_data.image_bytes, plan.profile if plan else None, image_data.sha256)
+        )
+        return image_bytes, encoded, plan
@@ -0,0 +1,211 @@
+import json
+import logging
+import os
+import time
+from collections import deque
+from typing import Dict, Any, List, Tuple, Union
+
+
+logger = logging.getLogger(__name__)
+
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+# Equivalent models on other providers to route to while a breaker is open, in order
+# of preference; override with PROVIDER_FAILOVER, e.g.
+# '{"gemini/gemini-1.5-flash": ["openai/gpt-4o-mini", "anthropic/claude-3-5-haiku-20241022"]}'
+DEFAULT_FAILOVER: Dict[str, Union[str, List[str]]] = {
+    "gemini/gemini-1.5-flash": ["openai/gpt-4o-mini", "anthropic/claude-3-5-haiku-20241022"],
+    "gemini/gemini-2.0-flash-exp": ["openai/gpt-4o-mini", "anthropic/claude-3-5-haiku-20241022"],
+    "gemini/gemini-1.5-pro": ["openai/gpt-4o", "anthropic/claude-3-5-sonnet-20241022"],
+    "gemini/gemini-2.5-pro": ["openai/gpt-4o", "anthropic/claude-3-5-sonnet-20241022"],
+    "openai/gpt-4o-mini": ["gemini/gemini-1.5-flash", "anthropic/claude-3-5-haiku-20241022"],
+    "openai/gpt-4o": ["gemini/gemini-2.5-pro", "anthropic/claude-3-5-sonnet-20241022"],
+    "anthropic/claude-3-5-haiku-20241022": ["gemini/gemini-1.5-flash", "openai/gpt-4o-mini"],
+    "anthropic/claude-3-5-sonnet-20241022": ["openai/gpt-4o", "gemini/gemini-2.5-pro"],
+    "anthropic/claude-3-opus-20240229": ["openai/gpt-4o", "gemini/gemini-2.5-pro"],
+}
+
+# Slow-call thresholds for providers that are slow by design; the local server runs on
+# CPU, so only calls taking over half its request timeout count as slow
+PROVIDER_SLOW_CALL_MS: Dict[str, float] = {
+    "local": float(os.getenv('LOCAL_LLM_TIMEOUT_SECONDS', '180')) * 1000 / 2,
+}
+
+
+class CircuitBreaker:
+    """Per-model circuit breaker over a sliding time window.
+
+    The breaker opens when, over at least ``min_calls`` calls in the window,
+    the failure rate or the slow-call rate reaches its threshold. After
+    ``open_seconds`` it half-opens and lets ``half_open_probes`` calls through.
+    If they all succeed it closes; if any fails it opens again. Probes that
+    report no outcome within another ``open_seconds`` are written off and new
+    probes are let through.
+    """
+
+    def __init__(
+        self,
+        provider: str,
+        model: str,
+        failure_rate_threshold: float = 0.5,
+        slow_call_ms: float = 20000,
+        slow_call_rate_threshold: float = 0.5,
+        window_seconds: float = 60,
+        min_calls: int = 5,
+        open_seconds: float = 30,
+        half_open_probes: int = 2
+    ):
+        self.provider = provider
+        self.model = model
+        self.failure_rate_threshold = failure_rate_threshold
+        self.slow_call_ms = slow_call_ms
+        self.slow_call_rate_threshold = slow_call_rate_threshold
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.open_seconds = open_seconds
+        self.half_open_probes = half_open_probes
+
+        self.state = STATE_CLOSED
+        self.opened_at = 0.0
+        self.half_open_since = 0.0
+        self._calls: deque = deque()  # (timestamp, failed, slow)
+        self._probes_started = 0
+        self._probes_succeeded = 0
+
+        self.times_opened = 0
+        self.rejected = 0
+
+    def _trim(self, now: float) -> None:
+        while self._calls and now - self._calls[0][0] > self.window_seconds:
+            self._calls.popleft()
+
+    def remaining_open_seconds(self) -> float:
+        if self.state != STATE_OPEN:
+            return 0.0
+        return max(0.0, self.open_seconds - (time.monotonic() - self.opened_at))
+
+    def allow_request(self) -> bool:
+        if self.state == STATE_OPEN:
+            if self.remaining_open_seconds() > 0:
+                self.rejected += 1
+                return False
+            self._start_probing()
+            logger.info(f"Circuit for {self.provider}/{self.model} half-open, probing")
+
+        if self.state == STATE_HALF_OPEN:
+            if self._probes_started >= self.half_open_probes and time.monotonic() - self.half_open_since > self.open_seconds:
+                logger.warning(f"Circuit for {self.provider}/{self.model} probes never reported back, probing again")
+                self._start_probing()
+            if self._probes_started >= self.half_open_probes:
+                self.rejected += 1
+                return False
+            self._probes_started += 1
+
+        return True
+
+    def _start_probing(self) -> None:
+        self.state = STATE_HALF_OPEN
+        self.half_open_since = time.monotonic()
+        self._probes_started = 0
+        self._probes_succeeded = 0
+
+    def release_probe(self) -> None:
+        """Give back a half-open probe slot whose call ended without an outcome (e.g. cancelled)"""
+        if self.state == STATE_HALF_OPEN and self._probes_started > self._probes_succeeded:
+            self._probes_started -= 1
+
+    def record(self, failed: bool, latency_ms: float) -> None:
+        now = time.monotonic()
+        slow = latency_ms >= self.slow_call_ms
+
+        if self.state == STATE_HALF_OPEN:
+            if failed or slow:
+                self._open(now, "probe failed")
+            else:
+                self._probes_succeeded += 1
+                if self._probes_succeeded >= self.half_open_probes:
+                    self.state = STATE_CLOSED
+                    self._calls.clear()
+                    logger.info(f"Circuit for {self.provider}/{self.model} closed")
+            return
+
+        self._calls.append((now, failed, slow))
+        self._trim(now)
+        if self.state != STATE_CLOSED or len(self._calls) < self.min_calls:
+            return
+
+        total = len(self._calls)
+        failure_rate = sum(1 for _, f, _ in self._calls if f) / total
+        slow_rate = sum(1 for _, _, s in self._calls if s) / total
+        if failure_rate >= self.failure_rate_threshold:
+            self._open(now, f"failure rate {failure_rate:.0%}")
+        elif slow_rate >= self.slow_call_rate_threshold:
+            self._open(now, f"slow call rate {slow_rate:.0%}")
+
+    def _open(self, now: float, reason: str) -> None:
+        self.state = STATE_OPEN
+        self.opened_at = now
+        self.times_opened += 1
+        logger.warning(f"Circuit for {self.provider}/{self.model} opened: {reason}")
+
+    def stats(self) -> Dict[str, Any]:
+        now = time.monotonic()
+        self._trim(now)
+        total = len(self._calls)
+        return {
+            'state': self.state,
+            'open_seconds_remaining': round(self.remaining_open_seconds(), 1),
+            'window_calls': total,
+            'window_failure_rate': round(sum(1 for _, f, _ in self._calls if f) / total, 3) if total else 0.0,
+            'window_slow_rate': round(sum(1 for _, _, s in self._calls if s) / total, 3) if total else 0.0,
+            'times_opened': self.times_opened,
+            'rejected': self.rejected
+        }
+
+
+class CircuitBreakerRegistry:
+    """One breaker per (provider, model) plus the failover routing table"""
+
+    def __init__(self):
+        self.failover = dict(DEFAULT_FAILOVER)
+        overrides = os.getenv('PROVIDER_FAILOVER')
+        if overrides:
+            try:
+                self.failover.update(json.loads(overrides))
+            except ValueError as e:
+                logger.error(f"Ignoring invalid PROVIDER_FAILOVER: {e}")
+
+        self.slow_call_ms = float(os.getenv('CIRCUIT_SLOW_CALL_MS', '20000'))
+        self.open_seconds = float(os.getenv('CIRCUIT_OPEN_SECONDS', '30'))
+        self._breakers: Dict[Tuple[str, str], CircuitBreaker] = {}
+        self.failovers = 0
+
+    def get(self, provider: str, model: str) -> CircuitBreaker:
+        key = (provider, model)
+        if key not in self._breakers:
+            self._breakers[key] = CircuitBreaker(
+                provider,
+                model,
+                slow_call_ms=PROVIDER_SLOW_CALL_MS.get(provider, self.slow_call_ms),
+                open_seconds=self.open_seconds
+            )
+        return self._breakers[key]
+
+    def failover_for(self, provider: str, model: str) -> List[Tuple[str, str]]:
+        """Failover (provider, model) candidates in order of preference"""
+        targets = self.failover.get(f"{provider}/{model}") or []
+        if isinstance(targets, str):
+            targets = [targets]
+        return [tuple(target.split('/', 1)) for target in targets if '/' in target]
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'failovers': self.failovers,
+            'breakers': {
+                f"{provider}/{model}": breaker.stats()
+                for (provider, model), breaker in self._breakers.items()
+            }
+        }
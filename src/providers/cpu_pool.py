@@ -0,0 +1,134 @@
+import asyncio
+import logging
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, ProcessPoolExecutor
+from typing import Dict, Any, Callable, Optional
+
+
+logger = logging.getLogger(__name__)
+
+
+# Pure-Python work on inputs smaller than this is cheaper inline than a process hop
+PROCESS_OFFLOAD_BYTES = int(os.getenv('CPU_PROCESS_OFFLOAD_BYTES', str(32 * 1024)))
+
+
+class CpuPool:
+    """Managed executors for CPU-bound work, shared by the worker and the API.
+
+    PIL decode/resize/encode and base64 release the GIL, so they run on a
+    thread pool sized to the CPU count. Arguments are passed by reference,
+    so image buffers are never copied. Pure-Python work that holds the GIL
+    (e.g. scanning long model responses) goes to a lazily started process
+    pool; its arguments are pickled, so only hand it inputs worth the copy.
+    """
+
+    def __init__(self, thread_workers: Optional[int] = None, process_workers: Optional[int] = None):
+        cpu_count = os.cpu_count() or 1
+        self.thread_workers = thread_workers or int(os.getenv('CPU_THREAD_WORKERS', str(cpu_count)))
+        self.process_workers = process_workers or int(os.getenv('CPU_PROCESS_WORKERS', str(max(1, cpu_count - 1))))
+        self._threads: Optional[ThreadPoolExecutor] = None
+        self._processes: Optional[ProcessPoolExecutor] = None
+
+        self.thread_jobs = 0
+        self.process_jobs = 0
+        self.in_flight = 0
+
+    def _thread_executor(self) -> ThreadPoolExecutor:
+        if self._threads is None:
+            self._threads = ThreadPoolExecutor(max_workers=self.thread_workers, thread_name_prefix='cpu')
+        return self._threads
+
+    def _process_executor(self) -> ProcessPoolExecutor:
+        if self._processes is None:
+            self._processes = ProcessPoolExecutor(max_workers=self.process_workers)
+        return self._processes
+
+    async def run_in_thread(self, fn: Callable, *args) -> Any:
+        """Run GIL-releasing work (PIL, hashing, base64) off the event loop"""
+        self.thread_jobs += 1
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._thread_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    async def run_in_process(self, fn: Callable, *args) -> Any:
+        """Run GIL-bound pure-Python work in a worker process; fn and args must be picklable"""
+        self.process_jobs += 1
+        self.in_flight += 1
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self._process_executor(), fn, *args)
+        finally:
+            self.in_flight -= 1
+
+    def shutdown(self) -> None:
+        if self._threads is not None:
+            self._threads.shutdown(wait=False, cancel_futures=True)
+            self._threads = None
+        if self._processes is not None:
+            self._processes.shutdown(wait=False, cancel_futures=True)
+            self._processes = None
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'thread_workers': self.thread_workers,
+            'process_workers': self.process_workers,
+            'process_pool_started': self._processes is not None,
+            'thread_jobs': self.thread_jobs,
+            'process_jobs': self.process_jobs,
+            'in_flight': self.in_flight
+        }
+
+
+class LoopLagProbe:
+    """Measures event-loop latency: how late a periodic sleep wakes up.
+
+    Anything blocking the loop (sync SDK calls, PIL on the loop thread)
+    shows up directly as lag, so compare these numbers before and after
+    moving work into the pool.
+    """
+
+    def __init__(self, interval: Optional[float] = None, window: int = 600, warn_ms: Optional[float] = None):
+        self.interval = interval or float(os.getenv('LOOP_LAG_INTERVAL_SECONDS', '0.25'))
+        self.warn_ms = warn_ms or float(os.getenv('LOOP_LAG_WARN_MS', '200'))
+        self._samples: deque = deque(maxlen=window)
+        self._task: Optional[asyncio.Task] = None
+        self.max_lag_ms = 0.0
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+
+    async def _run(self) -> None:
+        while True:
+            started = time.perf_counter()
+            await asyncio.sleep(self.interval)
+            lag_ms = max(0.0, (time.perf_counter() - started - self.interval) * 1000)
+            self._samples.append(lag_ms)
+            self.max_lag_ms = max(self.max_lag_ms, lag_ms)
+            if lag_ms >= self.warn_ms:
+                logger.warning(f"Event loop blocked for {lag_ms:.0f} ms")
+
+    def stats(self) -> Dict[str, Any]:
+        if not self._samples:
+            return {'running': self._task is not None, 'samples': 0}
+        ordered = sorted(self._samples)
+        return {
+            'running': self._task is not None,
+            'samples': len(ordered),
+            'mean_ms': round(sum(ordered) / len(ordered), 2),
+            'p50_ms': round(ordered[len(ordered) // 2], 2),
+            'p99_ms': round(ordered[min(len(ordered) - 1, int(len(ordered) * 0.99))], 2),
+            'max_ms': round(self.max_lag_ms, 2)
+        }
+
+
+cpu_pool = CpuPool()
+loop_lag = LoopLagProbe()
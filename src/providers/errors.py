@@ -0,0 +1,99 @@
+import asyncio
+from datetime import datetime, timezone
+from email.utils import parsedate_to_datetime
+from typing import Optional, Tuple
+
+
+# Error classes recorded on AnalysisResult.error_type and analysis_tasks.last_error_type
+ERROR_RATE_LIMIT = 'rate_limit'   # 429 / quota exhausted
+ERROR_TIMEOUT = 'timeout'         # request or deadline timeout
+ERROR_PARSE = 'parse_error'       # model answered but the JSON could not be parsed
+ERROR_TRANSIENT = 'transient'     # 5xx, overloaded, connection drops
+ERROR_PERMANENT = 'permanent'     # bad request, auth, unsupported model or config
+
+RETRYABLE_ERRORS = {ERROR_RATE_LIMIT, ERROR_TIMEOUT, ERROR_PARSE, ERROR_TRANSIENT}
+
+_RATE_LIMIT_NAMES = ('RateLimit', 'ResourceExhausted', 'TooManyRequests')
+_TIMEOUT_NAMES = ('Timeout', 'DeadlineExceeded')
+_TRANSIENT_NAMES = ('APIConnectionError', 'ServiceUnavailable', 'InternalServerError',
+                    'Overloaded', 'ServerError', 'ClientConnectionError', 'ServerDisconnected')
+
+
+class AnalysisError(Exception):
+    """A failed analysis carrying its error class and any provider Retry-After hint"""
+
+    def __init__(self, message: str, error_type: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.error_type = error_type
+        self.retry_after = retry_after
+
+    @property
+    def retryable(self) -> bool:
+        return self.error_type in RETRYABLE_ERRORS
+
+
+def parse_retry_after(value) -> Optional[float]:
+    """Parse a Retry-After header (delta seconds or HTTP date) into seconds"""
+    if value is None:
+        return None
+    try:
+        return max(0.0, float(value))
+    except (TypeError, ValueError):
+        pass
+    try:
+        retry_at = parsedate_to_datetime(str(value))
+        return max(0.0, (retry_at - datetime.now(timezone.utc)).total_seconds())
+    except (TypeError, ValueError):
+        return None
+
+
+def _retry_after_from(e: Exception) -> Optional[float]:
+    retry_after = getattr(e, 'retry_after', None)
+    if retry_after is not None:
+        return parse_retry_after(retry_after)
+
+    # openai/anthropic errors carry the httpx response
+    response = getattr(e, 'response', None)
+    headers = getattr(response, 'headers', None)
+    if headers:
+        retry_after_ms = headers.get('retry-after-ms')
+        if retry_after_ms is not None:
+            seconds = parse_retry_after(retry_after_ms)
+            return seconds / 1000 if seconds is not None else None
+        return parse_retry_after(headers.get('retry-after'))
+    return None
+
+
+def _status_of(e: Exception) -> Optional[int]:
+    """HTTP status of a provider or storage error, if it carries one"""
+    status = getattr(e, 'status_code', None) or getattr(e, 'status', None) or getattr(e, 'code', None)
+    # Supabase storage errors carry their response body as the first argument
+    if status is None and e.args and isinstance(e.args[0], dict):
+        status = e.args[0].get('statusCode')
+    if isinstance(status, str) and status.isdigit():
+        status = int(status)
+    return status if isinstance(status, int) else None
+
+
+def classify_exception(e: Exception) -> Tuple[str, Optional[float]]:
+    """Classify an exception into an error class and an optional retry delay in seconds"""
+    if isinstance(e, AnalysisError):
+        return e.error_type, e.retry_after
+
+    status = _status_of(e)
+    name = type(e).__name__
+
+    if status == 429 or any(n in name for n in _RATE_LIMIT_NAMES):
+        return ERROR_RATE_LIMIT, _retry_after_from(e)
+    if status in (408, 504) or isinstance(e, asyncio.TimeoutError) or any(n in name for n in _TIMEOUT_NAMES):
+        return ERROR_TIMEOUT, _retry_after_from(e)
+    if (status and status >= 500) or any(n in name for n in _TRANSIENT_NAMES) or isinstance(e, ConnectionError):
+        return ERROR_TRANSIENT, _retry_after_from(e)
+    if (status and 400 <= status < 500) or isinstance(e, (ValueError, KeyError, TypeError)):
+        return ERROR_PERMANENT, None
+    # Missing images, tasks and configs don't come back on a retry
+    if 'not found' in str(e).lower():
+        return ERROR_PERMANENT, None
+
+    # Unknown failures are retried; max_retries bounds the cost of being wrong
+    return ERROR_TRANSIENT, None
@@ -1,16 +1,111 @@
 import google.generativeai as genai
-import json
+import asyncio
+import hashlib
+import os
 import time
-from typing import Dict, Any, List
-from .base import BaseProvider, AnalysisResult, ImageData
-from PIL import Image
-import io
+from datetime import timedelta
+from typing import Dict, Any, List, Optional, Tuple
+from .base import BaseProvider, AnalysisResult, ImageData, detect_mime_type
+from .image_profiles import DETAIL_LOW
+from .errors import classify_exception, ERROR_PERMANENT
+from .response_parser import parse_response_async, parse_streamed, StreamingJSONParser
+from .output_schemas import MODE_SCHEMA, compact_key, gemini_output_mode, gemini_schema
+
+
+# Explicit context caching of the static prompt. Gemini only accepts caches above a
+# minimum token count, so short prompts fall back to implicit prefix caching.
+CONTEXT_CACHE = os.getenv('GEMINI_CONTEXT_CACHE', 'false').lower() == 'true'
+CONTEXT_CACHE_TTL_SECONDS = int(os.getenv('GEMINI_CONTEXT_CACHE_TTL_SECONDS', '3600'))
+# Recreate a cached context this long before it expires
+CONTEXT_CACHE_REFRESH_MARGIN = 60
 
 
 class GeminiProvider(BaseProvider):
+    name = 'gemini'
+    
     def __init__(self, api_key: str):
         super().__init__(api_key)
         genai.configure(api_key=api_key)
+        # GenerativeModel instances are reusable; build one per generation config
+        self._models: Dict[Tuple[str, float, int, Optional[str]], genai.GenerativeModel] = {}
+        # (model, prompt hash) -> cached context, its expiry and the models built on it
+        self._contexts: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self._uncacheable: set = set()
+        self._context_lock = asyncio.Lock()
+    
+    def _generation_config(self, temperature: float, max_tokens: int, schema_type: Optional[str]) -> Dict[str, Any]:
+        generation_config = {
+            "temperature": temperature,
+            "max_output_tokens": max_tokens,
+            "response_mime_type": "application/json"
+        }
+        if schema_type:
+            generation_config["response_schema"] = gemini_schema(schema_type)
+        return generation_config
+    
+    def _get_model(
+        self,
+        model: str,
+        temperature: float,
+        max_tokens: int,
+        schema_type: Optional[str] = None
+    ) -> genai.GenerativeModel:
+        """Cached model for a generation config; schema_type adds that analysis type's response_schema"""
+        key = (model, temperature, max_tokens, schema_type)
+        if key not in self._models:
+            self._models[key] = genai.GenerativeModel(
+                model_name=model,
+                generation_config=self._generation_config(temperature, max_tokens, schema_type)
+            )
+        return self._models[key]
+    
+    async def _get_cached_model(
+        self,
+        model: str,
+        static_prompt: str,
+        temperature: float,
+        max_tokens: int,
+        schema_type: Optional[str] = None
+    ) -> Optional[genai.GenerativeModel]:
+        """Model bound to a server-side cached context holding static_prompt, or None"""
+        if not CONTEXT_CACHE:
+            return None
+        key = (model, hashlib.sha256(static_prompt.encode('utf-8')).hexdigest())
+        if key in self._uncacheable:
+            return None
+        
+        async with self._context_lock:
+            entry = self._contexts.get(key)
+            if entry is None or entry['expires_at'] - CONTEXT_CACHE_REFRESH_MARGIN <= time.time():
+                try:
+                    # The SDK call is blocking; keep it off the event loop
+                    content = await asyncio.to_thread(
+                        genai.caching.CachedContent.create,
+                        model=model if model.startswith('models/') else f"models/{model}",
+                        contents=[static_prompt],
+                        ttl=timedelta(seconds=CONTEXT_CACHE_TTL_SECONDS)
+                    )
+                except Exception as e:
+                    error_type, _ = classify_exception(e)
+                    if error_type == ERROR_PERMANENT:
+                        # Prompt below the minimum cache size or model without caching
+                        self._uncacheable.add(key)
+                    print(f"Gemini context cache unavailable for {model} ({error_type}): {e}")
+                    return None
+                entry = {
+                    'content': content,
+                    'expires_at': time.time() + CONTEXT_CACHE_TTL_SECONDS,
+                    'models': {}
+                }
+                self._contexts[key] = entry
+        
+        model_key = (temperature, max_tokens, schema_type)
+        if model_key not in entry['models']:
+            entry['models'][model_key] = genai.GenerativeModel.from_cached_content(
+                cached_content=entry['content'],
+                generation_config=self._generation_config(temperature, max_tokens, schema_type)
+            )
+        return entry['models'][model_key]
         
     async def analyze_image(
         self, 
@@ -18,94 +113,94 @@ class GeminiProvider(BaseProvider):
         prompt: str,
         model: str = "gemini-1.5-flash",
         temperature: float = 0.3,
-        max_tokens: int = 1000  # Increased for better responses
+        max_tokens: int = 1000,  # Increased for better responses
+        detail: str = DETAIL_LOW,
+        stop_keys: Optional[List[str]] = None,
+        analysis_type: Optional[str] = None
     ) -> AnalysisResult:
         start_time = time.time()
+        image_tokens = None
+        output_mode = gemini_output_mode(analysis_type)
         
         try:
-            # Initialize the model
-            generation_config = {
-                "temperature": temperature,
-                "max_output_tokens": max_tokens,
-                "response_mime_type": "application/json"
-            }
-            
-            model_instance = genai.GenerativeModel(
-                model_name=model,
-                generation_config=generation_config
-            )
+            schema_type = analysis_type if output_mode == MODE_SCHEMA else None
             
-            # Convert bytes to PIL Image
-            image = Image.open(io.BytesIO(image_data.image_bytes))
+            # Sized to the fewest image tiles for this detail level; Gemini decodes it server-side
+            image_bytes, plan = await self.prepare_image(image_data, model, detail)
+            image_tokens = plan.predicted_tokens if plan else None
+            image_part = {
+                "mime_type": detect_mime_type(image_bytes),
+                "data": image_bytes
+            }
             
-            # Prepare the prompt with context
-            full_prompt = f"""Camera: {image_data.camera_name}
-Time: {image_data.captured_at}
-
-{prompt}
+            # Static prompt first so calls share a cacheable prefix; per-image context last
+            static_prompt = f"""{prompt}
 
 Remember to respond with valid JSON only."""
+            image_context = f"Camera: {image_data.camera_name}\nTime: {image_data.captured_at}"
             
-            # Generate content
-            response = model_instance.generate_content([full_prompt, image])
-            
-            # Check if response was blocked or incomplete
-            if not response.text:
-                error_msg = "Empty response from Gemini"
-                if hasattr(response, 'prompt_feedback'):
-                    error_msg += f" - Prompt feedback: {response.prompt_feedback}"
-                raise Exception(error_msg)
+            model_instance = await self._get_cached_model(model, static_prompt, temperature, max_tokens, schema_type)
+            if model_instance is not None:
+                contents = [image_part, image_context]
+            else:
+                model_instance = self._get_model(model, temperature, max_tokens, schema_type)
+                contents = [static_prompt, image_part, image_context]
             
-            raw_response = response.text
+            decision_ms = None
+            stopped_early = False
+            if stop_keys is not None:
+                if output_mode == MODE_SCHEMA:
+                    stop_keys = [compact_key(key) for key in stop_keys]
+                parser, usage, decision_ms = await self._stream(
+                    model_instance, contents, stop_keys, start_time
+                )
+                raw_response = parser.text
+                stopped_early = decision_ms is not None
+                if not raw_response:
+                    raise Exception("Empty response from Gemini")
+            else:
+                # Generate content without blocking the event loop
+                response = await model_instance.generate_content_async(contents)
+                
+                # Check if response was blocked or incomplete
+                if not response.text:
+                    error_msg = "Empty response from Gemini"
+                    if hasattr(response, 'prompt_feedback'):
+                        error_msg += f" - Prompt feedback: {response.prompt_feedback}"
+                    raise Exception(error_msg)
+                
+                raw_response = response.text
+                usage = getattr(response, 'usage_metadata', None)
             print(f"Gemini {model} raw response: {raw_response}")
             
             # Check if Gemini provides token usage info
             input_tokens = None
             output_tokens = None
-            if hasattr(response, 'usage_metadata'):
+            cached_tokens = None
+            if usage is not None:
                 # Gemini API may provide token counts
-                usage = response.usage_metadata
                 if hasattr(usage, 'prompt_token_count'):
                     input_tokens = usage.prompt_token_count
                 if hasattr(usage, 'candidates_token_count'):
                     output_tokens = usage.candidates_token_count
+                # Explicit context cache hits, or implicit prefix cache hits on newer models
+                cached_tokens = getattr(usage, 'cached_content_token_count', None) or None
                 tokens_used = (input_tokens or 0) + (output_tokens or 0)
-                print(f"Gemini token usage - Input: {input_tokens}, Output: {output_tokens}")
+                print(f"Gemini token usage - Input: {input_tokens} (cached: {cached_tokens}), Output: {output_tokens}")
             else:
                 # Fallback to estimation if no usage metadata
-                tokens_used = len(full_prompt.split()) + len(raw_response.split()) * 2
+                tokens_used = len(static_prompt.split()) + len(raw_response.split()) * 2
                 print(f"Gemini estimated tokens: {tokens_used}")
             
-            # Clean the response - remove markdown code blocks if present
-            cleaned_response = raw_response.strip()
-            if cleaned_response.startswith('```json'):
-                cleaned_response = cleaned_response[7:]  # Remove ```json
-            elif cleaned_response.startswith('```'):
-                cleaned_response = cleaned_response[3:]  # Remove ```
-            
-            if cleaned_response.endswith('```'):
-                cleaned_response = cleaned_response[:-3]  # Remove trailing ```
-            
-            cleaned_response = cleaned_response.strip()
-            
-            try:
-                parsed_data = json.loads(cleaned_response)
-                confidence = parsed_data.get('confidence', 0.5)
-            except json.JSONDecodeError:
-                # Try one more time with just extracting JSON from the response
-                import re
-                # Look for JSON object - match from first { to last }
-                json_match = re.search(r'\{.*\}', raw_response, re.DOTALL)
-                if json_match:
-                    try:
-                        parsed_data = json.loads(json_match.group())
-                        confidence = parsed_data.get('confidence', 0.5)
-                    except:
-                        parsed_data = {"error": "Failed to parse JSON response", "raw": raw_response}
-                        confidence = 0.0
-                else:
-                    parsed_data = {"error": "Failed to parse JSON response", "raw": raw_response}
-                    confidence = 0.0
+            # Shared parser: fences, surrounding prose and type coercion
+            if stop_keys is not None:
+                parsed = await parse_streamed(parser, analysis_type)
+            else:
+                parsed = await parse_response_async(raw_response, analysis_type)
+            parsed_data = parsed.data
+            confidence = parsed.confidence
+            error_type = parsed.error_type
+            if error_type:
                 print(f"Gemini JSON decode error. Raw response: {raw_response}")
                 
             processing_time_ms = int((time.time() - start_time) * 1000)
@@ -119,11 +214,18 @@ Remember to respond with valid JSON only."""
                 tokens_used=tokens_used,
                 processing_time_ms=processing_time_ms,
                 input_tokens=input_tokens,
-                output_tokens=output_tokens
+                output_tokens=output_tokens,
+                error_type=error_type,
+                image_tokens=image_tokens,
+                decision_ms=decision_ms,
+                stopped_early=stopped_early,
+                output_mode=output_mode,
+                cached_tokens=cached_tokens
             )
             
         except Exception as e:
             processing_time_ms = int((time.time() - start_time) * 1000)
+            error_type, retry_after = classify_exception(e)
             return AnalysisResult(
                 provider="gemini",
                 model=model,
@@ -132,9 +234,46 @@ Remember to respond with valid JSON only."""
                 confidence=0.0,
                 tokens_used=0,
                 processing_time_ms=processing_time_ms,
-                error=str(e)
+                error=str(e),
+                error_type=error_type,
+                retry_after=retry_after,
+                image_tokens=image_tokens,
+                output_mode=output_mode
             )
     
+    async def _stream(
+        self,
+        model_instance: genai.GenerativeModel,
+        contents: List[Any],
+        stop_keys: List[str],
+        start_time: float
+    ) -> Tuple[StreamingJSONParser, Any, Optional[int]]:
+        """Stream a generation, stopping once every stop key has been parsed"""
+        parser = StreamingJSONParser(stop_keys)
+        usage = None
+        decision_ms = None
+        response = await model_instance.generate_content_async(contents, stream=True)
+        # The SDK offers no public way to cancel a stream: stopping early saves latency,
+        # but Gemini may still generate (and bill) the rest of the response
+        chunks = response.__aiter__()
+        try:
+            async for chunk in chunks:
+                # Usage metadata on each chunk is cumulative
+                usage = getattr(chunk, 'usage_metadata', None) or usage
+                try:
+                    text = chunk.text
+                except ValueError:
+                    # Chunk without text parts (e.g. safety metadata only)
+                    continue
+                parser.feed(text)
+                if parser.complete:
+                    decision_ms = int((time.time() - start_time) * 1000)
+                    break
+        finally:
+            # Close the generator over the stream so nothing keeps reading it
+            await chunks.aclose()
+        return parser, usage, decision_ms
+    
     def get_supported_models(self) -> List[str]:
         return [
             "gemini-1.5-flash",
@@ -144,7 +283,7 @@ Remember to respond with valid JSON only."""
             "gemini-pro-vision"
         ]
     
-    def estimate_cost(self, tokens_used: int, model: str) -> float:
+    def estimate_cost(self, tokens_used: int, model: str, cached_tokens: int = 0) -> float:
         # Gemini pricing (official 2024 rates per 1M tokens)
         cost_per_1k_tokens = {
             "gemini-1.5-flash": 0.00025,     # $0.10 input + $0.40 output average = $0.25 per 1M
@@ -154,5 +293,13 @@ Remember to respond with valid JSON only."""
             "gemini-pro-vision": 0.00125     # Legacy model pricing
         }
         
+        # Cached input is billed at a quarter of the input rate
+        cached_savings_per_1k_tokens = {
+            "gemini-1.5-flash": 0.00005625,  # $0.075 input vs $0.01875 cached per 1M
+            "gemini-1.5-pro": 0.0009375,     # $1.25 input vs $0.3125 cached per 1M
+            "gemini-2.5-pro": 0.0009375      # $1.25 input vs $0.31 cached per 1M
+        }
+        
         rate = cost_per_1k_tokens.get(model, 0.00125)
-        return (tokens_used / 1000) * rate
\ No newline at end of file
+        savings = cached_savings_per_1k_tokens.get(model, 0.0)
+        return max(0.0, (tokens_used / 1000) * rate - ((cached_tokens or 0) / 1000) * savings)
\ No newline at end of file
@@ -0,0 +1,205 @@
+import math
+from dataclasses import dataclass
+from typing import Dict, Optional, Tuple
+from .image_resize import ImageProfile
+
+
+DETAIL_LOW = 'low'
+DETAIL_HIGH = 'high'
+
+
+@dataclass(frozen=True)
+class ImageGeometry:
+    """How a model turns image pixels into prompt tokens"""
+    base_tokens: int
+    tile_tokens: int
+    tile_size: int  # 0 = flat cost per image regardless of size
+    fit_side: int  # Provider first scales the image to fit within fit_side x fit_side
+    short_side: int  # ...then so the short side is at most this (0 = no such step)
+    low_side: int  # Longer side to send for low detail
+    low_tokens: int
+    high_short_side: int = 768  # Short side that high detail needs to resolve small objects
+    low_max_bytes: int = 25 * 1024
+    high_max_bytes: int = 300 * 1024
+    pixels_per_token: int = 0  # Area-priced images: tokens = width * height / pixels_per_token
+
+
+# OpenAI: high detail is 512px tiles after fitting 2048 and scaling the short side to 768
+_OPENAI_GPT4O = ImageGeometry(
+    base_tokens=85, tile_tokens=170, tile_size=512, fit_side=2048, short_side=768,
+    low_side=512, low_tokens=85
+)
+_OPENAI_GPT4O_MINI = ImageGeometry(
+    base_tokens=2833, tile_tokens=5667, tile_size=512, fit_side=2048, short_side=768,
+    low_side=512, low_tokens=2833
+)
+# Gemini 1.5 bills a flat 258 tokens per image, so low detail sends the high detail image
+_GEMINI_FLAT = ImageGeometry(
+    base_tokens=258, tile_tokens=0, tile_size=0, fit_side=3072, short_side=0,
+    low_side=768, low_tokens=258
+)
+# Gemini 2.x: 258 tokens if both sides <= 384, otherwise 258 per 768px tile; a single
+# 768px tile costs no more than a 384px image, so low detail sends one full tile
+_GEMINI_TILED = ImageGeometry(
+    base_tokens=0, tile_tokens=258, tile_size=768, fit_side=3072, short_side=0,
+    low_side=768, low_tokens=258, low_max_bytes=64 * 1024
+)
+
+# Claude: about width * height / 750 tokens, after fitting the long side to 1568
+_ANTHROPIC_AREA = ImageGeometry(
+    base_tokens=0, tile_tokens=0, tile_size=0, fit_side=1568, short_side=0,
+    low_side=512, low_tokens=350, pixels_per_token=750
+)
+
+# Self-hosted models: Qwen2-VL style 28x28 patches per token; a small image keeps CPU inference fast
+_LOCAL_PATCHES = ImageGeometry(
+    base_tokens=0, tile_tokens=0, tile_size=0, fit_side=1024, short_side=0,
+    low_side=448, low_tokens=256, high_short_side=448, pixels_per_token=784
+)
+
+IMAGE_GEOMETRY: Dict[str, ImageGeometry] = {
+    "openai/gpt-4o": _OPENAI_GPT4O,
+    "openai/gpt-4o-mini": _OPENAI_GPT4O_MINI,
+    "openai/gpt-4-turbo": _OPENAI_GPT4O,
+    "openai/gpt-4-vision-preview": _OPENAI_GPT4O,
+    "gemini/gemini-1.5-flash": _GEMINI_FLAT,
+    "gemini/gemini-1.5-pro": _GEMINI_FLAT,
+    "gemini/gemini-2.0-flash": _GEMINI_TILED,
+    "gemini/gemini-2.0-flash-exp": _GEMINI_TILED,
+    "gemini/gemini-2.5-pro": _GEMINI_TILED,
+}
+DEFAULT_GEOMETRY: Dict[str, ImageGeometry] = {
+    "openai": _OPENAI_GPT4O,
+    "gemini": _GEMINI_TILED,
+    "anthropic": _ANTHROPIC_AREA,
+    "local": _LOCAL_PATCHES,
+}
+
+# Largest share of a side we will crop away to save a row or column of tiles
+MAX_CROP_FRACTION = 0.08
+
+
+@dataclass(frozen=True)
+class ImagePlan:
+    """What to send for one request and what it should cost"""
+    detail: str
+    width: int
+    height: int
+    predicted_tokens: int
+    profile: ImageProfile
+
+
+def geometry_for(provider: str, model: str) -> Optional[ImageGeometry]:
+    return IMAGE_GEOMETRY.get(f"{provider}/{model}") or DEFAULT_GEOMETRY.get(provider)
+
+
+def _scale_to(width: int, height: int, long_side: int) -> Tuple[int, int]:
+    scale = min(1.0, long_side / max(width, height))
+    return max(1, int(width * scale)), max(1, int(height * scale))
+
+
+def provider_dimensions(geometry: ImageGeometry, width: int, height: int) -> Tuple[int, int]:
+    """Size the provider actually tokenizes after its own downscaling"""
+    width, height = _scale_to(width, height, geometry.fit_side)
+    if geometry.short_side and min(width, height) > geometry.short_side:
+        scale = geometry.short_side / min(width, height)
+        width, height = max(1, int(width * scale)), max(1, int(height * scale))
+    return width, height
+
+
+def image_tokens(geometry: ImageGeometry, width: int, height: int, detail: str = DETAIL_HIGH) -> int:
+    """Predicted prompt tokens for an image of this size"""
+    if geometry.pixels_per_token:
+        width, height = provider_dimensions(geometry, width, height)
+        return max(1, math.ceil(width * height / geometry.pixels_per_token))
+    if detail == DETAIL_LOW:
+        return geometry.low_tokens
+    if not geometry.tile_size:
+        return geometry.base_tokens
+    width, height = provider_dimensions(geometry, width, height)
+    if geometry.base_tokens == 0 and max(width, height) <= geometry.low_side:
+        return geometry.low_tokens
+    tiles = math.ceil(width / geometry.tile_size) * math.ceil(height / geometry.tile_size)
+    return geometry.base_tokens + geometry.tile_tokens * tiles
+
+
+def _trim(size: int, tile: int) -> int:
+    """Size after dropping a partial tile, if that partial tile is a thin enough sliver"""
+    remainder = size % tile
+    if size > tile and remainder and remainder <= size * MAX_CROP_FRACTION:
+        return size - remainder
+    return size
+
+
+def plan_image(provider: str, model: str, width: int, height: int, detail: str = DETAIL_LOW) -> Optional[ImagePlan]:
+    """Pick the resolution and crop that give the fewest image tokens at a detail level.
+
+    Low detail sends a small image at the model's fixed low-detail cost, or
+    the high detail image where pricing is flat per image. High detail sends
+    the smaller of what the provider would keep after its own downscaling and
+    what high detail needs (high_short_side), trimming thin edge strips when
+    that saves a whole row or column of tiles.
+    """
+    geometry = geometry_for(provider, model)
+    if geometry is None:
+        return None
+
+    flat = not geometry.tile_size and not geometry.pixels_per_token
+    if detail == DETAIL_LOW and not flat:
+        out_width, out_height = _scale_to(width, height, geometry.low_side)
+        return ImagePlan(
+            detail=detail,
+            width=out_width,
+            height=out_height,
+            predicted_tokens=image_tokens(geometry, out_width, out_height, detail),
+            profile=ImageProfile(
+                name=f"{provider}/{model}/{detail}",
+                max_side=geometry.low_side,
+                max_bytes=geometry.low_max_bytes
+            )
+        )
+
+    # Never send more than the provider keeps, nor more than high detail needs
+    out_width, out_height = provider_dimensions(geometry, width, height)
+    if min(out_width, out_height) > geometry.high_short_side:
+        scale = geometry.high_short_side / min(out_width, out_height)
+        out_width, out_height = max(1, int(out_width * scale)), max(1, int(out_height * scale))
+
+    if not geometry.tile_size:
+        return ImagePlan(
+            detail=detail,
+            width=out_width,
+            height=out_height,
+            predicted_tokens=image_tokens(geometry, out_width, out_height, detail),
+            profile=ImageProfile(
+                name=f"{provider}/{model}/{detail}",
+                max_side=max(out_width, out_height),
+                max_bytes=geometry.high_max_bytes
+            )
+        )
+
+    trimmed_width = _trim(out_width, geometry.tile_size)
+    trimmed_height = _trim(out_height, geometry.tile_size)
+
+    crop = None
+    if (trimmed_width, trimmed_height) != (out_width, out_height):
+        # Centered crop in source pixels; trail cam info bars sit on the edges anyway
+        crop_width = int(width * trimmed_width / out_width)
+        crop_height = int(height * trimmed_height / out_height)
+        left = (width - crop_width) // 2
+        top = (height - crop_height) // 2
+        crop = (left, top, left + crop_width, top + crop_height)
+        out_width, out_height = trimmed_width, trimmed_height
+
+    return ImagePlan(
+        detail=detail,
+        width=out_width,
+        height=out_height,
+        predicted_tokens=image_tokens(geometry, out_width, out_height, detail),
+        profile=ImageProfile(
+            name=f"{provider}/{model}/{detail}",
+            max_side=max(out_width, out_height),
+            max_bytes=geometry.high_max_bytes,
+            crop=crop
+        )
+    )
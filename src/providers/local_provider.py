@@ -0,0 +1,56 @@
+import openai
+from openai import AsyncOpenAI
+import httpx
+import os
+from typing import List, Optional
+from .openai_provider import OpenAIProvider
+from .output_schemas import STRUCTURED_OUTPUTS, MODE_SCHEMA, MODE_JSON, MODE_TEXT
+from .schemas import ANALYSIS_SCHEMAS
+
+
+# Self-hosted OpenAI-compatible server (llama.cpp, vLLM, Ollama, LM Studio, ...)
+LOCAL_LLM_BASE_URL = os.getenv('LOCAL_LLM_BASE_URL', 'http://localhost:8080/v1')
+LOCAL_LLM_MODEL = os.getenv('LOCAL_LLM_MODEL', 'local-vision')
+LOCAL_LLM_TIMEOUT_SECONDS = float(os.getenv('LOCAL_LLM_TIMEOUT_SECONDS', '180'))
+LOCAL_LLM_MAX_CONCURRENCY = int(os.getenv('LOCAL_LLM_MAX_CONCURRENCY', '2'))
+# Strongest output constraint the server honours: json_schema, json_object or text
+LOCAL_LLM_OUTPUT_MODE = os.getenv('LOCAL_LLM_OUTPUT_MODE', MODE_JSON)
+
+
+class LocalProvider(OpenAIProvider):
+    """On-prem vision model behind an OpenAI-compatible chat completions API.
+
+    Reuses OpenAIProvider's message building, streaming and parsing; only the
+    endpoint, timeout, connection pool and output mode differ. Calls cost
+    nothing per token.
+    """
+    name = 'local'
+    request_timeout = LOCAL_LLM_TIMEOUT_SECONDS
+
+    def _create_client(self, api_key: str) -> AsyncOpenAI:
+        return AsyncOpenAI(
+            api_key=api_key,
+            base_url=LOCAL_LLM_BASE_URL,
+            timeout=LOCAL_LLM_TIMEOUT_SECONDS,
+            # A busy CPU box answers slowly rather than failing; don't pile retries on it
+            max_retries=0,
+            http_client=openai.DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=LOCAL_LLM_MAX_CONCURRENCY,
+                    max_keepalive_connections=LOCAL_LLM_MAX_CONCURRENCY
+                )
+            )
+        )
+
+    def output_mode(self, model: str, analysis_type: Optional[str]) -> str:
+        if LOCAL_LLM_OUTPUT_MODE == MODE_SCHEMA:
+            return MODE_SCHEMA if STRUCTURED_OUTPUTS and analysis_type in ANALYSIS_SCHEMAS else MODE_JSON
+        if LOCAL_LLM_OUTPUT_MODE == MODE_TEXT:
+            return MODE_TEXT
+        return MODE_JSON
+
+    def get_supported_models(self) -> List[str]:
+        return [LOCAL_LLM_MODEL]
+
+    def estimate_cost(self, tokens_used: int, model: str, cached_tokens: int = 0) -> float:
+        return 0.0
@@ -1,15 +1,26 @@
 import openai
 from openai import AsyncOpenAI
-import json
 import time
-from typing import Dict, Any, List
-from .base import BaseProvider, AnalysisResult, ImageData
+from typing import Dict, Any, List, Optional, Tuple
+from .base import BaseProvider, AnalysisResult, ImageData, detect_mime_type
+from .image_profiles import DETAIL_LOW
+from .errors import classify_exception
+from .response_parser import parse_response_async, parse_streamed, StreamingJSONParser
+from .output_schemas import MODE_SCHEMA, compact_key, openai_output_mode, openai_response_format
+
+
+SYSTEM_PROMPT = "You are an AI assistant analyzing ranch camera images. Always respond with valid JSON."
 
 
 class OpenAIProvider(BaseProvider):
+    name = 'openai'
+    
     def __init__(self, api_key: str):
         super().__init__(api_key)
-        self.client = AsyncOpenAI(api_key=api_key)
+        self.client = self._create_client(api_key)
+    
+    def _create_client(self, api_key: str) -> AsyncOpenAI:
+        return AsyncOpenAI(api_key=api_key)
         
     async def analyze_image(
         self, 
@@ -17,38 +28,50 @@ class OpenAIProvider(BaseProvider):
         prompt: str,
         model: str = "gpt-4o-mini",
         temperature: float = 0.3,
-        max_tokens: int = 500
+        max_tokens: int = 500,
+        detail: str = DETAIL_LOW,
+        stop_keys: Optional[List[str]] = None,
+        analysis_type: Optional[str] = None
     ) -> AnalysisResult:
         start_time = time.time()
+        image_tokens = None
+        output_mode = self.output_mode(model, analysis_type)
         
         try:
-            base64_image = self.encode_image(image_data.image_bytes)
-            print(f"Image encoded successfully. Base64 length: {len(base64_image)}")
+            # Sized to the fewest tiles for this detail level; cached across calls
+            image_bytes, encoded, plan = await self.prepare_image_base64(image_data, model, detail)
+            image_tokens = plan.predicted_tokens if plan else None
+            image_url = f"data:{detect_mime_type(image_bytes)};base64,{encoded}"
             
+            # Static content first so repeated calls share a cacheable prefix;
+            # the image and the camera/time header change on every call
             messages = [
                 {
                     "role": "system",
-                    "content": "You are an AI assistant analyzing ranch camera images. Always respond with valid JSON."
+                    "content": SYSTEM_PROMPT
                 },
                 {
                     "role": "user",
                     "content": [
                         {
                             "type": "text",
-                            "text": f"Camera: {image_data.camera_name}\nTime: {image_data.captured_at}\n\n{prompt}"
+                            "text": prompt
                         },
                         {
                             "type": "image_url",
                             "image_url": {
-                                "url": f"data:image/jpeg;base64,{base64_image}",
-                                "detail": "low"  # Use low detail for 25KB images
+                                "url": image_url,
+                                "detail": detail
                             }
+                        },
+                        {
+                            "type": "text",
+                            "text": f"Camera: {image_data.camera_name}\nTime: {image_data.captured_at}"
                         }
                     ]
                 }
             ]
             
-            # Only use json mode for models that support it
             create_params = {
                 "model": model,
                 "messages": messages,
@@ -56,60 +79,56 @@ class OpenAIProvider(BaseProvider):
                 "max_tokens": max_tokens
             }
             
-            # Add JSON mode only for supported models
-            if model in ["gpt-4-turbo-preview", "gpt-4-turbo", "gpt-4o", "gpt-4o-2024-05-13"]:
-                create_params["response_format"] = {"type": "json_object"}
-            
-            response = await self.client.chat.completions.create(**create_params)
+            # Enforced schema where the model supports it, else JSON mode, else prompt-only JSON
+            response_format = openai_response_format(output_mode, analysis_type)
+            if response_format:
+                create_params["response_format"] = response_format
             
-            raw_response = response.choices[0].message.content
+            decision_ms = None
+            stopped_early = False
+            if stop_keys is not None:
+                if output_mode == MODE_SCHEMA:
+                    stop_keys = [compact_key(key) for key in stop_keys]
+                parser, usage, decision_ms = await self._stream(create_params, stop_keys, start_time)
+                raw_response = parser.text
+                stopped_early = not parser.finished
+                parsed = await parse_streamed(parser, analysis_type)
+            else:
+                response = await self.client.chat.completions.create(**create_params)
+                raw_response = response.choices[0].message.content
+                usage = response.usage
+                parsed = await parse_response_async(raw_response, analysis_type)
             
             # Capture detailed token usage
-            tokens_used = response.usage.total_tokens
-            input_tokens = response.usage.prompt_tokens
-            output_tokens = response.usage.completion_tokens
+            cached_tokens = None
+            if usage is not None:
+                tokens_used = usage.total_tokens
+                input_tokens = usage.prompt_tokens
+                output_tokens = usage.completion_tokens
+                # Prompt caching applies automatically to prefixes of 1024+ tokens
+                details = getattr(usage, 'prompt_tokens_details', None)
+                cached_tokens = getattr(details, 'cached_tokens', None)
+            else:
+                # Stream cut before the usage chunk; estimate from what was sent and received
+                input_tokens = len(prompt) // 4 + (image_tokens or 0)
+                output_tokens = max(1, len(raw_response) // 4)
+                tokens_used = input_tokens + output_tokens
             
-            print(f"OpenAI token usage - Input: {input_tokens}, Output: {output_tokens}, Total: {tokens_used}")
+            print(f"OpenAI token usage - Input: {input_tokens} (cached: {cached_tokens}), Output: {output_tokens}, Total: {tokens_used}")
             
             # Log the response for debugging
             print(f"OpenAI raw response: {raw_response[:500]}...")
             
-            # Clean the response - remove markdown code blocks if present
-            cleaned_response = raw_response.strip()
-            if cleaned_response.startswith('```json'):
-                cleaned_response = cleaned_response[7:]  # Remove ```json
-            elif cleaned_response.startswith('```'):
-                cleaned_response = cleaned_response[3:]  # Remove ```
-            
-            if cleaned_response.endswith('```'):
-                cleaned_response = cleaned_response[:-3]  # Remove trailing ```
-            
-            cleaned_response = cleaned_response.strip()
-            
-            try:
-                parsed_data = json.loads(cleaned_response)
-                confidence = parsed_data.get('confidence', 0.5)
-            except json.JSONDecodeError:
-                # Try one more time with just extracting JSON from the response
-                import re
-                # Look for JSON object - match from first { to last }
-                json_match = re.search(r'\{.*\}', raw_response, re.DOTALL)
-                if json_match:
-                    try:
-                        parsed_data = json.loads(json_match.group())
-                        confidence = parsed_data.get('confidence', 0.5)
-                    except:
-                        parsed_data = {"error": "Failed to parse JSON response", "raw": raw_response}
-                        confidence = 0.0
-                else:
-                    parsed_data = {"error": "Failed to parse JSON response", "raw": raw_response}
-                    confidence = 0.0
+            parsed_data = parsed.data
+            confidence = parsed.confidence
+            error_type = parsed.error_type
+            if error_type:
                 print(f"JSON decode error. Raw response: {raw_response}")
                 
             processing_time_ms = int((time.time() - start_time) * 1000)
             
             return AnalysisResult(
-                provider="openai",
+                provider=self.name,
                 model=model,
                 raw_response=raw_response,
                 parsed_data=parsed_data,
@@ -117,25 +136,69 @@ class OpenAIProvider(BaseProvider):
                 tokens_used=tokens_used,
                 processing_time_ms=processing_time_ms,
                 input_tokens=input_tokens,
-                output_tokens=output_tokens
+                output_tokens=output_tokens,
+                error_type=error_type,
+                image_tokens=image_tokens,
+                decision_ms=decision_ms,
+                stopped_early=stopped_early,
+                output_mode=output_mode,
+                cached_tokens=cached_tokens
             )
             
         except Exception as e:
             processing_time_ms = int((time.time() - start_time) * 1000)
             error_msg = f"OpenAI API Error: {str(e)}"
-            print(f"Error in OpenAI provider: {error_msg}")
+            error_type, retry_after = classify_exception(e)
+            print(f"Error in OpenAI provider ({error_type}): {error_msg}")
             
             return AnalysisResult(
-                provider="openai",
+                provider=self.name,
                 model=model,
                 raw_response=error_msg,
                 parsed_data={"error": error_msg},
                 confidence=0.0,
                 tokens_used=0,
                 processing_time_ms=processing_time_ms,
-                error=error_msg
+                error=error_msg,
+                error_type=error_type,
+                retry_after=retry_after,
+                image_tokens=image_tokens,
+                output_mode=output_mode
             )
     
+    def output_mode(self, model: str, analysis_type: Optional[str]) -> str:
+        return openai_output_mode(model, analysis_type)
+    
+    async def _stream(
+        self,
+        create_params: Dict[str, Any],
+        stop_keys: List[str],
+        start_time: float
+    ) -> Tuple[StreamingJSONParser, Any, Optional[int]]:
+        """Stream a completion, stopping once every stop key has been parsed"""
+        parser = StreamingJSONParser(stop_keys)
+        usage = None
+        decision_ms = None
+        stream = await self.client.chat.completions.create(
+            **create_params,
+            stream=True,
+            stream_options={"include_usage": True}
+        )
+        try:
+            async for chunk in stream:
+                if chunk.usage is not None:
+                    usage = chunk.usage
+                if not chunk.choices or not chunk.choices[0].delta.content:
+                    continue
+                parser.feed(chunk.choices[0].delta.content)
+                if parser.complete:
+                    decision_ms = int((time.time() - start_time) * 1000)
+                    break
+        finally:
+            # Closing the stream early stops generation, and billing, of the remaining tokens
+            await stream.close()
+        return parser, usage, decision_ms
+    
     def get_supported_models(self) -> List[str]:
         return [
             "gpt-4o",
@@ -144,7 +207,7 @@ class OpenAIProvider(BaseProvider):
             "gpt-4-vision-preview"
         ]
     
-    def estimate_cost(self, tokens_used: int, model: str) -> float:
+    def estimate_cost(self, tokens_used: int, model: str, cached_tokens: int = 0) -> float:
         # OpenAI pricing (official 2024 rates - average of input/output per 1M tokens)
         cost_per_1k_tokens = {
             "gpt-4o": 0.010,           # $5.00 input + $15.00 output average = $10.00 per 1M
@@ -153,5 +216,12 @@ class OpenAIProvider(BaseProvider):
             "gpt-4-vision-preview": 0.03  # Legacy pricing
         }
         
+        # Cached input is billed at half the input rate
+        cached_savings_per_1k_tokens = {
+            "gpt-4o": 0.00125,         # $2.50 input vs $1.25 cached per 1M
+            "gpt-4o-mini": 0.000075    # $0.15 input vs $0.075 cached per 1M
+        }
+        
         rate = cost_per_1k_tokens.get(model, 0.03)
-        return (tokens_used / 1000) * rate
\ No newline at end of file
+        savings = cached_savings_per_1k_tokens.get(model, 0.0)
+        return max(0.0, (tokens_used / 1000) * rate - ((cached_tokens or 0) / 1000) * savings)
\ No newline at end of file
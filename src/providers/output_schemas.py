@@ -0,0 +1,225 @@
+import os
+from typing import Dict, Any, List, Optional, Tuple
+from .schemas import ANALYSIS_SCHEMAS, BOOL, UNIT, PERCENT, LEVEL, LIST, LEVELS
+
+
+# Set STRUCTURED_OUTPUTS=false to fall back to plain JSON mode everywhere
+STRUCTURED_OUTPUTS = os.getenv('STRUCTURED_OUTPUTS', 'true').lower() == 'true'
+
+# Output modes recorded on AnalysisResult.output_mode
+MODE_SCHEMA = 'json_schema'  # provider-enforced schema with compact keys
+MODE_JSON = 'json_object'    # any valid JSON object
+MODE_TEXT = 'text'           # free text; JSON comes from the prompt alone
+
+# Short output keys used in enforced schemas. Every generated key is billed as
+# output, so the answer uses these and is expanded back before validation.
+COMPACT_KEYS: Dict[str, str] = {
+    'gate_visible': 'gv',
+    'gate_open': 'go',
+    'door_visible': 'dv',
+    'door_open': 'do',
+    'opening_percentage': 'op',
+    'door_type': 'dt',
+    'water_visible': 'wv',
+    'water_level': 'wl',
+    'feeder_visible': 'fv',
+    'feed_level': 'fl',
+    'percentage_estimate': 'pct',
+    'animals_detected': 'ad',
+    'animals': 'an',
+    'confidence': 'c',
+    'reasoning': 'r',
+    'visual_evidence': 'ev',
+    'concerns': 'cn',
+}
+# Keys inside each entry of the animals list
+ANIMAL_KEYS: Dict[str, str] = {
+    'species': 'sp',
+    'count': 'n',
+    'type': 't',
+    'confidence': 'c',
+    'location': 'loc',
+    'behavior': 'bh',
+}
+_EXPAND = {short: full for full, short in COMPACT_KEYS.items()}
+_EXPAND_ANIMAL = {short: full for full, short in ANIMAL_KEYS.items()}
+
+# Descriptions the model sees in place of the prompt's long field names
+_DESCRIPTIONS = {
+    'opening_percentage': 'door_open_percent 0-100',
+    'door_type': 'barn door, regular door, sliding door, garage door or other',
+    'percentage_estimate': 'percent_full 0-100',
+    'confidence': 'confidence 0.0-1.0',
+    'reasoning': 'reasoning, one short sentence',
+    'visual_evidence': 'visual_evidence, a few words',
+    'concerns': 'concerns, null if none',
+}
+
+# OpenAI models with enforced json_schema output, and models limited to json_object
+_OPENAI_SCHEMA_PREFIXES = ('gpt-4o', 'gpt-4.1', 'gpt-5', 'o1', 'o3', 'o4')
+_OPENAI_SCHEMA_EXCLUDED = ('gpt-4o-2024-05-13',)
+_OPENAI_JSON_PREFIXES = ('gpt-4-turbo', 'gpt-4-1106', 'gpt-4-0125', 'gpt-3.5-turbo')
+
+
+def compact_key(key: str) -> str:
+    return COMPACT_KEYS.get(key, key)
+
+
+def expand_keys(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Map compact output keys back to the field names the rest of the pipeline uses"""
+    if not any(key in _EXPAND for key in data):
+        return data
+    expanded = {}
+    for key, value in data.items():
+        full = _EXPAND.get(key, key)
+        if full == 'animals' and isinstance(value, list):
+            value = [
+                {_EXPAND_ANIMAL.get(k, k): v for k, v in item.items()} if isinstance(item, dict) else item
+                for item in value
+            ]
+        expanded[full] = value
+    return expanded
+
+
+def _field_schema(field: str, kind: str) -> Dict[str, Any]:
+    """JSON Schema (OpenAI strict subset) for one field; every field is nullable"""
+    description = _DESCRIPTIONS.get(field, field)
+    if kind == BOOL:
+        return {'type': ['boolean', 'null'], 'description': description}
+    if kind == UNIT:
+        return {'type': ['number', 'null'], 'description': description}
+    if kind == PERCENT:
+        return {'type': ['integer', 'null'], 'description': description}
+    if kind == LEVEL:
+        return {'type': ['string', 'null'], 'enum': list(LEVELS) + [None], 'description': description}
+    if kind == LIST:
+        item = {
+            'type': 'object',
+            'properties': {
+                'sp': {'type': 'string', 'description': 'species'},
+                'n': {'type': 'integer', 'description': 'count'},
+                't': {'type': 'string', 'enum': ['livestock', 'wildlife', 'unknown'], 'description': 'type'},
+                'c': {'type': 'number', 'description': 'confidence 0.0-1.0'},
+                'loc': {'type': 'string', 'description': 'location in the image'},
+                'bh': {'type': 'string', 'description': 'behavior'},
+            },
+            'required': list(ANIMAL_KEYS.values()),
+            'additionalProperties': False
+        }
+        return {'type': 'array', 'items': item, 'description': description}
+    return {'type': ['string', 'null'], 'description': description}
+
+
+def _ordered_fields(analysis_type: str) -> List[Tuple[str, str]]:
+    """Decision fields first so streamed answers can stop early, then the rest"""
+    schema = ANALYSIS_SCHEMAS[analysis_type]
+    fields = schema['fields']
+    order = [key for key in schema['decision'] if key in fields]
+    order += [key for key in fields if key not in order]
+    return [(key, fields[key]) for key in order]
+
+
+def json_schema(analysis_type: Optional[str]) -> Optional[Dict[str, Any]]:
+    """Strict JSON Schema with compact keys for an analysis type; None for custom types"""
+    if analysis_type not in ANALYSIS_SCHEMAS:
+        return None
+    properties = {compact_key(key): _field_schema(key, kind) for key, kind in _ordered_fields(analysis_type)}
+    return {
+        'type': 'object',
+        'properties': properties,
+        # Strict mode requires every property; absent values come back as null
+        'required': list(properties),
+        'additionalProperties': False
+    }
+
+
+def _gemini_type(schema: Dict[str, Any]) -> Dict[str, Any]:
+    """Convert a JSON Schema node to Gemini's OpenAPI subset"""
+    types = schema['type'] if isinstance(schema['type'], list) else [schema['type']]
+    nullable = 'null' in types
+    converted: Dict[str, Any] = {'type': next(t for t in types if t != 'null').upper()}
+    if nullable:
+        converted['nullable'] = True
+    if 'description' in schema:
+        converted['description'] = schema['description']
+    if 'enum' in schema:
+        converted['format'] = 'enum'
+        converted['enum'] = [value for value in schema['enum'] if value is not None]
+    if 'properties' in schema:
+        converted['properties'] = {key: _gemini_type(value) for key, value in schema['properties'].items()}
+        converted['required'] = list(schema['required'])
+    if 'items' in schema:
+        converted['items'] = _gemini_type(schema['items'])
+    return converted
+
+
+def gemini_schema(analysis_type: Optional[str]) -> Optional[Dict[str, Any]]:
+    """The same schema as a Gemini response_schema; None for custom types"""
+    schema = json_schema(analysis_type)
+    return _gemini_type(schema) if schema else None
+
+
+def openai_output_mode(model: str, analysis_type: Optional[str]) -> str:
+    """The strongest structured-output mode this OpenAI model supports for the analysis type"""
+    if model.startswith(_OPENAI_SCHEMA_PREFIXES) and model not in _OPENAI_SCHEMA_EXCLUDED:
+        if STRUCTURED_OUTPUTS and analysis_type in ANALYSIS_SCHEMAS:
+            return MODE_SCHEMA
+        return MODE_JSON
+    if model.startswith(_OPENAI_JSON_PREFIXES) or model in _OPENAI_SCHEMA_EXCLUDED:
+        return MODE_JSON
+    return MODE_TEXT
+
+
+def openai_response_format(mode: str, analysis_type: Optional[str]) -> Optional[Dict[str, Any]]:
+    if mode == MODE_SCHEMA:
+        return {
+            'type': 'json_schema',
+            'json_schema': {'name': analysis_type, 'schema': json_schema(analysis_type), 'strict': True}
+        }
+    if mode == MODE_JSON:
+        return {'type': 'json_object'}
+    return None
+
+
+def gemini_output_mode(analysis_type: Optional[str]) -> str:
+    return MODE_SCHEMA if STRUCTURED_OUTPUTS and analysis_type in ANALYSIS_SCHEMAS else MODE_JSON
+
+
+def anthropic_output_mode(analysis_type: Optional[str]) -> str:
+    """Forced tool use carries the schema; without one the answer is prefilled text"""
+    return MODE_SCHEMA if STRUCTURED_OUTPUTS and analysis_type in ANALYSIS_SCHEMAS else MODE_TEXT
+
+
+class OutputModeStats:
+    """Parse failures per provider model and output mode, to compare schema vs plain JSON"""
+
+    def __init__(self):
+        self._counts: Dict[Tuple[str, str, str], Dict[str, int]] = {}
+
+    def record(self, provider: str, model: str, mode: Optional[str], parse_failed: bool, output_tokens: Optional[int]) -> None:
+        counts = self._counts.setdefault((provider, model, mode or MODE_TEXT), {
+            'calls': 0, 'parse_failures': 0, 'output_tokens': 0, 'token_samples': 0
+        })
+        counts['calls'] += 1
+        if parse_failed:
+            counts['parse_failures'] += 1
+        if output_tokens:
+            counts['output_tokens'] += output_tokens
+            counts['token_samples'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        modes = {}
+        for (provider, model, mode), counts in self._counts.items():
+            modes[f"{provider}/{model}/{mode}"] = {
+                'calls': counts['calls'],
+                'parse_failures': counts['parse_failures'],
+                'parse_failure_rate': round(counts['parse_failures'] / counts['calls'], 4),
+                'avg_output_tokens': (
+                    round(counts['output_tokens'] / counts['token_samples'], 1)
+                    if counts['token_samples'] else None
+                )
+            }
+        return {'structured_outputs': STRUCTURED_OUTPUTS, 'modes': modes}
+
+
+output_stats = OutputModeStats()
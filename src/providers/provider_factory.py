@@ -2,6 +2,8 @@ from typing import Optional
 from .base import BaseProvider
 from .openai_provider import OpenAIProvider
 from .gemini_provider import GeminiProvider
+from .anthropic_provider import AnthropicProvider
+from .local_provider import LocalProvider
 
 
 class ProviderFactory:
@@ -10,6 +12,8 @@ class ProviderFactory:
         providers = {
             "openai": OpenAIProvider,
             "gemini": GeminiProvider,
+            "anthropic": AnthropicProvider,
+            "local": LocalProvider,
         }
         
         provider_class = providers.get(provider_name.lower())
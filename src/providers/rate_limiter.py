@@ -0,0 +1,238 @@
+import asyncio
+import json
+import logging
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, Any, Iterable, Optional, Tuple
+from .errors import ERROR_RATE_LIMIT
+
+
+logger = logging.getLogger(__name__)
+
+
+# Default request/token budgets per (provider, model); override with PROVIDER_RATE_LIMITS
+# e.g. PROVIDER_RATE_LIMITS='{"openai/gpt-4o": {"rpm": 5000, "tpm": 800000, "max_concurrency": 32}}'
+DEFAULT_LIMITS: Dict[str, Dict[str, float]] = {
+    "openai/gpt-4o-mini": {"rpm": 500, "tpm": 200000, "max_concurrency": 16},
+    "openai/gpt-4o": {"rpm": 500, "tpm": 30000, "max_concurrency": 8},
+    "openai/gpt-4-turbo": {"rpm": 500, "tpm": 30000, "max_concurrency": 8},
+    "openai/gpt-4-vision-preview": {"rpm": 100, "tpm": 10000, "max_concurrency": 4},
+    "gemini/gemini-1.5-flash": {"rpm": 2000, "tpm": 4000000, "max_concurrency": 32},
+    "gemini/gemini-1.5-pro": {"rpm": 1000, "tpm": 4000000, "max_concurrency": 16},
+    "gemini/gemini-2.0-flash-exp": {"rpm": 10, "tpm": 4000000, "max_concurrency": 2},
+    "gemini/gemini-2.5-pro": {"rpm": 150, "tpm": 2000000, "max_concurrency": 8},
+    "anthropic/claude-3-5-haiku-20241022": {"rpm": 50, "tpm": 50000, "max_concurrency": 8},
+    "anthropic/claude-3-5-sonnet-20241022": {"rpm": 50, "tpm": 40000, "max_concurrency": 4},
+    "anthropic/claude-3-haiku-20240307": {"rpm": 50, "tpm": 50000, "max_concurrency": 8},
+    "anthropic/claude-3-opus-20240229": {"rpm": 50, "tpm": 20000, "max_concurrency": 2},
+}
+FALLBACK_LIMITS = {"rpm": 60, "tpm": 100000, "max_concurrency": 4}
+# Provider-wide defaults for models not listed above; the local server has no token
+# budget, only the concurrency its hardware can take
+PROVIDER_LIMITS: Dict[str, Dict[str, float]] = {
+    "local": {"rpm": 600, "tpm": 100000000, "max_concurrency": int(os.getenv('LOCAL_LLM_MAX_CONCURRENCY', '2'))},
+}
+
+# Per-image prompt cost used when the model's image geometry is unknown
+IMAGE_TOKEN_ESTIMATE = 300
+
+
+class TokenBucket:
+    """Token bucket refilled continuously at ``rate_per_minute``.
+
+    Callers wait in FIFO order until enough budget is available. Budget can be
+    refunded or charged after the fact with ``adjust`` once real usage is known.
+    """
+
+    def __init__(self, rate_per_minute: float, capacity: Optional[float] = None):
+        self.rate = rate_per_minute / 60.0
+        self.capacity = capacity or rate_per_minute
+        self.tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, amount: float = 1.0) -> None:
+        # A request larger than the whole bucket would never fit; let it drain the bucket instead
+        amount = min(amount, self.capacity)
+        async with self._lock:
+            self._refill()
+            while self.tokens < amount:
+                await asyncio.sleep((amount - self.tokens) / self.rate)
+                self._refill()
+            self.tokens -= amount
+
+    def adjust(self, delta: float) -> None:
+        """Charge (positive) or refund (negative) budget after the fact"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - delta)
+
+    def drain(self) -> None:
+        """Empty the bucket, e.g. after the provider reported a rate limit"""
+        self._refill()
+        self.tokens = min(self.tokens, 0.0)
+
+
+class AdaptiveConcurrencyLimiter:
+    """AIMD concurrency limit driven by latency and rate-limit signals.
+
+    Each success below the latency tolerance grows the limit by roughly one
+    request per window (additive increase). A 429 halves it, and latency well
+    above the observed baseline shrinks it gently (multiplicative decrease).
+    """
+
+    def __init__(
+        self,
+        max_limit: float,
+        initial_limit: Optional[float] = None,
+        min_limit: float = 1.0,
+        latency_tolerance: float = 2.0,
+        backoff_ratio: float = 0.5
+    ):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = initial_limit or max(min_limit, max_limit / 2)
+        self.latency_tolerance = latency_tolerance
+        self.backoff_ratio = backoff_ratio
+
+        self.in_flight = 0
+        self.latency_baseline_ms: Optional[float] = None
+        self._condition = asyncio.Condition()
+
+    async def acquire(self) -> None:
+        async with self._condition:
+            while self.in_flight >= int(self.limit):
+                await self._condition.wait()
+            self.in_flight += 1
+
+    async def release(self) -> None:
+        async with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    def on_success(self, latency_ms: float) -> None:
+        # Baseline tracks the fast end of observed latency and drifts up slowly
+        if self.latency_baseline_ms is None or latency_ms < self.latency_baseline_ms:
+            self.latency_baseline_ms = latency_ms
+        else:
+            self.latency_baseline_ms += (latency_ms - self.latency_baseline_ms) * 0.01
+
+        if latency_ms > self.latency_baseline_ms * self.latency_tolerance:
+            self.limit = max(self.min_limit, self.limit * 0.9)
+        else:
+            self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+
+    def on_rate_limited(self) -> None:
+        self.limit = max(self.min_limit, self.limit * self.backoff_ratio)
+
+
+class ProviderLimiter:
+    """Combined RPM/TPM token buckets and adaptive concurrency for one provider model"""
+
+    def __init__(self, provider: str, model: str, rpm: float, tpm: float, max_concurrency: float):
+        self.provider = provider
+        self.model = model
+        self.requests = TokenBucket(rpm)
+        self.tokens = TokenBucket(tpm)
+        self.concurrency = AdaptiveConcurrencyLimiter(max_concurrency)
+        self.blocked_until = 0.0
+
+        self.total_requests = 0
+        self.rate_limited = 0
+
+    def estimate_tokens(self, prompt: str, max_tokens: int, image_tokens: Optional[int] = None) -> int:
+        # Providers budget TPM against max_tokens, not the eventual output size
+        return len(prompt) // 4 + (image_tokens or IMAGE_TOKEN_ESTIMATE) + max_tokens
+
+    @asynccontextmanager
+    async def slot(self, estimated_tokens: int):
+        """Wait for request, token and concurrency budget, then hold a slot"""
+        # Honour a provider Retry-After before queueing for budget
+        delay = self.blocked_until - time.monotonic()
+        if delay > 0:
+            await asyncio.sleep(delay)
+
+        await self.requests.acquire(1)
+        await self.tokens.acquire(estimated_tokens)
+        await self.concurrency.acquire()
+        try:
+            yield
+        finally:
+            await self.concurrency.release()
+
+    def record(self, result, estimated_tokens: int) -> None:
+        """Feed the outcome of a call back into the limits"""
+        self.total_requests += 1
+        if result.error_type == ERROR_RATE_LIMIT:
+            self.rate_limited += 1
+            self.concurrency.on_rate_limited()
+            self.requests.drain()
+            if result.retry_after:
+                self.blocked_until = max(self.blocked_until, time.monotonic() + result.retry_after)
+            logger.warning(
+                f"{self.provider}/{self.model} rate limited; concurrency limit now {self.concurrency.limit:.1f}"
+            )
+            return
+
+        if result.error is None:
+            self.concurrency.on_success(result.processing_time_ms)
+        # Reconcile the token budget with actual usage
+        self.tokens.adjust((result.tokens_used or 0) - estimated_tokens)
+
+    def record_cancelled(self) -> None:
+        """A call abandoned mid-flight; it keeps its estimated token charge"""
+        self.total_requests += 1
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'concurrency_limit': round(self.concurrency.limit, 2),
+            'in_flight': self.concurrency.in_flight,
+            'latency_baseline_ms': self.concurrency.latency_baseline_ms,
+            'request_budget': round(self.requests.tokens, 1),
+            'token_budget': round(self.tokens.tokens),
+            'total_requests': self.total_requests,
+            'rate_limited': self.rate_limited
+        }
+
+
+class RateLimiterRegistry:
+    """Lazily creates one ProviderLimiter per (provider, model)"""
+
+    def __init__(self):
+        self.limits = dict(DEFAULT_LIMITS)
+        overrides = os.getenv('PROVIDER_RATE_LIMITS')
+        if overrides:
+            try:
+                for key, values in json.loads(overrides).items():
+                    self.limits[key] = {**self.limits.get(key, FALLBACK_LIMITS), **values}
+            except (ValueError, AttributeError) as e:
+                logger.error(f"Ignoring invalid PROVIDER_RATE_LIMITS: {e}")
+        self._limiters: Dict[Tuple[str, str], ProviderLimiter] = {}
+
+    def get(self, provider: str, model: str) -> ProviderLimiter:
+        key = (provider, model)
+        if key not in self._limiters:
+            limits = self.limits.get(f"{provider}/{model}") or PROVIDER_LIMITS.get(provider, FALLBACK_LIMITS)
+            self._limiters[key] = ProviderLimiter(
+                provider,
+                model,
+                rpm=limits['rpm'],
+                tpm=limits['tpm'],
+                max_concurrency=limits['max_concurrency']
+            )
+        return self._limiters[key]
+
+    def ceiling(self, models: Iterable[Tuple[str, str]]) -> int:
+        """Most calls these models can have in flight together"""
+        return int(sum(self.get(provider, model).concurrency.max_limit for provider, model in set(models)))
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            f"{provider}/{model}": limiter.stats()
+            for (provider, model), limiter in self._limiters.items()
+        }
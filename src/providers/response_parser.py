@@ -0,0 +1,270 @@
+import json
+import re
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Iterator, Optional, Tuple
+from .base import AnalysisResult
+from .cpu_pool import cpu_pool, PROCESS_OFFLOAD_BYTES
+from .errors import ERROR_PARSE
+from .schemas import coerce
+from .output_schemas import expand_keys
+
+try:
+    import orjson
+
+    def _loads(text: str) -> Any:
+        return orjson.loads(text)
+
+    _DECODE_ERRORS = (orjson.JSONDecodeError, ValueError)
+except ImportError:  # orjson is optional; the stdlib decoder gives the same results, just slower
+    _loads = json.loads
+    _DECODE_ERRORS = (ValueError,)
+
+
+DEFAULT_CONFIDENCE = 0.5
+
+
+@dataclass
+class ParsedResponse:
+    data: Dict[str, Any]
+    confidence: float
+    error_type: Optional[str] = None
+    problems: List[str] = field(default_factory=list)
+
+
+def strip_fences(text: str) -> str:
+    """Remove a surrounding ```json ... ``` markdown fence"""
+    text = text.strip()
+    if text.startswith('```'):
+        text = text[3:]
+        if text[:4].lower() == 'json':
+            text = text[4:]
+    if text.endswith('```'):
+        text = text[:-3]
+    return text.strip()
+
+
+# Only these characters change scanner state; everything between them is skipped in C
+_STRUCTURAL = re.compile(r'[{}"\\]')
+
+
+def iter_json_objects(text: str) -> Iterator[str]:
+    """Yield each top-level balanced {...} span in order, in a single linear scan.
+
+    Braces inside JSON strings (and escaped quotes within them) are ignored,
+    so prose around the object or braces in "reasoning" text don't break it.
+    """
+    depth = 0
+    start = -1
+    in_string = False
+    escaped_at = -1
+    for match in _STRUCTURAL.finditer(text):
+        index = match.start()
+        char = text[index]
+        if in_string:
+            if index == escaped_at:
+                continue
+            if char == '\\':
+                escaped_at = index + 1
+            elif char == '"':
+                in_string = False
+        elif char == '"':
+            if depth:
+                in_string = True
+        elif char == '{':
+            if depth == 0:
+                start = index
+            depth += 1
+        elif char == '}' and depth:
+            depth -= 1
+            if depth == 0:
+                yield text[start:index + 1]
+
+
+def iter_json_candidates(text: str) -> Iterator[Dict[str, Any]]:
+    """Decoded JSON objects in a model response: the whole (unfenced) text first, then embedded objects"""
+    cleaned = strip_fences(text)
+    try:
+        data = _loads(cleaned)
+        if isinstance(data, dict):
+            yield data
+            return
+    except _DECODE_ERRORS:
+        pass
+    for candidate in iter_json_objects(cleaned):
+        try:
+            data = _loads(candidate)
+        except _DECODE_ERRORS:
+            continue
+        if isinstance(data, dict):
+            yield data
+
+
+def extract_json(text: str) -> Optional[Dict[str, Any]]:
+    """Decode a model response as a JSON object, tolerating fences and surrounding prose"""
+    return next(iter_json_candidates(text), None)
+
+
+class StreamingJSONParser:
+    """Incremental parser for the top-level fields of a JSON object arriving in chunks.
+
+    Each top-level field is decoded as soon as its value is complete. Strings
+    and nested values finish at their closing quote or bracket; numbers,
+    booleans and null finish at the next comma. Once every stop key has
+    arrived, ``complete`` is true and the caller can stop the generation.
+    Leading prose and markdown fences before the opening brace are ignored.
+    """
+
+    def __init__(self, stop_keys: Optional[List[str]] = None):
+        self.stop_keys = set(stop_keys or [])
+        self.fields: Dict[str, Any] = {}
+        self._text = ''
+        self._pos = 0
+        self._depth = 0
+        self._in_string = False
+        self._escaped = False
+        self._state = 'start'  # start, key, colon, value, in_value, after, done
+        self._start = -1
+        self._key: Optional[str] = None
+
+    @property
+    def text(self) -> str:
+        return self._text
+
+    @property
+    def complete(self) -> bool:
+        return bool(self.stop_keys) and self.stop_keys.issubset(self.fields)
+
+    @property
+    def finished(self) -> bool:
+        return self._state == 'done'
+
+    def _emit(self, end: int, completed: List[Tuple[str, Any]]) -> None:
+        try:
+            value = _loads(self._text[self._start:end].strip())
+        except _DECODE_ERRORS:
+            value = None
+        else:
+            self.fields[self._key] = value
+            completed.append((self._key, value))
+        self._key = None
+
+    def feed(self, chunk: str) -> List[Tuple[str, Any]]:
+        """Consume a chunk and return the (key, value) fields it completed"""
+        completed: List[Tuple[str, Any]] = []
+        self._text += chunk
+        text = self._text
+        for index in range(self._pos, len(text)):
+            char = text[index]
+            state = self._state
+            if state == 'done':
+                break
+
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+                    if state == 'key' and self._depth == 1:
+                        self._key = _loads(text[self._start:index + 1])
+                        self._state = 'colon'
+                    elif state == 'in_value' and self._depth == 1:
+                        self._emit(index + 1, completed)
+                        self._state = 'after'
+                continue
+
+            if state == 'start':
+                if char == '{':
+                    self._depth = 1
+                    self._state = 'key'
+                continue
+
+            if char == '"':
+                self._in_string = True
+                if self._depth == 1 and state in ('key', 'value'):
+                    self._start = index
+                    self._state = 'key' if state == 'key' else 'in_value'
+            elif char in '{[':
+                if self._depth == 1 and state == 'value':
+                    self._start = index
+                    self._state = 'in_value'
+                self._depth += 1
+            elif char in '}]':
+                self._depth -= 1
+                if self._depth == 1 and state == 'in_value':
+                    self._emit(index + 1, completed)
+                    self._state = 'after'
+                elif self._depth == 0:
+                    if state == 'in_value':
+                        self._emit(index, completed)
+                    self._state = 'done'
+            elif self._depth == 1:
+                if char == ':' and state == 'colon':
+                    self._state = 'value'
+                elif char == ',':
+                    if state == 'in_value':
+                        self._emit(index, completed)
+                    self._state = 'key'
+                elif state == 'value' and not char.isspace():
+                    # Start of a number, true, false or null
+                    self._start = index
+                    self._state = 'in_value'
+        self._pos = len(text)
+        return completed
+
+
+async def parse_streamed(parser: StreamingJSONParser, analysis_type: Optional[str] = None) -> ParsedResponse:
+    """Parse a finished stream in full, or build the result from its fields if it stopped early"""
+    if parser.finished or not parser.fields:
+        return await parse_response_async(parser.text, analysis_type)
+    return _validated(dict(parser.fields), analysis_type)
+
+
+def _validated(data: Dict[str, Any], analysis_type: Optional[str]) -> ParsedResponse:
+    data, problems = coerce(analysis_type, expand_keys(data))
+    confidence = data.get('confidence')
+    if not isinstance(confidence, float):
+        confidence = DEFAULT_CONFIDENCE
+    # A response missing the decision field can't drive alerts or agreement
+    error_type = ERROR_PARSE if any(p.startswith('missing ') for p in problems) else None
+    return ParsedResponse(data=data, confidence=confidence, error_type=error_type, problems=problems)
+
+
+def parse_response(raw_response: str, analysis_type: Optional[str] = None) -> ParsedResponse:
+    """Decode, then coerce to the analysis-type schema (or just confidence without one).
+
+    When the response holds several objects, the first one that satisfies the
+    schema wins, e.g. an answer following an example object in the prose.
+    """
+    first = None
+    for data in iter_json_candidates(raw_response or ''):
+        parsed = _validated(data, analysis_type)
+        if parsed.error_type is None:
+            return parsed
+        first = first or parsed
+    if first is not None:
+        return first
+    return ParsedResponse(
+        data={"error": "Failed to parse JSON response", "raw": raw_response},
+        confidence=0.0,
+        error_type=ERROR_PARSE
+    )
+
+
+def apply_schema(result: AnalysisResult, analysis_type: Optional[str]) -> AnalysisResult:
+    """Validate a provider result against its config's analysis-type schema"""
+    if not analysis_type or result.error is not None or result.error_type is not None:
+        return result
+    parsed = _validated(result.parsed_data, analysis_type)
+    result.parsed_data = parsed.data
+    result.confidence = parsed.confidence
+    result.error_type = parsed.error_type
+    return result
+
+
+async def parse_response_async(raw_response: str, analysis_type: Optional[str] = None) -> ParsedResponse:
+    """parse_response, moved to a worker process for unusually long responses"""
+    if len(raw_response or '') <= PROCESS_OFFLOAD_BYTES:
+        return parse_response(raw_response, analysis_type)
+    return await cpu_pool.run_in_process(parse_response, raw_response, analysis_type)
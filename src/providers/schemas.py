@@ -0,0 +1,134 @@
+from typing import Dict, Any, List, Tuple
+
+
+# Field kinds understood by coerce()
+BOOL = 'bool'
+UNIT = 'unit'  # float in [0, 1]
+PERCENT = 'percent'  # int in [0, 100]
+LEVEL = 'level'  # FULL / ADEQUATE / LOW / EMPTY
+TEXT = 'text'
+LIST = 'list'
+
+LEVELS = ('FULL', 'ADEQUATE', 'LOW', 'EMPTY')
+
+# Expected fields per analysis type, matching the prompt templates.
+# 'required' keys must be present (null is allowed); other fields are coerced when present.
+# 'decision' keys are all alerting needs; streaming can stop once they have arrived.
+ANALYSIS_SCHEMAS: Dict[str, Dict[str, Any]] = {
+    'gate_detection': {
+        'required': ['gate_visible'],
+        'decision': ['gate_visible', 'gate_open', 'confidence'],
+        'fields': {'gate_visible': BOOL, 'gate_open': BOOL, 'confidence': UNIT,
+                   'reasoning': TEXT, 'visual_evidence': TEXT}
+    },
+    'door_detection': {
+        'required': ['door_visible'],
+        'decision': ['door_visible', 'door_open', 'confidence'],
+        'fields': {'door_visible': BOOL, 'door_open': BOOL, 'opening_percentage': PERCENT,
+                   'door_type': TEXT, 'confidence': UNIT, 'reasoning': TEXT, 'visual_evidence': TEXT}
+    },
+    'water_level': {
+        'required': ['water_level'],
+        'decision': ['water_level', 'percentage_estimate', 'confidence'],
+        'fields': {'water_visible': BOOL, 'water_level': LEVEL, 'percentage_estimate': PERCENT,
+                   'confidence': UNIT, 'reasoning': TEXT, 'visual_evidence': TEXT}
+    },
+    'feed_bin_status': {
+        'required': ['feed_level'],
+        'decision': ['feed_level', 'percentage_estimate', 'confidence'],
+        'fields': {'feeder_visible': BOOL, 'feed_level': LEVEL, 'percentage_estimate': PERCENT,
+                   'confidence': UNIT, 'reasoning': TEXT, 'visual_evidence': TEXT, 'concerns': TEXT}
+    },
+    'animal_detection': {
+        'required': ['animals_detected'],
+        'decision': ['animals_detected', 'animals', 'confidence'],
+        'fields': {'animals_detected': BOOL, 'animals': LIST, 'confidence': UNIT,
+                   'reasoning': TEXT, 'visual_evidence': TEXT}
+    },
+}
+ANALYSIS_SCHEMAS['feed_bin'] = ANALYSIS_SCHEMAS['feed_bin_status']
+
+# Applied to every response, including custom analysis types
+DEFAULT_FIELDS = {'confidence': UNIT}
+
+
+def decision_keys(analysis_type: str) -> List[str]:
+    schema = ANALYSIS_SCHEMAS.get(analysis_type)
+    return list(schema['decision']) if schema else ['confidence']
+
+
+_TRUE = {'true', 'yes', 'y', '1', 'open', 'visible'}
+_FALSE = {'false', 'no', 'n', '0', 'closed', 'not visible', 'none'}
+
+
+def _coerce_value(kind: str, value: Any) -> Any:
+    """Convert a model-provided value to the field kind; raises ValueError if impossible"""
+    if value is None:
+        return None
+    if kind == BOOL:
+        if isinstance(value, bool):
+            return value
+        if isinstance(value, (int, float)):
+            return bool(value)
+        text = str(value).strip().lower()
+        if text in _TRUE:
+            return True
+        if text in _FALSE:
+            return False
+        if text in ('null', 'n/a', 'unknown', ''):
+            return None
+        raise ValueError(f"not a boolean: {value!r}")
+    if kind == UNIT:
+        if isinstance(value, str):
+            text = value.strip().rstrip('%')
+            number = float(text)
+            if value.strip().endswith('%'):
+                number /= 100
+        else:
+            number = float(value)
+        # Models sometimes answer confidence on a 0-100 scale
+        if number > 1.0:
+            number /= 100
+        return max(0.0, min(1.0, number))
+    if kind == PERCENT:
+        if isinstance(value, str):
+            value = value.strip().rstrip('%')
+        return max(0, min(100, int(round(float(value)))))
+    if kind == LEVEL:
+        text = str(value).strip().upper()
+        if text in ('NULL', 'N/A', 'UNKNOWN', ''):
+            return None
+        if text not in LEVELS:
+            raise ValueError(f"not a level: {value!r}")
+        return text
+    if kind == TEXT:
+        return value if isinstance(value, str) else str(value)
+    if kind == LIST:
+        return value if isinstance(value, list) else [value]
+    return value
+
+
+def coerce(analysis_type: str, data: Dict[str, Any]) -> Tuple[Dict[str, Any], List[str]]:
+    """Coerce a parsed response to its analysis-type schema, in place.
+
+    Returns the data and a list of problems. Fields that cannot be coerced
+    are left as the model returned them and reported as problems.
+    """
+    schema = ANALYSIS_SCHEMAS.get(analysis_type)
+    fields = schema['fields'] if schema else DEFAULT_FIELDS
+    problems = []
+
+    if schema:
+        for key in schema['required']:
+            if key not in data:
+                problems.append(f"missing {key}")
+
+    for key, kind in fields.items():
+        if key not in data:
+            continue
+        try:
+            data[key] = _coerce_value(kind, data[key])
+        except (TypeError, ValueError) as e:
+            problems.append(f"{key}: {e}")
+
+    return data, problems
@@ -3,20 +3,91 @@ from typing import Dict, Any, List, Optional, Tuple
 from datetime import datetime
 import json
 import logging
+import os
+import socket
+import time
 import uuid
+from dataclasses import asdict
 from ..providers.base import BaseProvider, ImageData, AnalysisResult
 from ..providers.provider_factory import ProviderFactory
+from ..providers.errors import (
+    AnalysisError, classify_exception, RETRYABLE_ERRORS,
+    ERROR_RATE_LIMIT, ERROR_TIMEOUT, ERROR_TRANSIENT, ERROR_PARSE
+)
+from ..providers.rate_limiter import RateLimiterRegistry
+from ..providers.circuit_breaker import CircuitBreakerRegistry
+from ..providers.image_profiles import DETAIL_LOW, DETAIL_HIGH
+from ..providers.response_parser import apply_schema
+from ..providers.schemas import decision_keys
+from ..providers.output_schemas import output_stats
 from ..db.supabase_client import SupabaseClient
+from .retry_policy import RetryPolicy
+from .hedging import HedgePolicy
+from .escalation import DetailEscalation
+from .prefilter import FramePrefilter, DECISION_SKIP, DECISION_DOWNGRADE
+from .quality_gate import FrameQualityGate, ACTION_SKIP, ACTION_DEFER, ACTION_ROUTE
+from .bursts import BurstGrouper, Burst, MODE_MAX, animal_count
+from .sampling import AdaptiveSampler
+from .forecasting import LevelForecaster
 
 
 logger = logging.getLogger(__name__)
 
 
+# Outcomes that count against a provider's circuit breaker
+BREAKER_ERRORS = {ERROR_RATE_LIMIT, ERROR_TIMEOUT, ERROR_TRANSIENT}
+
+
 class AnalysisService:
-    def __init__(self, supabase_client: SupabaseClient):
+    def __init__(self, supabase_client: SupabaseClient, api_keys: Optional[Dict[str, str]] = None):
         self.supabase = supabase_client
         self.providers: Dict[str, BaseProvider] = {}
+        self.limiters = RateLimiterRegistry()
+        self.breakers = CircuitBreakerRegistry()
+        self.hedging = HedgePolicy()
+        self.escalation = DetailEscalation()
+        self.prefilter = FramePrefilter()
+        self.quality_gate = FrameQualityGate()
+        self.bursts = BurstGrouper(supabase_client)
+        self.sampler = AdaptiveSampler(supabase_client)
+        self.forecaster = LevelForecaster(supabase_client)
+        self.retry_policy = RetryPolicy()
+        self.request_timeout = float(os.getenv('REQUEST_TIMEOUT', '60'))
+        
+        # Keys for every provider, so failover can reach models the config didn't name
+        self.api_keys = api_keys or {
+            'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY'),
+            'ANTHROPIC_API_KEY': os.getenv('ANTHROPIC_API_KEY'),
+            'GEMINI_API_KEY': os.getenv('GEMINI_API_KEY'),
+            'LOCAL_API_KEY': os.getenv('LOCAL_API_KEY')
+        }
         
+        # Identity and lease length used when claiming tasks; leases are renewed well
+        # before they expire for as long as this service holds any
+        self.worker_id = f"{socket.gethostname()}-{os.getpid()}-{uuid.uuid4().hex[:6]}"
+        self.lease_seconds = float(os.getenv('TASK_LEASE_SECONDS', '300'))
+        self.heartbeat_interval = self.lease_seconds / 3
+        self._leases_held = 0
+        self._heartbeat: Optional[asyncio.Task] = None
+        
+    def _hold_lease(self) -> None:
+        self._leases_held += 1
+        if self._heartbeat is None or self._heartbeat.done():
+            self._heartbeat = asyncio.create_task(self._heartbeat_loop())
+    
+    def _drop_lease(self) -> None:
+        self._leases_held -= 1
+        if self._leases_held == 0 and self._heartbeat is not None:
+            self._heartbeat.cancel()
+            self._heartbeat = None
+    
+    async def _heartbeat_loop(self):
+        while True:
+            await asyncio.sleep(self.heartbeat_interval)
+            renewed = await self.supabase.renew_task_leases(self.worker_id, self.lease_seconds)
+            if renewed:
+                logger.debug(f"Renewed {renewed} task leases for {self.worker_id}")
+    
     def _get_provider(self, provider_name: str, api_key: str) -> BaseProvider:
         if provider_name not in self.providers:
             self.providers[provider_name] = ProviderFactory.create_provider(
@@ -25,6 +96,265 @@ class AnalysisService:
             )
         return self.providers[provider_name]
     
+    async def _call_model(
+        self,
+        provider_name: str,
+        api_key: str,
+        image_data: ImageData,
+        prompt: str,
+        model: str,
+        detail: str = DETAIL_LOW,
+        stop_keys: Optional[List[str]] = None,
+        analysis_type: Optional[str] = None
+    ) -> AnalysisResult:
+        """Call one model within its rate limits and the request timeout"""
+        provider = self._get_provider(provider_name, api_key)
+        
+        # Use appropriate max_tokens for the model
+        max_tokens = 1000 if provider_name == 'gemini' else 500
+        
+        limiter = self.limiters.get(provider_name, model)
+        estimated_tokens = limiter.estimate_tokens(
+            prompt,
+            max_tokens,
+            provider.predict_image_tokens(image_data, model, detail)
+        )
+        timeout = provider.request_timeout or self.request_timeout
+        try:
+            async with limiter.slot(estimated_tokens):
+                start_time = time.time()
+                try:
+                    result = await asyncio.wait_for(
+                        provider.analyze_image(
+                            image_data,
+                            prompt,
+                            model,
+                            max_tokens=max_tokens,
+                            detail=detail,
+                            stop_keys=stop_keys,
+                            analysis_type=analysis_type
+                        ),
+                        timeout=timeout
+                    )
+                except asyncio.TimeoutError:
+                    error_msg = f"{provider_name} request timed out after {timeout:.0f}s"
+                    result = AnalysisResult(
+                        provider=provider_name,
+                        model=model,
+                        raw_response=error_msg,
+                        parsed_data={"error": error_msg},
+                        confidence=0.0,
+                        tokens_used=0,
+                        processing_time_ms=int((time.time() - start_time) * 1000),
+                        error=error_msg,
+                        error_type=ERROR_TIMEOUT
+                    )
+        except asyncio.CancelledError:
+            # A hedge loser says nothing about the model, but must not keep a half-open probe slot
+            limiter.record_cancelled()
+            self.breakers.get(provider_name, model).release_probe()
+            raise
+        limiter.record(result, estimated_tokens)
+        if result.stopped_early:
+            logger.debug(
+                f"{provider_name}/{model} stopped after decision fields at {result.decision_ms} ms "
+                f"({result.output_tokens} output tokens)"
+            )
+        if result.error is None:
+            self.hedging.record_latency(provider_name, model, result.processing_time_ms)
+        self.breakers.get(provider_name, model).record(
+            result.error_type in BREAKER_ERRORS,
+            result.processing_time_ms
+        )
+        return result
+    
+    def _failover_target(self, provider_name: str, model: str) -> Optional[Tuple[str, str, str]]:
+        """First equivalent model on another provider that is configured and whose circuit is accepting calls"""
+        for target_provider, target_model in self.breakers.failover_for(provider_name, model):
+            api_key = self.api_keys.get(target_provider.upper() + '_API_KEY')
+            if api_key and self.breakers.get(target_provider, target_model).allow_request():
+                return target_provider, target_model, api_key
+        return None
+    
+    async def _run_model(
+        self,
+        provider_name: str,
+        api_key: str,
+        image_data: ImageData,
+        prompt: str,
+        model: str,
+        detail: str = DETAIL_LOW,
+        analysis_type: Optional[str] = None,
+        stop_keys: Optional[List[str]] = None
+    ) -> AnalysisResult:
+        """Run one model call, failing over while its circuit is open, and record usage"""
+        breaker = self.breakers.get(provider_name, model)
+        if not breaker.allow_request():
+            failover = self._failover_target(provider_name, model)
+            if not failover:
+                # Fail fast; the task is retried after the breaker's cool-down
+                error_msg = f"Circuit open for {provider_name}/{model} and no failover available"
+                return AnalysisResult(
+                    provider=provider_name,
+                    model=model,
+                    raw_response=error_msg,
+                    parsed_data={"error": error_msg},
+                    confidence=0.0,
+                    tokens_used=0,
+                    processing_time_ms=0,
+                    error=error_msg,
+                    error_type=ERROR_TRANSIENT,
+                    retry_after=breaker.remaining_open_seconds()
+                )
+            logger.warning(f"Circuit open for {provider_name}/{model}, failing over to {failover[0]}/{failover[1]}")
+            self.breakers.failovers += 1
+            provider_name, model, api_key = failover
+        
+        result = await self._call_model(
+            provider_name, api_key, image_data, prompt, model, detail, stop_keys, analysis_type
+        )
+        result = apply_schema(result, analysis_type)
+        if result.error is None:
+            output_stats.record(
+                result.provider, result.model, result.output_mode,
+                result.error_type == ERROR_PARSE, result.output_tokens
+            )
+            provider = self._get_provider(provider_name, api_key)
+            result.estimated_cost = provider.estimate_cost(result.tokens_used, model, result.cached_tokens or 0)
+            await self.supabase.update_cost_tracking(
+                result.provider,
+                result.model,
+                result.tokens_used,
+                result.estimated_cost
+            )
+        
+        return result
+    
+    def _stop_keys(self, config: Dict[str, Any]) -> Optional[List[str]]:
+        """Decision fields to stream for, when the config opts into stopping generation early"""
+        if not config.get('stream_early_stop'):
+            return None
+        return decision_keys(config.get('analysis_type'))
+    
+    async def _run_hedged(
+        self,
+        config: Dict[str, Any],
+        provider_name: str,
+        api_key: str,
+        image_data: ImageData,
+        prompt: str,
+        model: str
+    ) -> AnalysisResult:
+        """Run a model call, hedging with a duplicate if it outlasts the model's p90 latency.
+        
+        Only configs with hedge_requests set are hedged. The hedge goes to
+        hedge_provider/hedge_model when configured, otherwise to the same model.
+        The first successful answer wins and the other request is cancelled.
+        """
+        analysis_type = config.get('analysis_type')
+        stop_keys = self._stop_keys(config)
+        if not config.get('hedge_requests'):
+            return await self._run_model(
+                provider_name, api_key, image_data, prompt, model,
+                analysis_type=analysis_type, stop_keys=stop_keys
+            )
+        
+        self.hedging.requests += 1
+        primary = asyncio.create_task(
+            self._run_model(
+                provider_name, api_key, image_data, prompt, model,
+                analysis_type=analysis_type, stop_keys=stop_keys
+            )
+        )
+        
+        delay = self.hedging.hedge_delay(provider_name, model)
+        if delay is None:
+            return await primary
+        done, _ = await asyncio.wait({primary}, timeout=delay)
+        if done:
+            return primary.result()
+        
+        hedge_provider = config.get('hedge_provider') or provider_name
+        hedge_model = config.get('hedge_model') or model
+        hedge_key = api_key if hedge_provider == provider_name else self.api_keys.get(hedge_provider.upper() + '_API_KEY')
+        if not hedge_key or not self.hedging.try_acquire():
+            return await primary
+        
+        logger.info(f"Hedging {provider_name}/{model} after {delay:.1f}s with {hedge_provider}/{hedge_model}")
+        hedge = asyncio.create_task(
+            self._run_model(
+                hedge_provider, hedge_key, image_data, prompt, hedge_model,
+                analysis_type=analysis_type, stop_keys=stop_keys
+            )
+        )
+        
+        pending = {primary, hedge}
+        winner = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                # Prefer a successful answer; fall back to whichever finished last
+                for task in done:
+                    if task.exception() is not None:
+                        logger.warning(f"Hedged request failed: {task.exception()}")
+                        continue
+                    winner = task
+                    if task.result().error is None:
+                        break
+                if winner is not None and winner.result().error is None:
+                    break
+        finally:
+            # Also reached when this call itself is cancelled; don't leave either request running
+            for task in pending:
+                task.cancel()
+        
+        if winner is None:
+            raise primary.exception()
+        if winner is hedge:
+            self.hedging.hedge_wins += 1
+        return winner.result()
+    
+    async def _escalate_if_needed(
+        self,
+        config: Dict[str, Any],
+        provider_key: str,
+        image_data: ImageData,
+        prompt: str,
+        result: AnalysisResult,
+        session_id: Optional[str],
+        user_initiated: bool,
+        task_id: Optional[str]
+    ) -> AnalysisResult:
+        """Re-run a low-confidence low-detail answer at high detail, optionally on the ROI crop"""
+        if not self.escalation.should_escalate(config, image_data, result):
+            return result
+        
+        logger.info(
+            f"Escalating {result.provider}/{result.model} on {image_data.camera_name} to high detail "
+            f"(confidence {result.confidence:.2f} < {config.get('threshold', 0.8)})"
+        )
+        # The result may come from a failover provider, so look its key up by name
+        api_key = self.api_keys.get(result.provider.upper() + '_API_KEY') or provider_key
+        escalation_image = await self.escalation.crop_to_roi(image_data, config.get('escalation_roi'))
+        escalated = await self._run_model(
+            result.provider,
+            api_key,
+            escalation_image,
+            prompt,
+            result.model,
+            detail=DETAIL_HIGH,
+            analysis_type=config.get('analysis_type'),
+            stop_keys=self._stop_keys(config)
+        )
+        self.escalation.record(config, image_data.camera_name, escalated)
+        await self._save_analysis_log(
+            image_data, config, prompt, escalated,
+            session_id, user_initiated, task_id
+        )
+        
+        # Keep the low-detail answer if the escalation itself failed
+        return escalated if escalated.error is None else result
+    
     async def _save_analysis_log(
         self,
         image_data: ImageData,
@@ -58,6 +388,10 @@ class AnalysisService:
                 error_message=result.error,
                 processing_time_ms=result.processing_time_ms,
                 tokens_used=result.tokens_used,
+                input_tokens=result.input_tokens,
+                output_tokens=result.output_tokens,
+                cached_tokens=result.cached_tokens,
+                estimated_cost=result.estimated_cost,
                 config_id=config.get('id'),
                 task_id=task_id,
                 session_id=session_id,
@@ -81,22 +415,18 @@ class AnalysisService:
         task_id: Optional[str] = None
     ) -> Dict[str, Any]:
         
-        primary_provider = self._get_provider(
-            config['primary_provider'],
-            primary_provider_key
-        )
-        
         # Generate session ID if not provided (for grouping related analyses)
         if not session_id:
             session_id = str(uuid.uuid4())
         
-        # Run primary analysis with appropriate max_tokens for the model
-        max_tokens = 1000 if config['primary_provider'] == 'gemini' else 500
-        primary_result = await primary_provider.analyze_image(
+        # Run primary analysis
+        primary_result = await self._run_hedged(
+            config,
+            config['primary_provider'],
+            primary_provider_key,
             image_data,
             config['prompt_template'],
-            config['primary_model'],
-            max_tokens=max_tokens
+            config['primary_model']
         )
         
         # Save primary analysis log
@@ -104,6 +434,10 @@ class AnalysisService:
             image_data, config, config['prompt_template'], primary_result,
             session_id, user_initiated, task_id
         )
+        primary_result = await self._escalate_if_needed(
+            config, primary_provider_key, image_data, config['prompt_template'], primary_result,
+            session_id, user_initiated, task_id
+        )
         
         # If no secondary model configured, return primary result
         if not config.get('secondary_provider') or not secondary_provider_key:
@@ -116,17 +450,14 @@ class AnalysisService:
             }
         
         # Run secondary analysis
-        secondary_provider = self._get_provider(
+        secondary_result = await self._run_model(
             config['secondary_provider'],
-            secondary_provider_key
-        )
-        
-        secondary_max_tokens = 1000 if config['secondary_provider'] == 'gemini' else 500
-        secondary_result = await secondary_provider.analyze_image(
+            secondary_provider_key,
             image_data,
             config['prompt_template'],
             config['secondary_model'],
-            max_tokens=secondary_max_tokens
+            analysis_type=config.get('analysis_type'),
+            stop_keys=self._stop_keys(config)
         )
         
         # Save secondary analysis log
@@ -134,6 +465,10 @@ class AnalysisService:
             image_data, config, config['prompt_template'], secondary_result,
             session_id, user_initiated, task_id
         )
+        secondary_result = await self._escalate_if_needed(
+            config, secondary_provider_key, image_data, config['prompt_template'], secondary_result,
+            session_id, user_initiated, task_id
+        )
         
         # Check for agreement
         agreement = self._check_agreement(
@@ -153,23 +488,20 @@ class AnalysisService:
         
         # Disagreement - use tiebreaker if configured
         if config.get('tiebreaker_provider') and tiebreaker_provider_key:
-            tiebreaker_provider = self._get_provider(
-                config['tiebreaker_provider'],
-                tiebreaker_provider_key
-            )
-            
             tiebreaker_prompt = self._create_tiebreaker_prompt(
                 config['prompt_template'],
                 primary_result.parsed_data,
                 secondary_result.parsed_data
             )
             
-            tiebreaker_max_tokens = 1000 if config['tiebreaker_provider'] == 'gemini' else 500
-            tiebreaker_result = await tiebreaker_provider.analyze_image(
+            tiebreaker_result = await self._run_model(
+                config['tiebreaker_provider'],
+                tiebreaker_provider_key,
                 image_data,
                 tiebreaker_prompt,
                 config['tiebreaker_model'],
-                max_tokens=tiebreaker_max_tokens
+                analysis_type=config.get('analysis_type'),
+                stop_keys=self._stop_keys(config)
             )
             
             # Save tiebreaker analysis log
@@ -241,6 +573,11 @@ Please analyze the image independently and provide your assessment. Consider bot
         task_id: str,
         api_keys: Dict[str, str]
     ) -> bool:
+        task = None
+        burst = None
+        burst_lock = None
+        leased = False
+        completed = False
         try:
             # Get task details
             task = await self.supabase.get_analysis_task(task_id)
@@ -260,6 +597,32 @@ Please analyze the image independently and provide your assessment. Consider bot
                 logger.error(f"Image {task['image_id']} not found")
                 return False
             
+            # Claim the task under a lease; another worker may have taken it already
+            if not await self.supabase.claim_task(task_id, self.worker_id, self.lease_seconds):
+                logger.info(f"Task {task_id} already claimed by another worker")
+                return False
+            leased = True
+            self._hold_lease()
+            
+            # One frame of a camera's burst at a time in this worker; the first runs the
+            # burst and the frames queued behind it find their tasks already linked
+            burst_lock = self.bursts.lock_for(image_metadata['camera_name'], config)
+            if burst_lock:
+                await burst_lock.acquire()
+                current = await self.supabase.get_analysis_task(task_id)
+                if not current or current.get('status') != 'processing' or current.get('worker_id') != self.worker_id:
+                    return bool(current and current.get('burst_result_id'))
+            
+            # Cameras whose results rarely change are sampled less often, and troughs
+            # more often as they near empty; frames captured before the next sample
+            # is due are skipped without a download
+            due, interval = await self.sampler.should_sample(
+                config, image_metadata['camera_name'], image_metadata['captured_at'],
+                await self.forecaster.interval_cap_minutes(config, image_metadata['camera_name'])
+            )
+            if not due:
+                return await self._skip_tasks([task_id], f"sampling: every {interval:.0f} min")
+            
             # Download image from storage
             image_bytes = await self.supabase.download_image(image_metadata['storage_path'])
             
@@ -267,11 +630,40 @@ Please analyze the image independently and provide your assessment. Consider bot
                 image_bytes=image_bytes,
                 image_id=task['image_id'],
                 camera_name=image_metadata['camera_name'],
-                captured_at=image_metadata['captured_at']
+                captured_at=image_metadata['captured_at'],
+                image_url=image_metadata.get('image_url')
             )
             
-            # Update task status to processing
-            await self.supabase.update_task_status(task_id, 'processing')
+            # Frames from the same trigger burst share one analysis of the best frame
+            burst = await self.bursts.collect(task, config, image_metadata, image_data, self.worker_id, self.lease_seconds)
+            if burst and burst.linked_result_id:
+                logger.info(f"Task {task_id} linked to burst result {burst.linked_result_id}")
+                return await self.bursts.link([task_id], burst.linked_result_id)
+            if burst and burst.wait:
+                # Another worker holds part of this burst; look again once it has finished
+                return await self.supabase.release_task(
+                    task_id, self.bursts.wait_seconds, burst_waits=(task.get('burst_waits') or 0) + 1
+                )
+            task_ids = burst.task_ids if burst else [task_id]
+            analyzed_task = task
+            if burst:
+                analyzed_task, image_data = burst.frames[burst.representative]
+            
+            # Dark, fogged or IR frames are skipped, deferred or routed per the config's quality_rules
+            quality_action, quality_issue, quality_score = await self.quality_gate.check(config, image_data)
+            if quality_action in (ACTION_SKIP, ACTION_DEFER):
+                reason = f"quality: {quality_issue}" if quality_action == ACTION_SKIP else f"quality: deferred ({quality_issue})"
+                return await self._skip_tasks(task_ids, reason)
+            if quality_action == ACTION_ROUTE:
+                config = self.quality_gate.routed(config)
+            
+            # Frames that barely changed since the last analysis skip the paid models
+            # or drop to a single cheap one, depending on the config's prefilter_policy
+            prefilter_decision, prefilter_score = await self.prefilter.screen(config, image_data)
+            if prefilter_decision == DECISION_SKIP:
+                return await self._skip_tasks(task_ids, f"prefilter: {prefilter_score.changed_fraction:.1%} changed")
+            if prefilter_decision == DECISION_DOWNGRADE:
+                config = self.prefilter.downgraded(config)
             
             # Run analysis
             primary_key = api_keys.get(config['primary_provider'].upper() + '_API_KEY')
@@ -286,52 +678,175 @@ Please analyze the image independently and provide your assessment. Consider bot
                 tiebreaker_key
             )
             
+            # A failed primary call is a task failure, not a zero-confidence result
+            primary_result = results['primary_result']
+            if primary_result.error_type:
+                raise AnalysisError(
+                    primary_result.error or "Failed to parse model response",
+                    primary_result.error_type,
+                    primary_result.retry_after
+                )
+            
             # Calculate total tokens and cost
-            total_tokens = results['primary_result'].tokens_used
-            if results.get('secondary_result'):
-                total_tokens += results['secondary_result'].tokens_used
-            if results.get('tiebreaker_result'):
-                total_tokens += results['tiebreaker_result'].tokens_used
+            total_tokens = self._total_tokens(results)
             
-            # Save results
-            await self.supabase.save_analysis_result({
-                'image_id': task['image_id'],
-                'config_id': task['config_id'],
-                'model_provider': config['primary_provider'],
-                'model_name': config['primary_model'],
-                'analysis_type': config['analysis_type'],
-                'result': results['final_result'],
-                'confidence': results['final_result'].get('confidence', 0.5),
-                'alert_triggered': self._should_trigger_alert(
-                    results['final_result'],
-                    config
-                ),
-                'processing_time_ms': results['primary_result'].processing_time_ms,
-                'tokens_used': total_tokens,
-                'full_results': results  # Store complete analysis data
-            })
+            if burst and burst.mode == MODE_MAX:
+                # Count animals on every frame and keep the frame that saw the most
+                analyzed_task, image_data, results, burst_tokens, counts = await self._max_over_burst(
+                    burst, config, primary_key, secondary_key, tiebreaker_key, analyzed_task, image_data, results
+                )
+                total_tokens += burst_tokens
+                primary_result = results['primary_result']
+                results['burst'] = {**burst.describe(image_data.image_id), 'counts': counts}
+            elif burst:
+                results['burst'] = burst.describe()
             
-            # Update task status
-            await self.supabase.update_task_status(task_id, 'completed')
+            if quality_score is not None:
+                results['quality'] = {
+                    **quality_score.as_dict(),
+                    'action': quality_action,
+                    # Frames deferred to this one, which now answers for them
+                    'deferred_images': self.quality_gate.take_deferred(config, image_data)
+                }
             
-            # Check for alerts
-            if self._should_trigger_alert(results['final_result'], config):
-                await self._create_alert(
-                    results['final_result'],
-                    config,
-                    image_metadata
+            if prefilter_score is not None:
+                possible_miss = self.prefilter.record_analysis(
+                    config, image_data, prefilter_score, results['final_result'],
+                    downgraded=prefilter_decision == DECISION_DOWNGRADE
                 )
+                results['prefilter'] = {
+                    **prefilter_score.as_dict(),
+                    'decision': prefilter_decision,
+                    'possible_miss': possible_miss
+                }
             
+            forecast, trend_alert = await self.forecaster.predict(
+                config, image_data.camera_name, image_data.captured_at, results['final_result']
+            )
+            if forecast is not None:
+                results['forecast'] = {**forecast.as_dict(), 'trend_alert': trend_alert}
+            
+            # Save result, mark the task completed and raise any alert in one transaction
+            alert_triggered = bool(self._should_trigger_alert(results['final_result'], config))
+            result_id = await self.supabase.complete_task(
+                analyzed_task['id'],
+                self.worker_id,
+                {
+                    'image_id': image_data.image_id,
+                    'config_id': task['config_id'],
+                    # The model that actually answered, which differs from the config after failover
+                    'model_provider': primary_result.provider,
+                    'model_name': primary_result.model,
+                    'analysis_type': config['analysis_type'],
+                    'result': results['final_result'],
+                    'confidence': results['final_result'].get('confidence', 0.5),
+                    'alert_triggered': alert_triggered,
+                    'processing_time_ms': primary_result.processing_time_ms,
+                    'tokens_used': total_tokens,
+                    'full_results': self._serialize_results(results)  # Store complete analysis data
+                },
+                self._build_alert(
+                    results['final_result'], config,
+                    {'camera_name': image_data.camera_name, 'image_url': image_data.image_url}
+                ) if alert_triggered else None
+            )
+            if not result_id:
+                raise Exception("Failed to save analysis result")
+            completed = True
+            
+            await self.bursts.link([other for other in task_ids if other != analyzed_task['id']], result_id)
+            self.sampler.record(
+                config, image_data.camera_name, image_data.captured_at, results['final_result'], alert_triggered
+            )
+            self.forecaster.record(
+                config, image_data.camera_name, image_data.captured_at, results['final_result'], trend_alert
+            )
+            if trend_alert:
+                await self.supabase.create_alert(
+                    self.forecaster.build_alert(config, image_data.camera_name, image_data.image_url, forecast, result_id)
+                )
             return True
             
         except Exception as e:
+            if completed:
+                # The result is saved; failing the task now would analyze it a second time
+                logger.error(f"Error after completing task {task_id}: {str(e)}")
+                return True
             logger.error(f"Error processing task {task_id}: {str(e)}")
-            await self.supabase.update_task_status(
-                task_id, 
-                'failed',
-                error_message=str(e)
-            )
+            await self.bursts.release(burst, task_id)
+            await self._fail_task(task_id, task, e)
             return False
+        finally:
+            if burst_lock:
+                burst_lock.release()
+            if leased:
+                self._drop_lease()
+    
+    def _total_tokens(self, results: Dict[str, Any]) -> int:
+        total_tokens = results['primary_result'].tokens_used
+        if results.get('secondary_result'):
+            total_tokens += results['secondary_result'].tokens_used
+        if results.get('tiebreaker_result'):
+            total_tokens += results['tiebreaker_result'].tokens_used
+        return total_tokens
+    
+    async def _max_over_burst(
+        self,
+        burst: Burst,
+        config: Dict[str, Any],
+        primary_key: Optional[str],
+        secondary_key: Optional[str],
+        tiebreaker_key: Optional[str],
+        task: Dict[str, Any],
+        image_data: ImageData,
+        results: Dict[str, Any]
+    ) -> Tuple[Dict[str, Any], ImageData, Dict[str, Any], int, Dict[str, int]]:
+        """Analyze the burst's other frames; returns the frame with the highest animal count"""
+        others = [frame for i, frame in enumerate(burst.frames) if i != burst.representative]
+        frame_results = await asyncio.gather(
+            *[
+                self.analyze_with_dual_models(other_image, config, primary_key, secondary_key, tiebreaker_key)
+                for _, other_image in others
+            ],
+            return_exceptions=True
+        )
+        
+        best = (task, image_data, results)
+        counts = {image_data.image_id: animal_count(results['final_result'])}
+        extra_tokens = 0
+        for (other_task, other_image), other_results in zip(others, frame_results):
+            if isinstance(other_results, Exception) or other_results['primary_result'].error_type:
+                continue
+            extra_tokens += self._total_tokens(other_results)
+            counts[other_image.image_id] = animal_count(other_results['final_result'])
+            if counts[other_image.image_id] > counts[best[1].image_id]:
+                best = (other_task, other_image, other_results)
+        return best[0], best[1], best[2], extra_tokens, counts
+    
+    async def _skip_tasks(self, task_ids: List[str], reason: str) -> bool:
+        logger.info(f"Tasks {', '.join(task_ids)} skipped ({reason})")
+        skipped = [await self.supabase.skip_task(skip_id, reason) for skip_id in task_ids]
+        return all(skipped)
+    
+    async def _fail_task(
+        self,
+        task_id: str,
+        task: Optional[Dict[str, Any]],
+        error: Exception
+    ) -> None:
+        """Reschedule a retryable failure with backoff, or dead-letter it"""
+        error_type, retry_after = classify_exception(error)
+        
+        retry_delay = None
+        if error_type in RETRYABLE_ERRORS:
+            retry_count = (task or {}).get('retry_count') or 0
+            retry_delay = self.retry_policy.next_delay(retry_count, retry_after)
+        
+        status = await self.supabase.fail_task(task_id, str(error), error_type, retry_delay)
+        if status == 'pending':
+            logger.warning(f"Task {task_id} failed ({error_type}), retrying in {retry_delay:.0f}s")
+        elif status == 'dead_letter':
+            logger.error(f"Task {task_id} moved to dead letter ({error_type})")
     
     def _should_trigger_alert(
         self,
@@ -355,12 +870,19 @@ Please analyze the image independently and provide your assessment. Consider bot
         else:
             return result.get('alert_condition', False)
     
-    async def _create_alert(
+    def _serialize_results(self, results: Dict[str, Any]) -> Dict[str, Any]:
+        """Convert AnalysisResult objects so the results can be stored as JSON"""
+        return {
+            key: asdict(value) if isinstance(value, AnalysisResult) else value
+            for key, value in results.items()
+        }
+    
+    def _build_alert(
         self,
         result: Dict[str, Any],
         config: Dict[str, Any],
         image_metadata: Dict[str, Any]
-    ) -> None:
+    ) -> Dict[str, Any]:
         alert_type = 'immediate' if result.get('confidence', 0) > 0.9 else 'warning'
         
         if config['analysis_type'] == 'gate_detection':
@@ -376,7 +898,7 @@ Please analyze the image independently and provide your assessment. Consider bot
             title = f"Alert - {image_metadata['camera_name']}"
             message = result.get('alert_message', 'Condition detected')
         
-        await self.supabase.create_alert({
+        return {
             'alert_type': alert_type,
             'severity': 'critical' if alert_type == 'immediate' else 'warning',
             'title': title,
@@ -384,4 +906,4 @@ Please analyze the image independently and provide your assessment. Consider bot
             'camera_name': image_metadata['camera_name'],
             'image_url': image_metadata.get('image_url'),
             'alert_data': result
-        })
\ No newline at end of file
+        }
\ No newline at end of file
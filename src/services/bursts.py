@@ -0,0 +1,291 @@
+import asyncio
+import json
+import logging
+import os
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from ..providers.base import ImageData
+from ..providers.cpu_pool import cpu_pool
+from ..db.supabase_client import SupabaseClient
+from .quality_gate import score_pixels
+
+
+logger = logging.getLogger(__name__)
+
+
+# How a burst of frames from one trigger is analyzed
+MODE_OFF = 'off'                        # every frame on its own
+MODE_REPRESENTATIVE = 'representative'  # the best frame answers for the burst
+MODE_MAX = 'max'                        # every frame, keeping the highest animal count
+
+DEFAULT_BURST_MODES = {
+    'gate_detection': MODE_REPRESENTATIVE,
+    'door_detection': MODE_REPRESENTATIVE,
+    'water_level': MODE_REPRESENTATIVE,
+    'feed_bin_status': MODE_REPRESENTATIVE,
+    'feed_bin': MODE_REPRESENTATIVE,
+    # Animals walk in and out of frame during a burst; count them on every frame
+    'animal_detection': MODE_MAX,
+}
+
+# Sharpness within this fraction of the best counts as a tie, broken by the middle frame
+SHARPNESS_TOLERANCE = 0.1
+SHARPNESS_MAX_SIDE = 512
+
+
+def _parse_time(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        return datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+
+
+def _hash_distance(left: str, right: str) -> int:
+    return bin(int(left, 16) ^ int(right, 16)).count('1')
+
+
+def animal_count(result: Dict[str, Any]) -> int:
+    """Total animals in an animal_detection result"""
+    total = 0
+    for animal in result.get('animals') or []:
+        if isinstance(animal, dict) and isinstance(animal.get('count'), (int, float)):
+            total += int(animal['count'])
+    return total
+
+
+@dataclass
+class Burst:
+    mode: str
+    # (task, image) pairs claimed by this worker, in capture order
+    frames: List[Tuple[Dict[str, Any], ImageData]] = field(default_factory=list)
+    representative: int = 0
+    # An earlier frame of the burst already has a result for this config
+    linked_result_id: Optional[str] = None
+    # Another worker is analyzing frames of this burst right now
+    wait: bool = False
+
+    @property
+    def task_ids(self) -> List[str]:
+        return [task['id'] for task, _ in self.frames]
+
+    def describe(self, representative_id: Optional[str] = None) -> Dict[str, Any]:
+        return {
+            'mode': self.mode,
+            'frames': [image.image_id for _, image in self.frames],
+            'representative': representative_id or self.frames[self.representative][1].image_id
+        }
+
+
+class BurstGrouper:
+    """Groups the frames a camera captures per trigger so one analysis covers them.
+
+    Spypoint cameras take several frames within seconds of each trigger. When a
+    worker picks up a task, it collects the camera's frames whose captured_at
+    gaps are at most ``gap_seconds`` and whose perceptual hashes are close,
+    claims their pending tasks for the same config, and analyzes the sharpest
+    frame (the middle one on near ties). Sibling tasks are linked to that
+    result. Within one worker, frames of a camera and config are processed
+    one at a time (``lock_for``), so the first frame of a burst runs it and
+    its siblings find the result; a burst held by another worker is waited
+    on at most BURST_MAX_WAITS times before the frame is analyzed alone.
+    Modes are set per analysis type, with BURST_MODES overriding the
+    defaults, e.g. {"animal_detection": "max", "gate_detection": "off"}.
+    """
+
+    def __init__(self, supabase_client: SupabaseClient):
+        self.supabase = supabase_client
+        self.gap_seconds = float(os.getenv('BURST_GAP_SECONDS', '10'))
+        self.max_frames = int(os.getenv('BURST_MAX_FRAMES', '6'))
+        self.max_hash_distance = int(os.getenv('BURST_MAX_HASH_DISTANCE', '16'))
+        self.wait_seconds = float(os.getenv('BURST_WAIT_SECONDS', '30'))
+        self.max_waits = int(os.getenv('BURST_MAX_WAITS', '3'))
+
+        # (camera, config id) -> lock held while one of its frames is processed
+        self._locks: Dict[Tuple[str, str], asyncio.Lock] = {}
+
+        self.modes = dict(DEFAULT_BURST_MODES)
+        overrides = os.getenv('BURST_MODES')
+        if overrides:
+            try:
+                self.modes.update(json.loads(overrides))
+            except (ValueError, TypeError) as e:
+                logger.error(f"Ignoring invalid BURST_MODES: {e}")
+
+        self.bursts = 0
+        self.frames_grouped = 0
+        self.linked = 0
+
+    def mode_for(self, analysis_type: Optional[str]) -> str:
+        return self.modes.get(analysis_type, MODE_OFF)
+
+    def lock_for(self, camera_name: str, config: Dict[str, Any]) -> Optional[asyncio.Lock]:
+        """Per camera and config lock serializing this worker's frames; None when bursts are off"""
+        if self.mode_for(config.get('analysis_type')) == MODE_OFF:
+            return None
+        return self._locks.setdefault((camera_name, str(config.get('id'))), asyncio.Lock())
+
+    def _burst_images(self, neighbours: List[Dict[str, Any]], image_id: str) -> List[Dict[str, Any]]:
+        """The run of frames around image_id whose consecutive gaps are within gap_seconds"""
+        frames = [(image, _parse_time(image.get('captured_at'))) for image in neighbours]
+        frames = [(image, at) for image, at in frames if at is not None]
+        index = next((i for i, (image, _) in enumerate(frames) if image['image_id'] == image_id), None)
+        if index is None:
+            return []
+        start = end = index
+        while end - start + 1 < self.max_frames:
+            if start > 0 and (frames[start][1] - frames[start - 1][1]).total_seconds() <= self.gap_seconds:
+                start -= 1
+            elif end < len(frames) - 1 and (frames[end + 1][1] - frames[end][1]).total_seconds() <= self.gap_seconds:
+                end += 1
+            else:
+                break
+        return [image for image, _ in frames[start:end + 1]]
+
+    def _sharpness(self, image_data: ImageData) -> float:
+        return score_pixels(np.asarray(image_data.decoded(SHARPNESS_MAX_SIDE)))[4]
+
+    async def collect(
+        self,
+        task: Dict[str, Any],
+        config: Dict[str, Any],
+        image_metadata: Dict[str, Any],
+        image_data: ImageData,
+        worker_id: str,
+        lease_seconds: float
+    ) -> Optional[Burst]:
+        """Claim the rest of this frame's burst; None when the frame stands alone"""
+        mode = self.mode_for(config.get('analysis_type'))
+        captured_at = _parse_time(image_metadata.get('captured_at'))
+        if mode == MODE_OFF or captured_at is None or task.get('burst_standalone'):
+            return None
+
+        span = timedelta(seconds=self.gap_seconds * self.max_frames)
+        neighbours = await self.supabase.get_camera_images_between(
+            image_metadata['camera_name'], (captured_at - span).isoformat(), (captured_at + span).isoformat()
+        )
+        siblings = [image for image in self._burst_images(neighbours, task['image_id']) if image['image_id'] != task['image_id']]
+        if not siblings:
+            return None
+
+        sibling_tasks = [
+            sibling for sibling in await self.supabase.get_config_tasks_for_images(
+                config['id'], [image['image_id'] for image in siblings]
+            )
+            if not sibling.get('burst_standalone')
+        ]
+        for sibling in sibling_tasks:
+            if sibling.get('burst_result_id'):
+                return Burst(mode=mode, linked_result_id=sibling['burst_result_id'])
+            if sibling['status'] == 'completed':
+                result_id = await self.supabase.get_latest_result_id(sibling['image_id'], config['id'])
+                if result_id:
+                    return Burst(mode=mode, linked_result_id=result_id)
+        # Siblings this worker already claimed are queued behind lock_for and join this burst
+        foreign = [
+            sibling for sibling in sibling_tasks
+            if sibling['status'] == 'processing' and sibling.get('worker_id') != worker_id
+        ]
+        if foreign and (task.get('burst_waits') or 0) < self.max_waits:
+            return Burst(mode=mode, wait=True)
+
+        # Claim pending siblings; any another worker takes first are left to it
+        claimed = []
+        for sibling in sibling_tasks:
+            if sibling['status'] == 'processing' and sibling.get('worker_id') == worker_id:
+                claimed.append(sibling)
+            elif sibling['status'] == 'pending' and await self.supabase.claim_task(sibling['id'], worker_id, lease_seconds):
+                claimed.append(sibling)
+        if not claimed:
+            return None
+
+        by_image = {image['image_id']: image for image in siblings}
+        downloads = await asyncio.gather(
+            *[self.supabase.download_image(by_image[sibling['image_id']]['storage_path']) for sibling in claimed],
+            return_exceptions=True
+        )
+
+        frames = [(task, image_data)]
+        released = []
+        standalone = []
+        for sibling, image_bytes in zip(claimed, downloads):
+            if isinstance(image_bytes, Exception) or not image_bytes:
+                released.append(sibling['id'])
+                continue
+            metadata = by_image[sibling['image_id']]
+            sibling_image = ImageData(
+                image_bytes=image_bytes,
+                image_id=sibling['image_id'],
+                camera_name=metadata['camera_name'],
+                captured_at=metadata['captured_at'],
+                image_url=metadata.get('image_url')
+            )
+            try:
+                distance = await cpu_pool.run_in_thread(
+                    lambda: _hash_distance(image_data.perceptual_hash, sibling_image.perceptual_hash)
+                )
+            except Exception as e:
+                logger.warning(f"Could not compare burst frame {sibling['image_id']}: {e}")
+                distance = self.max_hash_distance + 1
+            if distance > self.max_hash_distance:
+                # Same trigger, different scene (e.g. IR switched on); analyze it on its own
+                standalone.append(sibling['id'])
+                continue
+            frames.append((sibling, sibling_image))
+
+        for task_id in released:
+            await self.supabase.release_task(task_id)
+        for task_id in standalone:
+            await self.supabase.release_task(task_id, standalone=True)
+        if len(frames) == 1:
+            return None
+
+        frames.sort(key=lambda frame: frame[1].captured_at)
+        burst = Burst(mode=mode, frames=frames)
+        burst.representative = await self._pick_representative(frames)
+        self.bursts += 1
+        self.frames_grouped += len(frames)
+        return burst
+
+    async def _pick_representative(self, frames: List[Tuple[Dict[str, Any], ImageData]]) -> int:
+        """Index of the sharpest frame, preferring the middle of the burst on near ties"""
+        middle = (len(frames) - 1) / 2
+        try:
+            sharpness = await asyncio.gather(
+                *[cpu_pool.run_in_thread(self._sharpness, image) for _, image in frames]
+            )
+        except Exception as e:
+            logger.warning(f"Burst sharpness scoring failed, using the middle frame: {e}")
+            return int(middle)
+        best = max(sharpness)
+        candidates = [i for i, value in enumerate(sharpness) if value >= best * (1 - SHARPNESS_TOLERANCE)]
+        return min(candidates, key=lambda i: abs(i - middle))
+
+    async def release(self, burst: Optional[Burst], keep_task_id: str) -> None:
+        """Return claimed sibling tasks to the queue after the burst's analysis failed"""
+        if not burst:
+            return
+        for task_id in burst.task_ids:
+            if task_id != keep_task_id:
+                await self.supabase.release_task(task_id)
+
+    async def link(self, task_ids: List[str], result_id: str) -> bool:
+        if not task_ids:
+            return True
+        self.linked += len(task_ids)
+        return await self.supabase.link_burst_tasks(task_ids, result_id)
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'modes': self.modes,
+            'gap_seconds': self.gap_seconds,
+            'max_frames': self.max_frames,
+            'max_waits': self.max_waits,
+            'bursts': self.bursts,
+            'frames_grouped': self.frames_grouped,
+            'avg_frames_per_burst': round(self.frames_grouped / self.bursts, 2) if self.bursts else None,
+            'tasks_linked': self.linked
+        }
@@ -0,0 +1,109 @@
+from typing import Dict, Any, Optional, Tuple
+from ..providers.base import AnalysisResult, ImageData
+from ..providers.image_resize import ImageProfile, resizer
+
+
+# Providers whose API exposes a detail level worth re-running at
+ESCALATION_PROVIDERS = {'openai'}
+
+# Re-encode ROI crops once at high quality; the provider profile resizes them afterwards
+ROI_PROFILE_QUALITY = 90
+ROI_MAX_BYTES = 20 * 1024 * 1024
+
+
+class DetailEscalation:
+    """Decides when to re-run a low-detail answer at high detail and tracks the cost.
+
+    Configs opt in with detail_escalation. A successful low-detail result whose
+    confidence is under the config threshold is re-run at detail high, on the
+    escalation_roi crop when one is configured (fractions of the frame, e.g.
+    {"x": 0.4, "y": 0.3, "width": 0.3, "height": 0.3} around a distant gate).
+    """
+
+    def __init__(self):
+        self._cameras: Dict[str, Dict[str, Any]] = {}
+
+    def _camera(self, camera_name: str) -> Dict[str, Any]:
+        if camera_name not in self._cameras:
+            self._cameras[camera_name] = {
+                'eligible': 0,
+                'escalations': 0,
+                'resolved': 0,
+                'low_cost': 0.0,
+                'extra_cost': 0.0,
+                'extra_tokens': 0
+            }
+        return self._cameras[camera_name]
+
+    def should_escalate(self, config: Dict[str, Any], image_data: ImageData, result: AnalysisResult) -> bool:
+        if not config.get('detail_escalation') or result.provider not in ESCALATION_PROVIDERS:
+            return False
+        if result.error is not None or result.error_type is not None:
+            return False
+        stats = self._camera(image_data.camera_name)
+        stats['eligible'] += 1
+        stats['low_cost'] += result.estimated_cost or 0.0
+        return result.confidence < config.get('threshold', 0.8)
+
+    def roi_box(self, roi: Optional[Dict[str, float]], width: int, height: int) -> Optional[Tuple[int, int, int, int]]:
+        """Crop box in source pixels for a fractional ROI, or None for the full frame"""
+        if not roi:
+            return None
+        left = int(max(0.0, min(1.0, roi.get('x', 0.0))) * width)
+        top = int(max(0.0, min(1.0, roi.get('y', 0.0))) * height)
+        right = int(max(0.0, min(1.0, roi.get('x', 0.0) + roi.get('width', 1.0))) * width)
+        bottom = int(max(0.0, min(1.0, roi.get('y', 0.0) + roi.get('height', 1.0))) * height)
+        if right - left < 16 or bottom - top < 16:
+            return None
+        return left, top, right, bottom
+
+    async def crop_to_roi(self, image_data: ImageData, roi: Optional[Dict[str, float]]) -> ImageData:
+        box = self.roi_box(roi, image_data.width, image_data.height)
+        if box is None:
+            return image_data
+        cropped = await resizer.resize_async(
+            image_data.image_bytes,
+            ImageProfile(
+                name='roi',
+                max_side=0,
+                max_bytes=ROI_MAX_BYTES,
+                min_quality=ROI_PROFILE_QUALITY,
+                max_quality=ROI_PROFILE_QUALITY,
+                crop=box
+            ),
+            image_data.sha256
+        )
+        return ImageData(
+            image_bytes=cropped,
+            image_id=image_data.image_id,
+            camera_name=image_data.camera_name,
+            captured_at=image_data.captured_at,
+            image_url=image_data.image_url
+        )
+
+    def record(self, config: Dict[str, Any], camera_name: str, escalated: AnalysisResult) -> None:
+        stats = self._camera(camera_name)
+        stats['escalations'] += 1
+        stats['extra_cost'] += escalated.estimated_cost or 0.0
+        stats['extra_tokens'] += escalated.tokens_used or 0
+        if escalated.error is None and escalated.confidence >= config.get('threshold', 0.8):
+            stats['resolved'] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        cameras = {}
+        for camera_name, stats in self._cameras.items():
+            eligible = stats['eligible']
+            escalations = stats['escalations']
+            cameras[camera_name] = {
+                **stats,
+                'low_cost': round(stats['low_cost'], 6),
+                'extra_cost': round(stats['extra_cost'], 6),
+                'escalation_rate': round(escalations / eligible, 4) if eligible else 0.0,
+                'resolution_rate': round(stats['resolved'] / escalations, 4) if escalations else 0.0,
+                # Spend increase from escalating, relative to low detail alone
+                'cost_delta_percent': round(stats['extra_cost'] / stats['low_cost'] * 100, 1) if stats['low_cost'] else None
+            }
+        return {
+            'escalations': sum(s['escalations'] for s in self._cameras.values()),
+            'cameras': cameras
+        }
@@ -0,0 +1,250 @@
+import logging
+import os
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from ..db.supabase_client import SupabaseClient
+from .sampling import HISTORY_LIMIT, parse_captured_at
+
+
+logger = logging.getLogger(__name__)
+
+
+# Analysis types whose results carry a percentage_estimate worth forecasting
+FORECAST_TYPES = {
+    'water_level': 'Water',
+    'feed_bin_status': 'Feed',
+    'feed_bin': 'Feed',
+}
+
+# Points kept per trough; older readings carry almost no weight anyway
+MAX_POINTS = 500
+
+
+@dataclass
+class Forecast:
+    level: float           # Fitted percent full at the latest reading
+    rate_per_hour: float   # Percent per hour; negative while depleting
+    rate_stderr: float
+    hours_to_empty: Optional[float]  # None when the level isn't falling
+    points: int
+    span_hours: float
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'level': round(self.level, 1),
+            'rate_per_hour': round(self.rate_per_hour, 3),
+            'rate_stderr': round(self.rate_stderr, 3),
+            'hours_to_empty': round(self.hours_to_empty, 1) if self.hours_to_empty is not None else None,
+            'points': self.points,
+            'span_hours': round(self.span_hours, 1)
+        }
+
+
+def refill_start(percents: np.ndarray, refill_jump: float) -> int:
+    """Index of the first reading since the last refill (a rise of refill_jump points or more)"""
+    jumps = np.flatnonzero(np.diff(percents) >= refill_jump)
+    return int(jumps[-1]) + 1 if jumps.size else 0
+
+
+def fit_depletion(
+    hours: np.ndarray,
+    percents: np.ndarray,
+    halflife_hours: float,
+    empty_percent: float
+) -> Optional[Forecast]:
+    """Exponentially weighted least-squares line through one refill cycle's readings"""
+    if hours.size < 2:
+        return None
+    # Recent readings count most; weights scaled to sum to the number of readings
+    weights = 0.5 ** ((hours[-1] - hours) / halflife_hours)
+    weights *= hours.size / weights.sum()
+    mean_t = (weights * hours).sum() / hours.size
+    mean_y = (weights * percents).sum() / hours.size
+    spread = (weights * (hours - mean_t) ** 2).sum()
+    if spread <= 0:
+        return None
+
+    slope = (weights * (hours - mean_t) * (percents - mean_y)).sum() / spread
+    level = mean_y + slope * (hours[-1] - mean_t)
+    residuals = percents - (mean_y + slope * (hours - mean_t))
+    variance = (weights * residuals ** 2).sum() / max(hours.size - 2, 1)
+    stderr = float(np.sqrt(variance / spread))
+
+    hours_to_empty = None
+    if slope < 0:
+        hours_to_empty = max(0.0, float((level - empty_percent) / -slope))
+    return Forecast(
+        level=float(level),
+        rate_per_hour=float(slope),
+        rate_stderr=stderr,
+        hours_to_empty=hours_to_empty,
+        points=int(hours.size),
+        span_hours=float(hours[-1] - hours[0])
+    )
+
+
+class LevelForecaster:
+    """Forecasts when water troughs and feed bins run empty.
+
+    Configs opt in with trend_forecast. Per camera and config, the
+    percentage_estimate readings since the last refill are fitted with an
+    exponentially weighted line; a falling fit gives a depletion rate and a
+    time to empty. A 'trend' alert is raised once per refill cycle when empty
+    is predicted within FORECAST_ALERT_HOURS. For configs that also use
+    adaptive_sampling, the forecast caps the sampling interval so frames are
+    analyzed more often as empty approaches.
+    """
+
+    def __init__(self, supabase_client: SupabaseClient):
+        self.supabase = supabase_client
+        self.halflife_hours = float(os.getenv('FORECAST_HALFLIFE_HOURS', '48'))
+        self.min_points = int(os.getenv('FORECAST_MIN_POINTS', '4'))
+        self.min_span_hours = float(os.getenv('FORECAST_MIN_SPAN_HOURS', '6'))
+        self.empty_percent = float(os.getenv('FORECAST_EMPTY_PERCENT', '10'))
+        self.refill_jump = float(os.getenv('FORECAST_REFILL_JUMP', '20'))
+        self.alert_hours = float(os.getenv('FORECAST_ALERT_HOURS', '24'))
+        self.samples_before_empty = float(os.getenv('FORECAST_SAMPLES_BEFORE_EMPTY', '8'))
+
+        # (camera, config id) -> readings in epoch hours and percent, oldest first
+        self._series: Dict[Tuple[str, str], Dict[str, Any]] = {}
+        self.trend_alerts = 0
+
+    def applies(self, config: Dict[str, Any]) -> bool:
+        return bool(config.get('trend_forecast')) and config.get('analysis_type') in FORECAST_TYPES
+
+    def _append(self, series: Dict[str, Any], at: datetime, percent: Any) -> None:
+        if not isinstance(percent, (int, float)) or isinstance(percent, bool):
+            return
+        hour = at.timestamp() / 3600
+        if series['hours'] and hour <= series['hours'][-1]:
+            return
+        series['hours'].append(hour)
+        series['percents'].append(float(percent))
+        if len(series['hours']) > MAX_POINTS:
+            del series['hours'][0], series['percents'][0]
+
+    async def _series_for(self, config: Dict[str, Any], camera_name: str) -> Dict[str, Any]:
+        key = (camera_name, str(config.get('id')))
+        if key not in self._series:
+            series = {'hours': [], 'percents': [], 'alerted_cycle': None}
+            history = await self.supabase.get_result_history(config['id'], camera_name, HISTORY_LIMIT)
+            for row in history:
+                at = parse_captured_at(row.get('captured_at') or row.get('created_at'))
+                if at is not None and isinstance(row.get('result'), dict):
+                    self._append(series, at, row['result'].get('percentage_estimate'))
+            self._series[key] = series
+        return self._series[key]
+
+    def _forecast(self, series: Dict[str, Any]) -> Tuple[Optional[Forecast], Optional[float]]:
+        """Forecast for the current refill cycle, and the hour that cycle started"""
+        if len(series['hours']) < self.min_points:
+            return None, None
+        hours = np.asarray(series['hours'])
+        percents = np.asarray(series['percents'])
+        start = refill_start(percents, self.refill_jump)
+        hours, percents = hours[start:], percents[start:]
+        if hours.size < self.min_points or hours[-1] - hours[0] < self.min_span_hours:
+            return None, float(hours[0])
+        return fit_depletion(hours, percents, self.halflife_hours, self.empty_percent), float(hours[0])
+
+    async def interval_cap_minutes(self, config: Dict[str, Any], camera_name: str) -> Optional[float]:
+        """Longest sampling interval the forecast allows; tightens as empty approaches"""
+        if not self.applies(config):
+            return None
+        try:
+            forecast, _ = self._forecast(await self._series_for(config, camera_name))
+        except Exception as e:
+            logger.error(f"Forecast unavailable for {camera_name}: {e}")
+            return None
+        if forecast is None or forecast.hours_to_empty is None:
+            return None
+        return forecast.hours_to_empty * 60 / self.samples_before_empty
+
+    async def predict(
+        self,
+        config: Dict[str, Any],
+        camera_name: str,
+        captured_at: Optional[str],
+        result: Dict[str, Any]
+    ) -> Tuple[Optional[Forecast], bool]:
+        """Forecast with a new reading and whether it warrants a trend alert; nothing is stored until ``record``"""
+        if not self.applies(config):
+            return None, False
+        at = parse_captured_at(captured_at) or datetime.now(timezone.utc)
+        try:
+            series = await self._series_for(config, camera_name)
+        except Exception as e:
+            logger.error(f"Forecast history unavailable for {camera_name}: {e}")
+            return None, False
+        trial = {'hours': list(series['hours']), 'percents': list(series['percents'])}
+        self._append(trial, at, result.get('percentage_estimate'))
+        forecast, cycle = self._forecast(trial)
+        if forecast is None or forecast.hours_to_empty is None:
+            return forecast, False
+
+        # Only a clearly falling level, not yet empty, and once per refill cycle
+        alert = (
+            forecast.hours_to_empty <= self.alert_hours
+            and forecast.level > self.empty_percent
+            and forecast.rate_per_hour + 2 * forecast.rate_stderr < 0
+            and series['alerted_cycle'] != cycle
+        )
+        return forecast, alert
+
+    def record(
+        self,
+        config: Dict[str, Any],
+        camera_name: str,
+        captured_at: Optional[str],
+        result: Dict[str, Any],
+        alerted: bool
+    ) -> None:
+        """Store a saved result's reading, and the refill cycle a trend alert was raised for"""
+        series = self._series.get((camera_name, str(config.get('id'))))
+        if not self.applies(config) or series is None:
+            return
+        self._append(series, parse_captured_at(captured_at) or datetime.now(timezone.utc), result.get('percentage_estimate'))
+        if alerted:
+            _, series['alerted_cycle'] = self._forecast(series)
+            self.trend_alerts += 1
+
+    def build_alert(
+        self,
+        config: Dict[str, Any],
+        camera_name: str,
+        image_url: Optional[str],
+        forecast: Forecast,
+        result_id: str
+    ) -> Dict[str, Any]:
+        subject = FORECAST_TYPES[config['analysis_type']]
+        return {
+            'analysis_result_id': result_id,
+            'alert_type': 'trend',
+            'severity': 'warning',
+            'title': f"{subject} Running Out - {camera_name}",
+            'message': (
+                f"{subject} predicted empty in about {forecast.hours_to_empty:.0f} h "
+                f"(now ~{forecast.level:.0f}%, falling {-forecast.rate_per_hour:.1f}% per hour)"
+            ),
+            'camera_name': camera_name,
+            'image_url': image_url,
+            'alert_data': forecast.as_dict()
+        }
+
+    def stats(self) -> Dict[str, Any]:
+        troughs: Dict[str, List[Dict[str, Any]]] = {}
+        for (camera_name, config_id), series in self._series.items():
+            forecast, _ = self._forecast(series)
+            troughs.setdefault(camera_name, []).append({
+                'config_id': config_id,
+                'readings': len(series['hours']),
+                'forecast': forecast.as_dict() if forecast else None
+            })
+        return {
+            'alert_hours': self.alert_hours,
+            'empty_percent': self.empty_percent,
+            'trend_alerts': self.trend_alerts,
+            'cameras': troughs
+        }
@@ -0,0 +1,68 @@
+import os
+from collections import deque
+from typing import Dict, Any, Optional, Tuple
+
+
+class HedgePolicy:
+    """Decides when to send a duplicate (hedge) request and keeps it within budget.
+
+    The hedge delay for a model is the p90 of its recent successful latencies,
+    so only the slowest ~10% of calls get hedged. Hedges are capped at
+    ``budget_percent`` of hedge-eligible requests.
+    """
+
+    def __init__(
+        self,
+        budget_percent: Optional[float] = None,
+        percentile: float = 0.9,
+        window: int = 200,
+        min_samples: int = 20
+    ):
+        self.budget = (budget_percent or float(os.getenv('HEDGE_BUDGET_PERCENT', '5'))) / 100
+        self.percentile = percentile
+        self.window = window
+        self.min_samples = min_samples
+
+        self._latencies: Dict[Tuple[str, str], deque] = {}
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.budget_exhausted = 0
+
+    def record_latency(self, provider: str, model: str, latency_ms: float) -> None:
+        key = (provider, model)
+        if key not in self._latencies:
+            self._latencies[key] = deque(maxlen=self.window)
+        self._latencies[key].append(latency_ms)
+
+    def hedge_delay(self, provider: str, model: str) -> Optional[float]:
+        """Seconds to wait for the primary before hedging, or None without enough history"""
+        samples = self._latencies.get((provider, model))
+        if not samples or len(samples) < self.min_samples:
+            return None
+        ordered = sorted(samples)
+        index = min(len(ordered) - 1, int(len(ordered) * self.percentile))
+        return ordered[index] / 1000
+
+    def try_acquire(self) -> bool:
+        """Reserve budget for one hedge; the first hedge is always allowed"""
+        if self.hedges + 1 > max(1.0, self.requests * self.budget):
+            self.budget_exhausted += 1
+            return False
+        self.hedges += 1
+        return True
+
+    def stats(self) -> Dict[str, Any]:
+        return {
+            'eligible_requests': self.requests,
+            'hedges': self.hedges,
+            'hedge_rate': round(self.hedges / self.requests, 4) if self.requests else 0.0,
+            'hedge_wins': self.hedge_wins,
+            'hedge_win_rate': round(self.hedge_wins / self.hedges, 4) if self.hedges else 0.0,
+            'budget_exhausted': self.budget_exhausted,
+            'p90_ms': {
+                f"{provider}/{model}": round(self.hedge_delay(provider, model) * 1000)
+                for (provider, model) in self._latencies
+                if self.hedge_delay(provider, model) is not None
+            }
+        }
@@ -0,0 +1,251 @@
+import logging
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Dict, Any, Optional, Tuple
+from PIL import Image, ImageChops, ImageStat
+from ..providers.base import ImageData
+from ..providers.cpu_pool import cpu_pool
+from ..providers.schemas import decision_keys
+
+try:
+    import numpy as np
+    import onnxruntime
+except ImportError:  # The animal classifier is optional; scene change alone still filters
+    onnxruntime = None
+
+
+logger = logging.getLogger(__name__)
+
+
+# Per-config policies for frames the pre-filter considers quiet
+POLICY_OFF = 'off'              # always analyze
+POLICY_SKIP = 'skip'            # don't call a model at all
+POLICY_DOWNGRADE = 'downgrade'  # one cheap model call instead of the full config
+
+DECISION_PROCEED = 'proceed'
+DECISION_SKIP = 'skip'
+DECISION_DOWNGRADE = 'downgrade'
+
+# Grayscale thumbnail compared against the last analyzed frame
+THUMB_SIZE = (32, 24)
+CLASSIFIER_SIZE = 224
+
+
+@dataclass
+class PrefilterScore:
+    changed_fraction: float  # Share of thumbnail pixels that moved more than pixel_delta
+    animal_score: Optional[float]  # Classifier probability, None without a model
+    first_frame: bool  # No reference frame yet for this camera and config
+    elapsed_ms: float
+    quiet: bool = False  # Below both thresholds; analyzed only if forced or downgraded
+    thumb: Optional[Image.Image] = field(default=None, repr=False)
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'changed_fraction': self.changed_fraction,
+            'animal_score': self.animal_score,
+            'first_frame': self.first_frame,
+            'quiet': self.quiet,
+            'elapsed_ms': self.elapsed_ms
+        }
+
+
+class AnimalClassifier:
+    """Optional ONNX "animal present" classifier run on the CPU.
+
+    Expects one NCHW float input of CLASSIFIER_SIZE squared RGB in [0, 1], and
+    one output holding either a single probability/logit or [no_animal, animal].
+    """
+
+    def __init__(self, model_path: str):
+        self.session = onnxruntime.InferenceSession(model_path, providers=['CPUExecutionProvider'])
+        self.input_name = self.session.get_inputs()[0].name
+
+    def score(self, image: Image.Image) -> float:
+        pixels = np.asarray(image.convert('RGB').resize((CLASSIFIER_SIZE, CLASSIFIER_SIZE)), dtype=np.float32) / 255.0
+        output = np.asarray(self.session.run(None, {self.input_name: pixels.transpose(2, 0, 1)[None]})[0]).ravel()
+        if output.size >= 2:
+            exp = np.exp(output[:2] - output[:2].max())
+            return float(exp[1] / exp.sum())
+        value = float(output[0])
+        return value if 0.0 <= value <= 1.0 else float(1 / (1 + np.exp(-value)))
+
+
+class FramePrefilter:
+    """On-box screen for frames not worth a paid model call.
+
+    Each frame is compared with the last frame that was actually analyzed for
+    the same camera and config: a small brightness-matched grayscale
+    thumbnail, counting pixels that moved more than ``pixel_delta`` levels.
+    When PREFILTER_ONNX_MODEL points at a classifier, its animal score can
+    also force analysis. Quiet frames are skipped or downgraded according
+    to the config's prefilter_policy, but never more than ``max_skips`` in a
+    row. If the next analysis finds the decision changed after skips, that
+    is logged as a possible miss for tuning the thresholds.
+    """
+
+    def __init__(
+        self,
+        change_threshold: Optional[float] = None,
+        pixel_delta: Optional[int] = None,
+        animal_threshold: Optional[float] = None,
+        max_skips: Optional[int] = None,
+        max_references: int = 512
+    ):
+        self.change_threshold = change_threshold or float(os.getenv('PREFILTER_CHANGE_THRESHOLD', '0.02'))
+        self.pixel_delta = pixel_delta or int(os.getenv('PREFILTER_PIXEL_DELTA', '24'))
+        self.animal_threshold = animal_threshold or float(os.getenv('PREFILTER_ANIMAL_THRESHOLD', '0.5'))
+        self.max_skips = max_skips or int(os.getenv('PREFILTER_MAX_CONSECUTIVE_SKIPS', '12'))
+        self.max_references = max_references
+
+        self.classifier: Optional[AnimalClassifier] = None
+        model_path = os.getenv('PREFILTER_ONNX_MODEL')
+        if model_path:
+            if onnxruntime is None:
+                logger.warning("PREFILTER_ONNX_MODEL is set but onnxruntime is not installed; using scene change only")
+            else:
+                try:
+                    self.classifier = AnimalClassifier(model_path)
+                except Exception as e:
+                    logger.error(f"Failed to load pre-filter model {model_path}: {e}")
+
+        # (camera, config id) -> reference thumbnail, its decision fields and skips since
+        self._references: 'OrderedDict[Tuple[str, str], Dict[str, Any]]' = OrderedDict()
+        self._cameras: Dict[str, Dict[str, int]] = {}
+
+    def _key(self, config: Dict[str, Any], image_data: ImageData) -> Tuple[str, str]:
+        return image_data.camera_name, str(config.get('id'))
+
+    def _camera(self, camera_name: str) -> Dict[str, int]:
+        if camera_name not in self._cameras:
+            self._cameras[camera_name] = {
+                'screened': 0, 'skipped': 0, 'downgraded': 0, 'forced': 0, 'possible_misses': 0
+            }
+        return self._cameras[camera_name]
+
+    def _thumbnail(self, image_data: ImageData) -> Image.Image:
+        return image_data.decoded(THUMB_SIZE[0] * 4).convert('L').resize(THUMB_SIZE, Image.BILINEAR)
+
+    def _score(self, image_data: ImageData, reference: Optional[Image.Image]) -> Tuple[Image.Image, float, Optional[float]]:
+        thumb = self._thumbnail(image_data)
+        changed = 1.0
+        if reference is not None and reference.size == thumb.size:
+            # Cancel the overall brightness shift so clouds and auto-exposure don't count as change
+            offset = round(ImageStat.Stat(thumb).mean[0] - ImageStat.Stat(reference).mean[0])
+            histogram = ImageChops.difference(thumb, reference.point(lambda v: v + offset)).histogram()
+            changed = sum(histogram[self.pixel_delta:]) / (THUMB_SIZE[0] * THUMB_SIZE[1])
+        animal = self.classifier.score(image_data.decoded(CLASSIFIER_SIZE * 2)) if self.classifier else None
+        return thumb, changed, animal
+
+    async def screen(self, config: Dict[str, Any], image_data: ImageData) -> Tuple[str, Optional[PrefilterScore]]:
+        """Decide whether to proceed, skip or downgrade this frame under the config's policy"""
+        policy = config.get('prefilter_policy') or POLICY_OFF
+        if policy == POLICY_OFF:
+            return DECISION_PROCEED, None
+
+        key = self._key(config, image_data)
+        entry = self._references.get(key)
+        started = time.perf_counter()
+        try:
+            # Draft decode + thumbnail in the CPU pool; a few milliseconds per frame
+            thumb, changed, animal = await cpu_pool.run_in_thread(
+                self._score, image_data, entry['thumb'] if entry else None
+            )
+        except Exception as e:
+            logger.error(f"Pre-filter failed for {image_data.image_id}, analyzing anyway: {e}")
+            return DECISION_PROCEED, None
+        score = PrefilterScore(
+            changed_fraction=round(changed, 4),
+            animal_score=round(animal, 4) if animal is not None else None,
+            first_frame=entry is None,
+            elapsed_ms=round((time.perf_counter() - started) * 1000, 2),
+            thumb=thumb
+        )
+
+        stats = self._camera(image_data.camera_name)
+        stats['screened'] += 1
+        score.quiet = (
+            entry is not None
+            and changed < self.change_threshold
+            and (animal is None or animal < self.animal_threshold)
+        )
+        if not score.quiet:
+            return DECISION_PROCEED, score
+        if entry['skips'] >= self.max_skips:
+            # Bound staleness: analyze anyway and check whether the skips hid a change
+            stats['forced'] += 1
+            return DECISION_PROCEED, score
+
+        entry['skips'] += 1
+        if policy == POLICY_DOWNGRADE:
+            stats['downgraded'] += 1
+            return DECISION_DOWNGRADE, score
+        stats['skipped'] += 1
+        return DECISION_SKIP, score
+
+    def downgraded(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Config for a quiet frame: the downgrade model alone, no second opinion or escalation"""
+        downgraded = {
+            key: value for key, value in config.items()
+            if key not in ('secondary_provider', 'secondary_model', 'tiebreaker_provider', 'tiebreaker_model')
+        }
+        downgraded['detail_escalation'] = False
+        if config.get('prefilter_downgrade_provider') and config.get('prefilter_downgrade_model'):
+            downgraded['primary_provider'] = config['prefilter_downgrade_provider']
+            downgraded['primary_model'] = config['prefilter_downgrade_model']
+        return downgraded
+
+    def record_analysis(
+        self,
+        config: Dict[str, Any],
+        image_data: ImageData,
+        score: Optional[PrefilterScore],
+        final_result: Dict[str, Any],
+        downgraded: bool = False
+    ) -> bool:
+        """Make an analyzed frame the new reference; returns True if earlier skips may have missed a change"""
+        if score is None or score.thumb is None:
+            return False
+        key = self._key(config, image_data)
+        fields = [k for k in decision_keys(config.get('analysis_type')) if k != 'confidence']
+        decision = {k: final_result.get(k) for k in fields}
+
+        entry = self._references.get(key)
+        # A changed answer on a frame that still looked quiet means the skipped
+        # frames probably hid the change; on a changed frame it likely just happened
+        possible_miss = bool(entry and entry['skips'] and score.quiet and decision != entry['decision'])
+        if possible_miss:
+            self._camera(image_data.camera_name)['possible_misses'] += 1
+            logger.warning(
+                f"Pre-filter possible miss on {image_data.camera_name} ({config.get('analysis_type')}): "
+                f"{entry['decision']} -> {decision} after {entry['skips']} quiet frames"
+            )
+        if downgraded and entry is not None:
+            # A downgraded answer is cheap evidence; keep comparing against the full analysis
+            entry['decision'] = decision
+            return possible_miss
+
+        self._references[key] = {'thumb': score.thumb, 'decision': decision, 'skips': 0}
+        self._references.move_to_end(key)
+        while len(self._references) > self.max_references:
+            self._references.popitem(last=False)
+        return possible_miss
+
+    def stats(self) -> Dict[str, Any]:
+        cameras = {}
+        for camera_name, stats in self._cameras.items():
+            screened = stats['screened']
+            cameras[camera_name] = {
+                **stats,
+                'skip_rate': round(stats['skipped'] / screened, 4) if screened else 0.0,
+                'downgrade_rate': round(stats['downgraded'] / screened, 4) if screened else 0.0
+            }
+        return {
+            'change_threshold': self.change_threshold,
+            'pixel_delta': self.pixel_delta,
+            'max_consecutive_skips': self.max_skips,
+            'classifier': self.classifier is not None,
+            'cameras': cameras
+        }
@@ -0,0 +1,211 @@
+import logging
+import os
+import time
+from dataclasses import dataclass, field
+from typing import Dict, Any, List, Optional, Tuple
+import numpy as np
+from ..providers.base import ImageData
+from ..providers.cpu_pool import cpu_pool
+
+
+logger = logging.getLogger(__name__)
+
+
+# Frame problems the gate recognises; configs map each to an action in quality_rules
+ISSUE_DARK = 'dark'                  # night frame without IR, or a covered lens
+ISSUE_OVEREXPOSED = 'overexposed'    # sun in the lens, flash on a close object
+ISSUE_BLURRY = 'blurry'              # fog, rain on the lens, motion
+ISSUE_LOW_CONTRAST = 'low_contrast'  # fog or haze washing out the scene
+ISSUE_IR = 'ir'                      # grayscale infrared night frame; usable, but not by every model
+
+ACTION_PROCEED = 'proceed'
+ACTION_SKIP = 'skip'    # never worth analyzing
+ACTION_DEFER = 'defer'  # let the camera's next good frame answer for this one
+ACTION_ROUTE = 'route'  # analyze with quality_route_provider/model instead
+
+# Most severe first: the first issue with a non-proceed rule decides the action
+ISSUE_ORDER = (ISSUE_DARK, ISSUE_OVEREXPOSED, ISSUE_BLURRY, ISSUE_LOW_CONTRAST, ISSUE_IR)
+
+# Scored on a draft decode; enough pixels for stable statistics at a few ms per frame
+SCORE_MAX_SIDE = 512
+
+
+@dataclass
+class QualityScore:
+    brightness: float    # Mean luma, 0-255
+    dark_fraction: float  # Share of pixels with luma under 20
+    clipped_fraction: float  # Share of pixels with luma of 250 or more
+    contrast: float      # Luma standard deviation
+    sharpness: float     # Variance of the Laplacian of the luma
+    saturation: float    # Mean HSV saturation, 0-1; near 0 for IR frames
+    issues: List[str] = field(default_factory=list)
+    elapsed_ms: float = 0.0
+
+    def as_dict(self) -> Dict[str, Any]:
+        return {
+            'brightness': round(self.brightness, 1),
+            'dark_fraction': round(self.dark_fraction, 4),
+            'clipped_fraction': round(self.clipped_fraction, 4),
+            'contrast': round(self.contrast, 1),
+            'sharpness': round(self.sharpness, 1),
+            'saturation': round(self.saturation, 4),
+            'issues': self.issues,
+            'elapsed_ms': self.elapsed_ms
+        }
+
+
+def score_pixels(rgb: np.ndarray) -> Tuple[float, float, float, float, float, float]:
+    """Brightness, dark and clipped fractions, contrast, sharpness and saturation of an RGB array"""
+    rgb = rgb.astype(np.float32)
+    luma = rgb @ np.array([0.299, 0.587, 0.114], dtype=np.float32)
+
+    histogram = np.bincount(np.clip(luma, 0, 255).astype(np.uint8).ravel(), minlength=256)
+    pixels = luma.size
+    dark_fraction = histogram[:20].sum() / pixels
+    clipped_fraction = histogram[250:].sum() / pixels
+
+    # 4-neighbour Laplacian by array slicing, no convolution library needed
+    laplacian = (
+        luma[:-2, 1:-1] + luma[2:, 1:-1] + luma[1:-1, :-2] + luma[1:-1, 2:] - 4.0 * luma[1:-1, 1:-1]
+    )
+
+    high = rgb.max(axis=2)
+    low = rgb.min(axis=2)
+    saturation = np.divide(high - low, high, out=np.zeros_like(high), where=high > 0)
+
+    return (
+        float(luma.mean()),
+        float(dark_fraction),
+        float(clipped_fraction),
+        float(luma.std()),
+        float(laplacian.var()),
+        float(saturation.mean())
+    )
+
+
+class FrameQualityGate:
+    """Scores frame quality on the CPU and applies the config's quality_rules.
+
+    Configs opt in with quality_rules, a map from issue to action, e.g.
+    {"dark": "skip", "blurry": "defer", "ir": "route"}. Deferred frames are
+    finished without analysis and listed on the camera's next good result;
+    after ``max_deferrals`` in a row a frame is analyzed anyway so a camera
+    stuck in fog still reports.
+    """
+
+    def __init__(self):
+        self.min_brightness = float(os.getenv('QUALITY_MIN_BRIGHTNESS', '25'))
+        self.max_brightness = float(os.getenv('QUALITY_MAX_BRIGHTNESS', '235'))
+        self.min_sharpness = float(os.getenv('QUALITY_MIN_SHARPNESS', '20'))
+        self.min_contrast = float(os.getenv('QUALITY_MIN_CONTRAST', '12'))
+        self.ir_saturation = float(os.getenv('QUALITY_IR_SATURATION', '0.04'))
+        self.max_deferrals = int(os.getenv('QUALITY_MAX_DEFERRALS', '6'))
+
+        # (camera, config id) -> image ids deferred since the last analyzed frame
+        self._deferred: Dict[Tuple[str, str], List[str]] = {}
+        self._cameras: Dict[str, Dict[str, Any]] = {}
+
+    def _camera(self, camera_name: str) -> Dict[str, Any]:
+        if camera_name not in self._cameras:
+            self._cameras[camera_name] = {
+                'screened': 0, 'skipped': 0, 'deferred': 0, 'routed': 0, 'forced': 0,
+                'issues': {issue: 0 for issue in ISSUE_ORDER}
+            }
+        return self._cameras[camera_name]
+
+    def _issues(self, score: QualityScore) -> List[str]:
+        issues = []
+        if score.brightness < self.min_brightness or score.dark_fraction > 0.9:
+            issues.append(ISSUE_DARK)
+        if score.brightness > self.max_brightness or score.clipped_fraction > 0.5:
+            issues.append(ISSUE_OVEREXPOSED)
+        if score.sharpness < self.min_sharpness:
+            issues.append(ISSUE_BLURRY)
+        if score.contrast < self.min_contrast:
+            issues.append(ISSUE_LOW_CONTRAST)
+        if score.saturation < self.ir_saturation and ISSUE_DARK not in issues:
+            issues.append(ISSUE_IR)
+        return issues
+
+    def _score(self, image_data: ImageData) -> QualityScore:
+        rgb = np.asarray(image_data.decoded(SCORE_MAX_SIDE))
+        score = QualityScore(*score_pixels(rgb))
+        score.issues = self._issues(score)
+        return score
+
+    async def check(self, config: Dict[str, Any], image_data: ImageData) -> Tuple[str, Optional[str], Optional[QualityScore]]:
+        """Action for this frame under the config's quality_rules, the issue behind it and the score"""
+        rules = config.get('quality_rules')
+        if not rules:
+            return ACTION_PROCEED, None, None
+
+        started = time.perf_counter()
+        try:
+            score = await cpu_pool.run_in_thread(self._score, image_data)
+        except Exception as e:
+            logger.error(f"Quality scoring failed for {image_data.image_id}, analyzing anyway: {e}")
+            return ACTION_PROCEED, None, None
+        score.elapsed_ms = round((time.perf_counter() - started) * 1000, 2)
+
+        stats = self._camera(image_data.camera_name)
+        stats['screened'] += 1
+        for issue in score.issues:
+            stats['issues'][issue] += 1
+
+        action, issue = ACTION_PROCEED, None
+        for candidate in ISSUE_ORDER:
+            if candidate in score.issues and rules.get(candidate, ACTION_PROCEED) != ACTION_PROCEED:
+                action, issue = rules[candidate], candidate
+                break
+
+        if action == ACTION_ROUTE and not (config.get('quality_route_provider') and config.get('quality_route_model')):
+            logger.warning(f"Config {config.get('id')} routes {issue} frames but has no quality_route_model")
+            action = ACTION_PROCEED
+        if action == ACTION_DEFER:
+            deferred = self._deferred.setdefault((image_data.camera_name, str(config.get('id'))), [])
+            if len(deferred) >= self.max_deferrals:
+                stats['forced'] += 1
+                return ACTION_PROCEED, issue, score
+            deferred.append(image_data.image_id)
+
+        if action == ACTION_SKIP:
+            stats['skipped'] += 1
+        elif action == ACTION_DEFER:
+            stats['deferred'] += 1
+        elif action == ACTION_ROUTE:
+            stats['routed'] += 1
+        return action, issue, score
+
+    def routed(self, config: Dict[str, Any]) -> Dict[str, Any]:
+        """Config with the primary model swapped for the one configured for poor frames"""
+        return {
+            **config,
+            'primary_provider': config['quality_route_provider'],
+            'primary_model': config['quality_route_model'],
+            'detail_escalation': False
+        }
+
+    def take_deferred(self, config: Dict[str, Any], image_data: ImageData) -> List[str]:
+        """Image ids deferred to this analyzed frame; clears them"""
+        return self._deferred.pop((image_data.camera_name, str(config.get('id'))), [])
+
+    def stats(self) -> Dict[str, Any]:
+        cameras = {}
+        for camera_name, stats in self._cameras.items():
+            screened = stats['screened']
+            avoided = stats['skipped'] + stats['deferred']
+            cameras[camera_name] = {
+                **stats,
+                'avoided_rate': round(avoided / screened, 4) if screened else 0.0
+            }
+        return {
+            'thresholds': {
+                'min_brightness': self.min_brightness,
+                'max_brightness': self.max_brightness,
+                'min_sharpness': self.min_sharpness,
+                'min_contrast': self.min_contrast,
+                'ir_saturation': self.ir_saturation
+            },
+            'max_deferrals': self.max_deferrals,
+            'cameras': cameras
+        }
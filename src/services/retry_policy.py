@@ -0,0 +1,25 @@
+import os
+import random
+from typing import Optional
+
+
+class RetryPolicy:
+    """Jittered exponential backoff for rescheduling failed analysis tasks.
+
+    The delay ceiling doubles with each retry (``base_delay * 2 ** retry_count``,
+    capped at ``max_delay``) and the actual delay is drawn from the upper half
+    of that range so retries from one outage spread out. A provider
+    ``Retry-After`` hint is always honoured as a lower bound.
+    """
+
+    def __init__(self, base_delay: Optional[float] = None, max_delay: Optional[float] = None):
+        self.base_delay = base_delay or float(os.getenv('RETRY_DELAY', '5'))
+        self.max_delay = max_delay or float(os.getenv('RETRY_MAX_DELAY', '3600'))
+
+    def next_delay(self, retry_count: int, retry_after: Optional[float] = None) -> float:
+        """Seconds to wait before the next attempt, given retries already made"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** retry_count))
+        delay = random.uniform(ceiling / 2, ceiling)
+        if retry_after is not None:
+            delay = max(delay, retry_after)
+        return delay
@@ -0,0 +1,194 @@
+import logging
+import math
+import os
+from datetime import datetime, timezone
+from typing import Dict, Any, List, Optional, Tuple
+from ..providers.schemas import decision_keys
+from ..db.supabase_client import SupabaseClient
+
+
+logger = logging.getLogger(__name__)
+
+
+# Decision fields that wobble between readings without the scene changing
+NOISY_FIELDS = {'confidence', 'percentage_estimate', 'animals'}
+
+# Level boundary where water and feed alerts start (ADEQUATE 40-80%, LOW 10-40%)
+ALERT_PERCENT = 40
+
+HISTORY_LIMIT = 200
+
+
+def parse_captured_at(value: Optional[str]) -> Optional[datetime]:
+    if not value:
+        return None
+    try:
+        parsed = datetime.fromisoformat(value.replace('Z', '+00:00'))
+    except ValueError:
+        return None
+    return parsed if parsed.tzinfo else parsed.replace(tzinfo=timezone.utc)
+
+
+def result_state(analysis_type: Optional[str], result: Dict[str, Any], alert_triggered: bool = False) -> Tuple:
+    """The parts of a result that count as the scene changing"""
+    fields = [key for key in decision_keys(analysis_type) if key not in NOISY_FIELDS]
+    return tuple(result.get(key) for key in fields) + (bool(alert_triggered),)
+
+
+class AdaptiveSampler:
+    """Learns how often each camera's results change and samples frames to match.
+
+    Configs opt in with adaptive_sampling. Per camera and config, result
+    changes are counted with exponential decay (half-life
+    SAMPLING_HALFLIFE_HOURS) against the hours observed, giving a change rate
+    seeded from image_analysis_results history. The sampling interval is the
+    time in which a change would be missed with probability
+    SAMPLING_MISS_PROBABILITY, shortened near alert thresholds, and never
+    longer than SAMPLING_MAX_STALENESS_MINUTES. Frames captured before the
+    next sample is due are skipped without downloading them.
+    """
+
+    def __init__(self, supabase_client: SupabaseClient):
+        self.supabase = supabase_client
+        self.halflife_hours = float(os.getenv('SAMPLING_HALFLIFE_HOURS', '72'))
+        self.miss_probability = float(os.getenv('SAMPLING_MISS_PROBABILITY', '0.1'))
+        self.min_interval = float(os.getenv('SAMPLING_MIN_INTERVAL_MINUTES', '10'))
+        self.max_staleness = float(os.getenv('SAMPLING_MAX_STALENESS_MINUTES', '360'))
+        self.near_threshold_factor = float(os.getenv('SAMPLING_NEAR_THRESHOLD_FACTOR', '4'))
+        self.threshold_margin = float(os.getenv('SAMPLING_THRESHOLD_MARGIN', '0.1'))
+
+        # (camera, config id) -> learned state
+        self._states: Dict[Tuple[str, str], Dict[str, Any]] = {}
+
+    def _new_state(self) -> Dict[str, Any]:
+        return {
+            'changes': 0.0,         # Decayed count of result changes
+            'hours': 0.0,           # Decayed hours of observation
+            'last_state': None,
+            'last_result_at': None,
+            'last_sampled_at': None,
+            'near_threshold': False,
+            'sampled': 0,
+            'skipped': 0
+        }
+
+    def _observe(self, state: Dict[str, Any], at: datetime, current: Tuple, near_threshold: bool) -> None:
+        previous_at = state['last_result_at']
+        if previous_at is not None and at > previous_at:
+            hours = (at - previous_at).total_seconds() / 3600
+            decay = math.exp(-math.log(2) * hours / self.halflife_hours)
+            changed = state['last_state'] is not None and current != state['last_state']
+            state['changes'] = state['changes'] * decay + (1.0 if changed else 0.0)
+            state['hours'] = state['hours'] * decay + hours
+        if previous_at is None or at >= previous_at:
+            state['last_state'] = current
+            state['last_result_at'] = at
+            state['near_threshold'] = near_threshold
+
+    def _near_threshold(self, config: Dict[str, Any], result: Dict[str, Any], alert_triggered: bool) -> bool:
+        """Uncertain, alerting or close to an alert level; worth watching closely"""
+        if alert_triggered:
+            return True
+        confidence = result.get('confidence')
+        if isinstance(confidence, (int, float)) and abs(confidence - config.get('threshold', 0.8)) < self.threshold_margin:
+            return True
+        percent = result.get('percentage_estimate')
+        return isinstance(percent, (int, float)) and abs(percent - ALERT_PERCENT) < self.threshold_margin * 100
+
+    async def _state(self, config: Dict[str, Any], camera_name: str) -> Dict[str, Any]:
+        key = (camera_name, str(config.get('id')))
+        if key not in self._states:
+            state = self._new_state()
+            history = await self.supabase.get_result_history(config['id'], camera_name, HISTORY_LIMIT)
+            for row in history:
+                at = parse_captured_at(row.get('captured_at') or row.get('created_at'))
+                if at is None or not isinstance(row.get('result'), dict):
+                    continue
+                alert = bool(row.get('alert_triggered'))
+                self._observe(
+                    state, at, result_state(config.get('analysis_type'), row['result'], alert),
+                    self._near_threshold(config, row['result'], alert)
+                )
+            state['last_sampled_at'] = state['last_result_at']
+            self._states[key] = state
+        return self._states[key]
+
+    def interval_minutes(self, state: Dict[str, Any], max_interval: Optional[float] = None) -> float:
+        """Minutes between samples for the learned change rate, capped at max_interval"""
+        if state['hours'] <= 0:
+            interval = self.min_interval
+        else:
+            # Changes per hour; with none seen, assume one just outside the observed window
+            rate = max(state['changes'], 0.5) / state['hours']
+            # Poisson: P(change within t) = 1 - exp(-rate * t)
+            interval = -math.log(1 - self.miss_probability) / rate * 60
+        if state['near_threshold']:
+            interval /= self.near_threshold_factor
+        if max_interval is not None:
+            interval = min(interval, max_interval)
+        return max(self.min_interval, min(self.max_staleness, interval))
+
+    async def should_sample(
+        self,
+        config: Dict[str, Any],
+        camera_name: str,
+        captured_at: Optional[str],
+        max_interval: Optional[float] = None
+    ) -> Tuple[bool, float]:
+        """Whether this frame is due for analysis, and the current interval in minutes.
+
+        max_interval (e.g. from a level forecast) caps the learned interval;
+        configs without adaptive_sampling analyze every frame regardless.
+        """
+        if not config.get('adaptive_sampling'):
+            return True, 0.0
+        at = parse_captured_at(captured_at)
+        try:
+            state = await self._state(config, camera_name)
+        except Exception as e:
+            logger.error(f"Sampling history unavailable for {camera_name}: {e}")
+            return True, 0.0
+        interval = self.interval_minutes(state, max_interval)
+        last = state['last_sampled_at']
+        # A frame at the reserved slot is a retry of the sampled frame and still due
+        if at is None or last is None or at == last or (at - last).total_seconds() >= interval * 60:
+            # Reserve the slot so concurrent frames from the same camera don't all run
+            if at is not None:
+                state['last_sampled_at'] = at
+            state['sampled'] += 1
+            return True, interval
+        state['skipped'] += 1
+        return False, interval
+
+    def record(self, config: Dict[str, Any], camera_name: str, captured_at: Optional[str], result: Dict[str, Any], alert_triggered: bool) -> None:
+        key = (camera_name, str(config.get('id')))
+        at = parse_captured_at(captured_at)
+        if key not in self._states or at is None:
+            return
+        self._observe(
+            self._states[key], at, result_state(config.get('analysis_type'), result, alert_triggered),
+            self._near_threshold(config, result, alert_triggered)
+        )
+
+    def stats(self) -> Dict[str, Any]:
+        cameras: Dict[str, List[Dict[str, Any]]] = {}
+        for (camera_name, config_id), state in self._states.items():
+            rate = state['changes'] / state['hours'] if state['hours'] > 0 else None
+            total = state['sampled'] + state['skipped']
+            cameras.setdefault(camera_name, []).append({
+                'config_id': config_id,
+                'changes_per_day': round(rate * 24, 3) if rate is not None else None,
+                'interval_minutes': round(self.interval_minutes(state), 1),
+                'near_threshold': state['near_threshold'],
+                'last_result_at': state['last_result_at'].isoformat() if state['last_result_at'] else None,
+                'sampled': state['sampled'],
+                'skipped': state['skipped'],
+                'skip_rate': round(state['skipped'] / total, 4) if total else 0.0
+            })
+        return {
+            'halflife_hours': self.halflife_hours,
+            'miss_probability': self.miss_probability,
+            'min_interval_minutes': self.min_interval,
+            'max_staleness_minutes': self.max_staleness,
+            'cameras': cameras
+        }
@@ -7,6 +7,7 @@ from dotenv import load_dotenv
 
 from .db.supabase_client import SupabaseClient
 from .services.analysis_service import AnalysisService
+from .providers.cpu_pool import cpu_pool, loop_lag
 
 
 logging.basicConfig(level=logging.INFO)
@@ -23,33 +24,55 @@ class TaskProcessor:
             key=os.getenv('SUPABASE_KEY')
         )
         
-        # Initialize analysis service
-        self.analysis_service = AnalysisService(self.supabase)
-        
         # Collect API keys
         self.api_keys = {
             'OPENAI_API_KEY': os.getenv('OPENAI_API_KEY'),
             'ANTHROPIC_API_KEY': os.getenv('ANTHROPIC_API_KEY'),
-            'GEMINI_API_KEY': os.getenv('GEMINI_API_KEY')
+            'GEMINI_API_KEY': os.getenv('GEMINI_API_KEY'),
+            'LOCAL_API_KEY': os.getenv('LOCAL_API_KEY')
         }
         
+        # Initialize analysis service
+        self.analysis_service = AnalysisService(self.supabase, self.api_keys)
+        
         # Processing settings
         self.batch_size = int(os.getenv('BATCH_SIZE', '10'))
-        self.max_workers = int(os.getenv('MAX_WORKERS', '5'))
+        # Tasks in flight; by default as many as the configured models' concurrency
+        # ceilings allow, so the per-model limiters are what throttles provider calls
+        self.max_workers = int(os.getenv('MAX_WORKERS') or 0) or None
         self.dry_run = os.getenv('DRY_RUN', 'false').lower() == 'true'
         
+        # Lease maintenance: periodically hand back tasks abandoned by dead workers;
+        # the analysis service renews its own leases while it holds any
+        self.reaper_interval = float(os.getenv('LEASE_REAPER_INTERVAL_SECONDS', '60'))
+        self.tasks_reclaimed = 0
+        self.tasks_dead_lettered = 0
+        
+    async def _worker_limit(self) -> int:
+        """MAX_WORKERS, or the summed concurrency ceilings of the active configs' models"""
+        if self.max_workers:
+            return self.max_workers
+        models = []
+        for config in await self.supabase.get_active_configs():
+            for role in ('primary', 'secondary', 'tiebreaker', 'hedge'):
+                if config.get(f'{role}_provider') and config.get(f'{role}_model'):
+                    models.append((config[f'{role}_provider'], config[f'{role}_model']))
+        return max(1, self.analysis_service.limiters.ceiling(models))
+    
     async def process_batch(self) -> int:
-        # Get pending tasks
-        tasks = await self.supabase.get_pending_tasks(self.batch_size)
+        workers = await self._worker_limit()
+        
+        # Get pending tasks; fetch enough to keep every worker busy
+        tasks = await self.supabase.get_pending_tasks(max(self.batch_size, workers))
         
         if not tasks:
             logger.info("No pending tasks found")
             return 0
         
-        logger.info(f"Processing {len(tasks)} tasks")
+        logger.info(f"Processing {len(tasks)} tasks with up to {workers} in flight")
         
         # Process tasks concurrently with limited workers
-        semaphore = asyncio.Semaphore(self.max_workers)
+        semaphore = asyncio.Semaphore(workers)
         
         async def process_with_limit(task):
             async with semaphore:
@@ -67,6 +90,9 @@ class TaskProcessor:
         # Count successful processes
         success_count = sum(1 for r in results if r is True)
         logger.info(f"Successfully processed {success_count}/{len(tasks)} tasks")
+        lag = loop_lag.stats()
+        if lag.get('samples'):
+            logger.info(f"Event loop lag p99 {lag['p99_ms']} ms, max {lag['max_ms']} ms")
         
         return success_count
     
@@ -76,13 +102,46 @@ class TaskProcessor:
         
         logger.info(f"Starting continuous processing with {interval_minutes} minute intervals")
         
+        await self.supabase.start_background_writers()
+        loop_lag.start()
+        reaper = asyncio.create_task(self._reaper_loop())
+        try:
+            await self._processing_loop(interval_minutes)
+        finally:
+            reaper.cancel()
+            # Flush buffered AI analysis logs and cost counters on shutdown
+            await self.supabase.stop_background_writers()
+            await loop_lag.stop()
+            cpu_pool.shutdown()
+    
+    async def reap_expired_leases(self) -> Dict[str, int]:
+        counts = await self.supabase.reap_expired_leases()
+        self.tasks_reclaimed += counts['requeued']
+        self.tasks_dead_lettered += counts['dead_lettered']
+        if counts['requeued'] or counts['dead_lettered']:
+            logger.warning(
+                f"Reclaimed {counts['requeued']} tasks with expired leases "
+                f"({counts['dead_lettered']} moved to dead letter); "
+                f"totals since start: {self.tasks_reclaimed} reclaimed, {self.tasks_dead_lettered} dead-lettered"
+            )
+        return counts
+    
+    async def _reaper_loop(self):
+        while True:
+            try:
+                await self.reap_expired_leases()
+            except Exception as e:
+                logger.error(f"Error in lease reaper: {e}")
+            await asyncio.sleep(self.reaper_interval)
+    
+    async def _processing_loop(self, interval_minutes: int):
         while True:
             try:
                 start_time = datetime.utcnow()
                 processed = await self.process_batch()
                 
                 # If we processed a full batch, immediately check for more
-                if processed == self.batch_size:
+                if processed >= self.batch_size:
                     logger.info("Full batch processed, checking for more tasks immediately")
                     continue
                 
@@ -106,10 +165,10 @@ class TaskProcessor:
         if task_count == 0:
             return False
         
-        # Get the tasks we just created
+        # Get the tasks we just created, not ones already finished or held by a worker
         tasks = await self.supabase.client.table('analysis_tasks').select('*').eq(
             'image_id', image_id
-        ).execute()
+        ).eq('status', 'pending').execute()
         
         # Process each task
         success_count = 0